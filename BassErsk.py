@@ -1,5 +1,7 @@
 from cmath import *
 from numpy import *
+import numpy as np
+from scipy.special import wofz
 from .errffor import errf
 
 
@@ -81,6 +83,140 @@ def ImageTerms(x, y, a, b, x0, y0, nimag):
 
     return Ex, Ey
 
+def BassErsk_vect(xin, yin, sigmax, sigmay):
+    """Array version of BassErsk, using scipy.special.wofz for the
+    Faddeeva function. xin and yin can be arrays of any (broadcastable)
+    shape."""
+
+    xin = np.asarray(xin, dtype=float)
+    yin = np.asarray(yin, dtype=float)
+    x = np.abs(xin)
+    y = np.abs(yin)
+
+    eps0 = 8.854187817620e-12
+
+    if sigmax > sigmay:
+
+        S = np.sqrt(2 * (sigmax * sigmax - sigmay * sigmay))
+        factBE = 1 / (2 * eps0 * np.sqrt(np.pi) * S)
+        etaBE = sigmay / sigmax * x + 1j * sigmax / sigmay * y
+        zetaBE = x + 1j * y
+
+        val = factBE * (wofz(zetaBE / S) - np.exp( -x * x / (2 * sigmax * sigmax) - y * y / (2 * sigmay * sigmay)) * wofz(etaBE / S) )
+
+        Ex = np.abs(val.imag) * np.sign(xin)
+        Ey = np.abs(val.real) * np.sign(yin)
+
+    else:
+
+        S = np.sqrt(2 * (sigmay * sigmay - sigmax * sigmax))
+        factBE = 1 / (2 * eps0 * np.sqrt(np.pi) * S)
+        etaBE = sigmax / sigmay * y + 1j * sigmay / sigmax * x
+        yetaBE = y + 1j * x
+
+        val = factBE * (wofz(yetaBE / S) - np.exp( -y * y / (2 * sigmay * sigmay) - x * x / (2 * sigmax * sigmax)) * wofz(etaBE / S) )
+
+        Ey = np.abs(val.imag) * np.sign(yin)
+        Ex = np.abs(val.real) * np.sign(xin)
+
+    return Ex, Ey
+
+
+def ImageTerms_vect(x, y, a, b, x0, y0, nimag):
+    """Array version of ImageTerms. x and y can be arrays, the source
+    position (x0, y0) is a scalar. The sum over the image terms is
+    accumulated on whole arrays."""
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    eps0 = 8.854187817620e-12
+
+    if abs((a - b) / a) > 1e-3:
+        g = np.sqrt(a * a - b * b)
+
+        q = np.arccosh((x + 1j * y) / g)
+
+        q0 = acosh((x0 + 1j * y0) / g)
+        mu0 = q0.real
+        phi0 = q0.imag
+
+        mu1 = 0.5 * np.log((a + b) / (a - b))
+
+        # coefficients of the series do not depend on the observation point
+        nn = np.arange(1, nimag + 1)
+        coeff = np.exp(-nn * mu1) * ( (np.cosh(nn * mu0) * np.cos(nn * phi0)) / (np.cosh(nn * mu1)) + 1j * (np.sinh(nn * mu0) * np.sin(nn * phi0)) / (np.sinh(nn * mu1))   )
+
+        q = np.conj(q)
+        sinh_q = np.sinh(q)
+        Ecpx = np.zeros(q.shape, dtype=complex)
+        for ii in range(nimag):
+            Ecpx += coeff[ii] * np.sinh(nn[ii] * q)
+        Ecpx = Ecpx / sinh_q
+
+        Ecpx = Ecpx / (4 * np.pi * eps0) * 4 / g
+        Ex = Ecpx.real
+        Ey = Ecpx.imag
+    else:
+        if (x0 == 0) and (y0 == 0):
+            Ex = np.zeros(np.broadcast(x, y).shape)
+            Ey = np.zeros(np.broadcast(x, y).shape)
+        else:
+            raise ValueError('Image terms for a circular chamber with off-centre beam have not been implemented yet')
+
+    return Ex, Ey
+
+
+def _field_map_rows(args):
+    xx, yy, sigmax, sigmay, a, b, nimag = args
+    x, y = np.meshgrid(xx, yy, indexing='ij')
+    Ex_imag, Ey_imag = ImageTerms_vect(x, y, a, b, 0., 0., nimag)
+    Ex_BE, Ey_BE = BassErsk_vect(x, y, sigmax, sigmay)
+    return Ex_BE + Ex_imag, Ey_BE + Ey_imag
+
+
+def field_map_BE(xx, yy, sigmax, sigmay, a, b, nimag, N_processes=1, N_chunks=20, progress_callback=None):
+    """Field of a centred Gaussian beam in an elliptic chamber with
+    semi-axes a, b (Bassetti-Erskine plus nimag image terms) on the grid
+    xx x yy. The map is built by blocks of rows of xx; with N_processes > 1
+    the blocks are distributed over a process pool. progress_callback, if
+    given, is called with the completed fraction after each block.
+
+    Returns Ex, Ey with shape (len(xx), len(yy))."""
+
+    xx = np.asarray(xx, dtype=float)
+    yy = np.asarray(yy, dtype=float)
+
+    N_chunks = int(np.clip(N_chunks, 1, len(xx)))
+    chunks = [(xx_chunk, yy, sigmax, sigmay, a, b, nimag) for xx_chunk in np.array_split(xx, N_chunks)]
+
+    Ex = np.zeros((len(xx), len(yy)))
+    Ey = np.zeros((len(xx), len(yy)))
+
+    if N_processes > 1:
+        import multiprocessing as mp
+        pool = mp.Pool(processes=N_processes)
+        results = pool.imap(_field_map_rows, chunks)
+    else:
+        pool = None
+        results = map(_field_map_rows, chunks)
+
+    try:
+        i_start = 0
+        for i_chunk, (Ex_chunk, Ey_chunk) in enumerate(results):
+            i_end = i_start + Ex_chunk.shape[0]
+            Ex[i_start:i_end, :] = Ex_chunk
+            Ey[i_start:i_end, :] = Ey_chunk
+            i_start = i_end
+            if progress_callback is not None:
+                progress_callback(float(i_chunk + 1) / float(N_chunks))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return Ex, Ey
+
 #    eps0=8.854187817620e-12;
 #
 #
@@ -51,8 +51,9 @@
 #-End-preamble---------------------------------------------------------
 
 import numpy as np
-from numpy.random import rand
+from .rng_streams import rand
 from . import hist_for as histf
+from . import MP_system_cython as mpcy
 from scipy.constants import e, m_e
 
 
@@ -69,23 +70,28 @@ class MP_system:
                  Dx_hist_reg, Nx_reg, Ny_reg, Nvx_reg, Nvy_reg, Nvz_reg, regen_hist_cut, chamb,
                  N_mp_soft_regen=None, N_mp_after_soft_regen=None,
                  N_mp_async_regen=None, N_mp_after_async_regen=None,
-                 charge=-e, mass=m_e, flag_lifetime_hist = False, name=None):
+                 charge=-e, mass=m_e, flag_lifetime_hist = False, name=None,
+                 flag_shrink_buffer=False, buffer_growth_factor=2.):
 
-        N_mp_max = int(N_mp_max)
-        self.x_mp = np.zeros(N_mp_max, float)
-        self.y_mp = np.zeros(N_mp_max, float)
-        self.z_mp = np.zeros(N_mp_max, float)
-        self.vx_mp = np.zeros(N_mp_max, float)
-        self.vy_mp = np.zeros(N_mp_max, float)
-        self.vz_mp = np.zeros(N_mp_max, float)
+        # The MP coordinates are rows of a single (N_fields x capacity) buffer.
+        # N_mp_max is the initial (and minimum) capacity: the buffer grows
+        # when needed and can be shrunk after regenerations.
+        self.N_mp_max = int(N_mp_max)
+        self.flag_shrink_buffer = flag_shrink_buffer
+        self.buffer_growth_factor = buffer_growth_factor
 
         #Time of last impact with the chamber
         self.flag_lifetime_hist = flag_lifetime_hist
+
+        self.mp_fields = ['x_mp', 'y_mp', 'z_mp', 'vx_mp', 'vy_mp', 'vz_mp', 'nel_mp']
         if self.flag_lifetime_hist:
-            self.t_last_impact = -1*np.ones(N_mp_max, float)
+            self.mp_fields.append('t_last_impact')
+        self.i_nel_mp = self.mp_fields.index('nel_mp')
 
-        self.nel_mp = np.zeros(N_mp_max, float)
         self.N_mp = 0
+        self.capacity = 0
+        self.mp_buffer = None
+        self._reallocate_buffer(self.N_mp_max)
 
         self.nel_mp_ref = nel_mp_ref_0
         self.nel_mp_split = fact_split * self.nel_mp_ref
@@ -132,27 +138,79 @@ class MP_system:
             self.N_mp_async_regen = N_mp_async_regen
             self.N_mp_after_async_regen = N_mp_after_async_regen
 
+    def _reallocate_buffer(self, new_capacity):
+        new_buffer = np.zeros((len(self.mp_fields), new_capacity), float)
+        if self.flag_lifetime_hist:
+            new_buffer[self.mp_fields.index('t_last_impact'), :] = -1.
+
+        # Copy from the attributes, which are views of the old buffer
+        N_copy = min(self.N_mp, new_capacity)
+        if self.mp_buffer is not None:
+            for i_field, field in enumerate(self.mp_fields):
+                new_buffer[i_field, :N_copy] = getattr(self, field)[:N_copy]
+
+        self.mp_buffer = new_buffer
+        self.capacity = new_capacity
+        self._bind_buffer_views()
+
+    def _bind_buffer_views(self):
+        for i_field, field in enumerate(self.mp_fields):
+            setattr(self, field, self.mp_buffer[i_field])
+
+        # Work buffer for the compaction of the MP arrays
+        self.flag_keep_buffer = np.zeros(self.capacity, dtype=bool)
+
+    def ensure_capacity(self, N_mp_required):
+        if N_mp_required > self.capacity:
+            new_capacity = max(int(N_mp_required), int(self.buffer_growth_factor * self.capacity))
+            print('Cloud %s: resizing MP buffer from %d to %d'%(self.name, self.capacity, new_capacity))
+            self._reallocate_buffer(new_capacity)
+
+    def shrink_buffer(self):
+        new_capacity = max(self.N_mp_max, int(self.buffer_growth_factor * self.N_mp))
+        if new_capacity < self.capacity:
+            print('Cloud %s: shrinking MP buffer from %d to %d'%(self.name, self.capacity, new_capacity))
+            self._reallocate_buffer(new_capacity)
+
+    def __getstate__(self):
+        # Only the used part of the buffer is stored, the views are rebuilt
+        state = self.__dict__.copy()
+        for field in self.mp_fields:
+            del state[field]
+        state['mp_buffer'] = self.mp_buffer[:, :self.N_mp].copy()
+        state['flag_keep_buffer'] = None
+        return state
+
+    def __setstate__(self, state):
+        if 'mp_buffer' not in state:
+            # Object saved before the introduction of the buffer
+            self.__dict__.update(state)
+            self.N_mp_max = len(self.x_mp)
+            self.flag_shrink_buffer = False
+            self.buffer_growth_factor = 2.
+            self.mp_fields = ['x_mp', 'y_mp', 'z_mp', 'vx_mp', 'vy_mp', 'vz_mp', 'nel_mp']
+            if self.flag_lifetime_hist:
+                self.mp_fields.append('t_last_impact')
+            self.i_nel_mp = self.mp_fields.index('nel_mp')
+            self.mp_buffer = np.array([getattr(self, field) for field in self.mp_fields])
+            self.capacity = self.mp_buffer.shape[1]
+            self._bind_buffer_views()
+        else:
+            stored_buffer = state.pop('mp_buffer')
+            self.__dict__.update(state)
+            self.mp_buffer = None
+            capacity = self.capacity
+            self._reallocate_buffer(capacity)
+            self.mp_buffer[:, :self.N_mp] = stored_buffer
+
     def clean_small_MPs(self):
 
         print("Cloud %s: Start clean. N_mp=%d Nel=%e"%(self.name, self.N_mp, np.sum(self.nel_mp[0:self.N_mp])))
 
-        flag_clean = (self.nel_mp < self.nel_mp_cl_th)
-        flag_keep = ~(flag_clean)
-        flag_keep[self.N_mp:] = False
-        self.N_mp = np.sum(flag_keep)
-
-        self.x_mp[0:self.N_mp] = self.x_mp[flag_keep].copy()
-        self.y_mp[0:self.N_mp] = self.y_mp[flag_keep].copy()
-        self.z_mp[0:self.N_mp] = self.z_mp[flag_keep].copy()
-        self.vx_mp[0:self.N_mp] = self.vx_mp[flag_keep].copy()
-        self.vy_mp[0:self.N_mp] = self.vy_mp[flag_keep].copy()
-        self.vz_mp[0:self.N_mp] = self.vz_mp[flag_keep].copy()
-        self.nel_mp[0:self.N_mp] = self.nel_mp[flag_keep].copy()
-
-        self.nel_mp[self.N_mp:] = 0.0
-
-        if self.flag_lifetime_hist:
-            self.t_last_impact[0:self.N_mp] = np.array(self.t_last_impact[flag_keep].copy())
+        flag_keep = self.flag_keep_buffer[:self.N_mp]
+        np.less(self.nel_mp[:self.N_mp], self.nel_mp_cl_th, out=flag_keep)
+        np.logical_not(flag_keep, out=flag_keep)
+        self.compact_MPs(flag_keep)
 
         print("Cloud %s: Done clean. N_mp=%d Nel=%e"%(self.name, self.N_mp, np.sum(self.nel_mp[0:self.N_mp])))
 
@@ -160,6 +218,12 @@ class MP_system:
             self.set_nel_mp_ref(self.nel_mp_ref_0)
             print(('Cloud %s: nel_mp_ref set to nel_mp_ref_0'%self.name))
 
+    def compact_MPs(self, flag_keep):
+        # Removes in place the MPs for which flag_keep (of length N_mp) is False,
+        # preserving the order of the remaining ones
+        self.N_mp = mpcy.compact_MPs(flag_keep.view(np.uint8), self.N_mp,
+                                     self.mp_buffer, self.i_nel_mp)
+
     def set_nel_mp_ref(self, val):
         self.nel_mp_ref = val
         self.nel_mp_split = self.fact_split * val
@@ -182,22 +246,9 @@ class MP_system:
 
                 death_prob = float(self.N_mp - target_N_mp) / float(self.N_mp)
 
-                flag_keep = np.array(len(self.x_mp) * [False])
-                flag_keep[:self.N_mp] = (rand(self.N_mp) > death_prob)
-                self.N_mp = np.sum(flag_keep)
-
-                self.x_mp[0:self.N_mp] = np.array(self.x_mp[flag_keep].copy())
-                self.y_mp[0:self.N_mp] = np.array(self.y_mp[flag_keep].copy())
-                self.z_mp[0:self.N_mp] = np.array(self.z_mp[flag_keep].copy())
-                self.vx_mp[0:self.N_mp] = np.array(self.vx_mp[flag_keep].copy())
-                self.vy_mp[0:self.N_mp] = np.array(self.vy_mp[flag_keep].copy())
-                self.vz_mp[0:self.N_mp] = np.array(self.vz_mp[flag_keep].copy())
-                self.nel_mp[0:self.N_mp] = np.array(self.nel_mp[flag_keep].copy())
-
-                self.nel_mp[self.N_mp:] = 0.0
-
-                if self.flag_lifetime_hist:
-                    self.t_last_impact[0:self.N_mp] = np.array(self.t_last_impact[flag_keep].copy())
+                flag_keep = self.flag_keep_buffer[:self.N_mp]
+                np.greater(rand(self.N_mp), death_prob, out=flag_keep)
+                self.compact_MPs(flag_keep)
 
                 chrg_before = chrg
                 chrg_after = np.sum(self.nel_mp)
@@ -208,6 +259,9 @@ class MP_system:
 
                 self.nel_mp[0:self.N_mp] = self.nel_mp[0:self.N_mp] * correct_fact
 
+                if self.flag_shrink_buffer:
+                    self.shrink_buffer()
+
                 chrg = np.sum(self.nel_mp)
                 erg = np.sum(0.5 / np.abs(self.charge / self.mass) * self.nel_mp[0:self.N_mp] * (self.vx_mp[0:self.N_mp] * self.vx_mp[0:self.N_mp] + self.vy_mp[0:self.N_mp] * self.vy_mp[0:self.N_mp] + self.vz_mp[0:self.N_mp] * self.vz_mp[0:self.N_mp]))
                 print('Cloud %s: Done SOFT regeneration. N_mp=%d Nel_tot=%1.2e En_tot=%1.2e'%(self.name, self.N_mp, chrg, erg))
@@ -255,26 +309,15 @@ class MP_system:
 
             print('Cloud %s: x_max = %e'%(self.name, x_max))
 
-            flag_clean = (abs(self.x_mp) > x_max)
-            flag_keep = ~(flag_clean)
-            flag_keep[self.N_mp:] = False
-            self.N_mp = np.sum(flag_keep)
-
-            self.x_mp[0:self.N_mp] = np.array(self.x_mp[flag_keep].copy())
-            self.y_mp[0:self.N_mp] = np.array(self.y_mp[flag_keep].copy())
-            self.z_mp[0:self.N_mp] = np.array(self.z_mp[flag_keep].copy())
-            self.vx_mp[0:self.N_mp] = np.array(self.vx_mp[flag_keep].copy())
-            self.vy_mp[0:self.N_mp] = np.array(self.vy_mp[flag_keep].copy())
-            self.vz_mp[0:self.N_mp] = np.array(self.vz_mp[flag_keep].copy())
-            self.nel_mp[0:self.N_mp] = np.array(self.nel_mp[flag_keep].copy())
-
-            self.nel_mp[self.N_mp:] = 0.0
+            flag_keep = self.flag_keep_buffer[:self.N_mp]
+            np.less_equal(np.abs(self.x_mp[:self.N_mp]), x_max, out=flag_keep)
+            self.compact_MPs(flag_keep)
 
             #Assign particle to grid
             #
-            vx_max = max(abs(self.vx_mp))
-            vy_max = max(abs(self.vy_mp))
-            vz_max = max(abs(self.vz_mp))
+            vx_max = np.max(np.abs(self.vx_mp))
+            vy_max = np.max(np.abs(self.vy_mp))
+            vz_max = np.max(np.abs(self.vz_mp))
             if vx_max == 0:
                 vx_max = 1e-5
             if vy_max == 0:
@@ -321,18 +364,10 @@ class MP_system:
                 + (ivy_mp - 1) * self.Nvz_reg\
                 + ivz_mp - 1
             indexes = np.int_(indexes)
-            indices_nonzero_cells = np.array(list(set(indexes)))
-            indices_nonzero_cells = np.sort(indices_nonzero_cells)
 
-            vect_dens = dict(list(zip(indices_nonzero_cells, np.zeros(len(indices_nonzero_cells)))))
-            #lil_matrix((Nx_reg*Ny_reg*Nvx_reg*Nvy_reg*Nvz_reg,1));#allocate a sparse matrix
-            #
-
-            for i_mp in range(0, self.N_mp):
-                index_curr = indexes[i_mp]
-                vect_dens[index_curr] = vect_dens[index_curr] + self.nel_mp[i_mp]
-
-            nonzero_cells = np.array(list(map(vect_dens.get, indices_nonzero_cells)))
+            # Charge in each non-empty cell (indices_nonzero_cells is sorted)
+            indices_nonzero_cells, i_cell_mp = np.unique(indexes, return_inverse=True)
+            nonzero_cells = np.bincount(i_cell_mp, weights=self.nel_mp[0:self.N_mp])
 
             #%% retrieve indices of nonempty cells
             #% NB use C-like indices
@@ -382,58 +417,45 @@ class MP_system:
             intnum_MP_in_cell = intnum_MP_in_cell + np.int_(flag_rest)
             #% intnum_MP_in_cell_chk=intnum_MP_in_cell;
             N_mp_expect = np.sum(intnum_MP_in_cell)
-            #
-            #
-            #
-            self.x_mp = 0 * self.x_mp; self.y_mp = 0 * self.y_mp; self.z_mp = 0 * self.z_mp
-            self.vx_mp = 0 * self.vx_mp; self.vy_mp = 0 * self.vy_mp; self.vz_mp = 0 * self.vz_mp
-            self.nel_mp = 0 * self.nel_mp
-            self.nel_mp[0:N_mp_expect] = np.ones(N_mp_expect) * self.nel_mp_ref
-            #
-            flag_add = (intnum_MP_in_cell > 0)
-            n_add_step = np.sum(flag_add)
-            #
-            self.N_mp = 0
-            while n_add_step > 0:
 
-                x_temp = x_nonzero[flag_add] + Dx_reg * (rand(n_add_step) - 0.5)
-                y_temp = y_nonzero[flag_add] + Dy_reg * (rand(n_add_step) - 0.5)
+            # Generate all the new MPs at once, each in its own cell
+            i_cell_new = np.repeat(np.arange(ngen), intnum_MP_in_cell)
+            x_nonzero_temp = x_nonzero[i_cell_new]
+            y_nonzero_temp = y_nonzero[i_cell_new]
 
-                vx_temp = vx_nonzero[flag_add] + Dvx_reg * (rand(n_add_step) - 0.5)
-                vy_temp = vy_nonzero[flag_add] + Dvy_reg * (rand(n_add_step) - 0.5)
-                vz_temp = vz_nonzero[flag_add] + Dvz_reg * (rand(n_add_step) - 0.5)
+            x_temp = x_nonzero_temp + Dx_reg * (rand(N_mp_expect) - 0.5)
+            y_temp = y_nonzero_temp + Dy_reg * (rand(N_mp_expect) - 0.5)
 
-                x_nonzero_temp = x_nonzero[flag_add]
-                y_nonzero_temp = y_nonzero[flag_add]
+            vx_temp = vx_nonzero[i_cell_new] + Dvx_reg * (rand(N_mp_expect) - 0.5)
+            vy_temp = vy_nonzero[i_cell_new] + Dvy_reg * (rand(N_mp_expect) - 0.5)
+            vz_temp = vz_nonzero[i_cell_new] + Dvz_reg * (rand(N_mp_expect) - 0.5)
 
+            flag_np = self.chamb.is_outside(x_temp, y_temp)
+            Nout = np.sum(flag_np)
+            while(Nout > 0):
+                x_temp[flag_np] = x_nonzero_temp[flag_np] + Dx_reg * (rand(Nout) - 0.5)
+                y_temp[flag_np] = y_nonzero_temp[flag_np] + Dy_reg * (rand(Nout) - 0.5)
                 flag_np = self.chamb.is_outside(x_temp, y_temp)
-                #(((x_temp/x_aper)**2 + (y_temp/y_aper)**2)>=1)
                 Nout = np.sum(flag_np)
-                while(Nout > 0):
-                    #        indices=find(flag_np);
-                    x_temp[flag_np] = x_nonzero_temp[flag_np] + Dx_reg * (rand(Nout) - 0.5)
-                    y_temp[flag_np] = y_nonzero_temp[flag_np] + Dy_reg * (rand(Nout) - 0.5)
-                    flag_np = self.chamb.is_outside(x_temp, y_temp)
-                    #(((x_temp/x_aper)**2 + (y_temp/y_aper)**2)>=1)
-                    Nout = np.sum(flag_np)
-
-                self.x_mp[self.N_mp:self.N_mp + n_add_step] = x_temp
-                self.y_mp[self.N_mp:self.N_mp + n_add_step] = y_temp
-
-                self.vx_mp[self.N_mp:self.N_mp + n_add_step] = vx_temp
-                self.vy_mp[self.N_mp:self.N_mp + n_add_step] = vy_temp
-                self.vz_mp[self.N_mp:self.N_mp + n_add_step] = vz_temp
-                self.N_mp = self.N_mp + n_add_step
 
-                intnum_MP_in_cell[flag_add] = intnum_MP_in_cell[flag_add] - 1
-                flag_add = intnum_MP_in_cell > 0
-                n_add_step = np.sum(flag_add)
+            self.N_mp = 0
+            self.ensure_capacity(N_mp_expect)
+            self.mp_buffer[:, :] = 0.
 
-            #end
+            self.x_mp[0:N_mp_expect] = x_temp
+            self.y_mp[0:N_mp_expect] = y_temp
+            self.vx_mp[0:N_mp_expect] = vx_temp
+            self.vy_mp[0:N_mp_expect] = vy_temp
+            self.vz_mp[0:N_mp_expect] = vz_temp
+            self.nel_mp[0:N_mp_expect] = self.nel_mp_ref
+            self.N_mp = N_mp_expect
 
             if self.flag_lifetime_hist:
                 self.t_last_impact[:] = -1
 
+            if self.flag_shrink_buffer:
+                self.shrink_buffer()
+
             chrg = np.sum(self.nel_mp)
             erg = np.sum(0.5 / np.abs(self.charge / self.mass) * self.nel_mp[0:self.N_mp] * (self.vx_mp[0:self.N_mp] * self.vx_mp[0:self.N_mp] + self.vy_mp[0:self.N_mp] * self.vy_mp[0:self.N_mp] + self.vz_mp[0:self.N_mp] * self.vz_mp[0:self.N_mp]))
             print('Cloud %s: Done regeneration. N_mp=%d Nel_tot=%1.2e En_tot=%1.2e'%(self.name, self.N_mp, chrg, erg))
@@ -458,6 +480,8 @@ class MP_system:
 
             if Nint_new_MP > 0:
 
+                self.ensure_capacity(self.N_mp + Nint_new_MP)
+
                 x_temp = (x_max - x_min) * rand(Nint_new_MP) + x_min
                 y_temp = (y_max - y_min) * rand(Nint_new_MP) + y_min
 
@@ -516,6 +540,8 @@ class MP_system:
             y_temp = y_temp[flag_keep]
             Nint_new_MP = len(x_temp)
 
+            self.ensure_capacity(self.N_mp + Nint_new_MP)
+
             self.x_mp[self.N_mp:self.N_mp + Nint_new_MP] = x_temp
             #Be careful to the indexing when translating to python
             self.y_mp[self.N_mp:self.N_mp + Nint_new_MP] = y_temp
@@ -538,6 +564,7 @@ class MP_system:
     def add_new_MPs(self, N_new_MP, nel_new_mp, x, y, z, vx, vy, vz, t_last_impact):
         N_mp_old = self.N_mp
         N_mp_new = self.N_mp + N_new_MP
+        self.ensure_capacity(N_mp_new)
         self.x_mp[N_mp_old:N_mp_new] = x
         self.y_mp[N_mp_old:N_mp_new] = y
         self.z_mp[N_mp_old:N_mp_new] = z
@@ -559,6 +586,7 @@ class MP_system:
             dict_MP_init = filename_MPs
 
         Nint_new_MP = int(dict_MP_init['N_mp'])
+        self.ensure_capacity(self.N_mp + Nint_new_MP)
 
         self.x_mp[self.N_mp:self.N_mp + Nint_new_MP] = np.squeeze(dict_MP_init['x_mp'])
         self.y_mp[self.N_mp:self.N_mp + Nint_new_MP] = np.squeeze(dict_MP_init['y_mp'])
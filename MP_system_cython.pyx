@@ -0,0 +1,29 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef int compact_MPs(np.uint8_t[::1] flag_keep, int N_mp,
+                      double[:, ::1] mp_buffer, int i_nel_mp):
+    # Stable in-place compaction of the MP buffer (N_fields x capacity):
+    # the MPs with flag_keep set are moved to the beginning of the buffer
+    # preserving their order, all fields in one pass. nel_mp (row i_nel_mp)
+    # is set to zero for the freed slots. Returns the new N_mp.
+
+    cdef int i_mp, i_field
+    cdef int i_new = 0
+    cdef int N_fields = mp_buffer.shape[0]
+
+    for i_mp in range(N_mp):
+        if flag_keep[i_mp]:
+            if i_new != i_mp:
+                for i_field in range(N_fields):
+                    mp_buffer[i_field, i_new] = mp_buffer[i_field, i_mp]
+            i_new += 1
+
+    for i_mp in range(i_new, N_mp):
+        mp_buffer[i_nel_mp, i_mp] = 0.
+
+    return i_new
@@ -52,6 +52,7 @@
 
 import os
 import subprocess
+import tempfile
 import time
 
 import numpy as np
@@ -91,12 +92,91 @@ class DummyBeamTim(object):
         return Ex_n_beam, Ey_n_beam
 
 
+class ReversedRecorder(object):
+    """Records arrays with the same shape in a preallocated buffer that is
+    filled from the end, so that the records are obtained in reverse order
+    (as needed for the slices) without further copies. The buffer is
+    enlarged by doubling if more records than expected are appended. If
+    memmap_folder is given, the buffer is a memory-mapped file in that
+    folder."""
+
+    def __init__(self, capacity=16, memmap_folder=None):
+        self.capacity = max(int(capacity), 1)
+        self.memmap_folder = memmap_folder
+        self.buffer = None
+        self.N_rows = 0
+
+    def _allocate(self, shape, dtype):
+        if self.memmap_folder is None:
+            return np.empty(shape, dtype=dtype)
+
+        fd, filename = tempfile.mkstemp(suffix=".npy", prefix="PyEC4PyHT_", dir=self.memmap_folder)
+        os.close(fd)
+        buf = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+        try:
+            # the mapping stays valid, the file is removed when released
+            os.remove(filename)
+        except OSError:
+            pass
+        return buf
+
+    def _append_rows(self, rows):
+        N_new = rows.shape[0]
+        if self.buffer is None:
+            self.capacity = max(self.capacity, N_new)
+            self.buffer = self._allocate((self.capacity,) + rows.shape[1:], rows.dtype)
+        if self.N_rows + N_new > self.capacity:
+            new_capacity = max(2 * self.capacity, self.N_rows + N_new)
+            new_buffer = self._allocate((new_capacity,) + self.buffer.shape[1:], self.buffer.dtype)
+            new_buffer[new_capacity - self.N_rows:] = self.buffer[self.capacity - self.N_rows:]
+            self.buffer = new_buffer
+            self.capacity = new_capacity
+        self.N_rows += N_new
+        i_start = self.capacity - self.N_rows
+        self.buffer[i_start:i_start + N_new] = rows
+
+    def append(self, arr):
+        self._append_rows(np.asarray(arr)[np.newaxis])
+
+    def get(self):
+        """Records stacked in an array, last record first."""
+        if self.buffer is None:
+            return np.array([])
+        return self.buffer[self.capacity - self.N_rows:]
+
+
+class ReversedRaggedRecorder(ReversedRecorder):
+    """Records 1D arrays of different length (e.g. MP coordinates up to
+    N_mp) in a single flat buffer filled from the end."""
+
+    def __init__(self, capacity=16, memmap_folder=None):
+        super(ReversedRaggedRecorder, self).__init__(capacity, memmap_folder)
+        self.lengths = []
+
+    def append(self, arr):
+        arr = np.asarray(arr)
+        self._append_rows(arr)
+        self.lengths.append(len(arr))
+
+    def get(self):
+        """List of the records (views on the buffer), last record first."""
+        data = super(ReversedRaggedRecorder, self).get()
+        records = []
+        i_start = 0
+        for length in self.lengths[::-1]:
+            records.append(data[i_start:i_start + length])
+            i_start += length
+        return records
+
+
 extra_allowed_kwargs = {
     "x_beam_offset",
     "y_beam_offset",
     "probes_position",
     "enable_kick_x",
     "enable_kick_y",
+    "beam_field_batch_size",
+    "fast_reinitialize",
 }
 
 
@@ -209,6 +289,19 @@ class Ecloud(object):
         enable_kick_y :
             Enable vertical kick from the cloud on the beam.
 
+        beam_field_batch_size :
+            If given, in track the beam fields of this number of consecutive
+            slices are computed together with a single multi-state solve,
+            before the cloud is tracked through them. Not used in
+            slice_by_slice_mode.
+
+        fast_reinitialize : {True, False}
+            If True, after the first track the cloud is reset for the next
+            track by restoring the initial MPs in place and restarting the
+            savers on their existing buffers, without re-initializing them
+            (SEY curves and energy distributions are not extracted again).
+            The impact histograms are zeroed at each reset.
+
         **kwargs :
             Any input parameter of PyECLOUD can be passes as a keyword arguments.
             Parameters definded in the input files are overridden by those passas as
@@ -235,6 +328,11 @@ class Ecloud(object):
         [ecloud].save_beam_potential
         [ecloud].save_beam_field
 
+        The recorded fields are stacked in arrays (last slice first). The MP
+        coordinates are recorded only up to N_mp, as a list of arrays.
+        If [ecloud].diagnostics_memmap_folder is set to a folder, the
+        recorded data are stored in memory-mapped files in that folder.
+
 
         """
 
@@ -314,6 +412,16 @@ class Ecloud(object):
         if not self.enable_kick_y:
             print("Vertical kick on the beam is disabled!")
 
+        self.beam_field_batch_size = None
+        if "beam_field_batch_size" in kwargs:
+            self.beam_field_batch_size = kwargs["beam_field_batch_size"]
+            if self.beam_field_batch_size is not None and self.beam_field_batch_size < 1:
+                raise ValueError("beam_field_batch_size must be at least 1!")
+
+        self.fast_reinitialize = False
+        if "fast_reinitialize" in kwargs:
+            self.fast_reinitialize = kwargs["fast_reinitialize"]
+
         # initialize proton density probes
         self.save_ele_field_probes = False
         self.x_probes = -1
@@ -353,6 +461,8 @@ class Ecloud(object):
         self.save_beam_potential = False
         self.save_beam_field = False
 
+        self.diagnostics_memmap_folder = None
+
         self.track_only_first_time = False
 
         self.initial_MP_e_clouds = [
@@ -362,6 +472,7 @@ class Ecloud(object):
         self.flag_clean_slices = flag_clean_slices
 
         self.beam_PyPIC_state = self.cloudsim.spacech_ele.PyPICobj.get_state_object()
+        self.beam_PyPIC_states_batch = []
 
         self.slice_by_slice_mode = slice_by_slice_mode
         if self.slice_by_slice_mode:
@@ -392,8 +503,6 @@ class Ecloud(object):
         if self.verbose:
             start_time = time.mktime(time.localtime())
 
-        self._reinitialize()
-
         if hasattr(beam.particlenumber_per_mp, "__iter__"):
             raise ValueError("ecloud module assumes same size for all beam MPs")
 
@@ -402,17 +511,28 @@ class Ecloud(object):
 
         slices = beam.get_slices(self.slicer)
 
+        self._reinitialize(N_records_expected=slices.n_slices)
+
+        beam_states = {}
+        i_next_batch = slices.n_slices - 1
         for i in range(slices.n_slices - 1, -1, -1):
             if self.verbose:
                 print(("Slice %d/%d" % (i, slices.n_slices)))
 
+            # beam fields for the next batch of slices
+            if self.beam_field_batch_size is not None and i == i_next_batch:
+                i_batch = list(range(i, max(i - self.beam_field_batch_size, -1), -1))
+                beam_states = self._solve_beam_field_batch(beam, slices, i_batch)
+                i_next_batch = i_batch[-1] - 1
+
             # select particles in the slice
             ix = slices.particle_indices_of_slice(i)
 
             # slice size and time step
             dz = slices.z_bins[i + 1] - slices.z_bins[i]
 
-            self._track_single_slice(beam, ix, dz, force_pyecl_newpass=(i == 0))
+            self._track_single_slice(beam, ix, dz, force_pyecl_newpass=(i == 0),
+                                     beam_state=beam_states.get(i, None))
 
         # Used by Lotta to debug fastion mode
         if self.beam_monitor is not None:
@@ -480,10 +600,46 @@ class Ecloud(object):
         self.track_only_first_time = False
         self.replace_with_recorded_field_map(delete_ecloud_data=delete_ecloud_data)
 
-    def _track_single_slice(self, slic, ix, dz, force_pyecl_newpass=False):
+    def _solve_beam_field_batch(self, beam, slices, i_slices):
+        """Scatter the slices i_slices on separate PyPIC states and compute
+        their fields with a single call to solve_states. Returns a
+        dictionary with the states of the non-empty slices."""
+
+        PyPICobj = self.cloudsim.spacech_ele.PyPICobj
+
+        # states are kept from one batch to the next
+        while len(self.beam_PyPIC_states_batch) < len(i_slices):
+            self.beam_PyPIC_states_batch.append(PyPICobj.get_state_object())
+
+        beam_states = {}
+        for i_slice, state in zip(i_slices, self.beam_PyPIC_states_batch):
+            ix = slices.particle_indices_of_slice(i_slice)
+            if len(ix) == 0:
+                continue
+            dz = slices.z_bins[i_slice + 1] - slices.z_bins[i_slice]
+            state.scatter(
+                x_mp=beam.x[ix] + self.x_beam_offset,
+                y_mp=beam.y[ix] + self.y_beam_offset,
+                nel_mp=beam.x[ix] * 0.0 + beam.particlenumber_per_mp / dz,
+                charge=beam.charge,
+            )
+            beam_states[i_slice] = state
+
+        if len(beam_states) > 0:
+            PyPICobj.solve_states(list(beam_states.values()))
+
+        return beam_states
+
+    def _track_single_slice(self, slic, ix, dz, force_pyecl_newpass=False, beam_state=None):
 
         spacech_ele = self.cloudsim.spacech_ele
 
+        # beam_state, if given, contains the beam field of the slice,
+        # already computed by _solve_beam_field_batch
+        flag_beam_field_ready = beam_state is not None
+        if beam_state is None:
+            beam_state = self.beam_PyPIC_state
+
         # Check if the slice interacts with the beam
         if hasattr(slic, "slice_info"):
             if "interact_with_EC" in list(slic.slice_info.keys()):
@@ -564,16 +720,17 @@ class Ecloud(object):
             else:
 
                 # beam field
-                self.beam_PyPIC_state.scatter(
-                    x_mp=slic.x[ix] + self.x_beam_offset,
-                    y_mp=slic.y[ix] + self.y_beam_offset,
-                    nel_mp=slic.x[ix] * 0.0 + slic.particlenumber_per_mp / dz,
-                    charge=slic.charge,
-                )
-                self.cloudsim.spacech_ele.PyPICobj.solve_states([self.beam_PyPIC_state])
+                if not flag_beam_field_ready:
+                    beam_state.scatter(
+                        x_mp=slic.x[ix] + self.x_beam_offset,
+                        y_mp=slic.y[ix] + self.y_beam_offset,
+                        nel_mp=slic.x[ix] * 0.0 + slic.particlenumber_per_mp / dz,
+                        charge=slic.charge,
+                    )
+                    self.cloudsim.spacech_ele.PyPICobj.solve_states([beam_state])
 
                 # build dummy beamtim object
-                dummybeamtim = DummyBeamTim(self.beam_PyPIC_state)
+                dummybeamtim = DummyBeamTim(beam_state)
 
                 dummybeamtim.lam_t_curr = np.mean(
                     slic.particlenumber_per_mp / dz
@@ -637,35 +794,35 @@ class Ecloud(object):
             MPe_for_save = self.cloudsim.cloud_list[0].MP_e
 
             if self.save_ele_distributions_last_track:
-                self.rho_ele_last_track.append(spacech_ele.rho.copy())
+                self.rho_ele_last_track.append(spacech_ele.rho)
 
             if self.save_ele_potential:
-                self.phi_ele_last_track.append(spacech_ele.phi.copy())
+                self.phi_ele_last_track.append(spacech_ele.phi)
 
             if self.save_ele_field:
-                self.Ex_ele_last_track.append(spacech_ele.efx.copy())
-                self.Ey_ele_last_track.append(spacech_ele.efy.copy())
+                self.Ex_ele_last_track.append(spacech_ele.efx)
+                self.Ey_ele_last_track.append(spacech_ele.efy)
 
             if self.save_beam_distributions_last_track:
-                self.rho_beam_last_track.append(self.beam_PyPIC_state.rho.copy())
+                self.rho_beam_last_track.append(beam_state.rho)
 
             if self.save_beam_potential:
-                self.phi_beam_last_track.append(self.beam_PyPIC_state.phi.copy())
+                self.phi_beam_last_track.append(beam_state.phi)
 
             if self.save_beam_field:
-                self.Ex_beam_last_track.append(self.beam_PyPIC_state.efx.copy())
-                self.Ey_beam_last_track.append(self.beam_PyPIC_state.efy.copy())
+                self.Ex_beam_last_track.append(beam_state.efx)
+                self.Ey_beam_last_track.append(beam_state.efy)
 
             if self.save_ele_MP_position:
-                self.x_MP_last_track.append(MPe_for_save.x_mp.copy())
-                self.y_MP_last_track.append(MPe_for_save.y_mp.copy())
+                self.x_MP_last_track.append(MPe_for_save.x_mp[:MPe_for_save.N_mp])
+                self.y_MP_last_track.append(MPe_for_save.y_mp[:MPe_for_save.N_mp])
 
             if self.save_ele_MP_velocity:
-                self.vx_MP_last_track.append(MPe_for_save.vx_mp.copy())
-                self.vy_MP_last_track.append(MPe_for_save.vy_mp.copy())
+                self.vx_MP_last_track.append(MPe_for_save.vx_mp[:MPe_for_save.N_mp])
+                self.vy_MP_last_track.append(MPe_for_save.vy_mp[:MPe_for_save.N_mp])
 
             if self.save_ele_MP_size:
-                self.nel_MP_last_track.append(MPe_for_save.nel_mp.copy())
+                self.nel_MP_last_track.append(MPe_for_save.nel_mp[:MPe_for_save.N_mp])
 
             if (
                 self.save_ele_MP_position
@@ -682,15 +839,19 @@ class Ecloud(object):
                 MP_probes.N_mp = len(self.x_probes)
                 Ex_sc_probe, Ey_sc_probe = spacech_ele.get_sc_eletric_field(MP_probes)
 
-                self.Ex_ele_last_track_at_probes.append(Ex_sc_probe.copy())
-                self.Ey_ele_last_track_at_probes.append(Ey_sc_probe.copy())
+                self.Ex_ele_last_track_at_probes.append(Ex_sc_probe)
+                self.Ey_ele_last_track_at_probes.append(Ey_sc_probe)
 
             self.t_sim += dt
             new_pass = False  # it can be true only for the first sub-slice of a slice
 
-    def _reinitialize(self):
+    def _reinitialize(self, N_records_expected=None):
+
+        # the full initialization of the savers is needed only the first time
+        flag_fast = self.fast_reinitialize and self.i_reinit > 0
 
-        cc = mlm.obj_from_dict(self.cloudsim.config_dict)
+        if not flag_fast:
+            cc = mlm.obj_from_dict(self.cloudsim.config_dict)
 
         for thiscloud, initdict in zip(
             self.cloudsim.cloud_list, self.initial_MP_e_clouds
@@ -700,7 +861,9 @@ class Ecloud(object):
 
             thisconf = thiscloud.config_dict
 
-            if thiscloud.pyeclsaver is not None:
+            if thiscloud.pyeclsaver is not None and flag_fast:
+                thiscloud.pyeclsaver.restart_observing(thiscloud.impact_man)
+            elif thiscloud.pyeclsaver is not None:
                 thiscloud.pyeclsaver.extract_sey = False
                 thiscloud.pyeclsaver.start_observing(
                     cc.Dt,
@@ -735,6 +898,7 @@ class Ecloud(object):
                     flag_last_cloud=(thiscloud is self.cloudsim.cloud_list[-1]),
                 )
 
+            if thiscloud.pyeclsaver is not None:
                 thiscloud.pyeclsaver.filen_main_outp = (
                     thiscloud.pyeclsaver.filen_main_outp.split(".mat")[0].split(
                         "__iter"
@@ -742,44 +906,51 @@ class Ecloud(object):
                     + "__iter%d.mat" % self.i_reinit
                 )
 
+        # Recorders of the diagnostics (converted to arrays in _finalize)
+        if N_records_expected is None:
+            N_records_expected = 16
+        N_mp_expected = N_records_expected * max(self.cloudsim.cloud_list[0].MP_e.N_mp, 1)
+        new_recorder = lambda: ReversedRecorder(N_records_expected, self.diagnostics_memmap_folder)
+        new_MP_recorder = lambda: ReversedRaggedRecorder(N_mp_expected, self.diagnostics_memmap_folder)
+
         if self.save_ele_distributions_last_track:
-            self.rho_ele_last_track = []
+            self.rho_ele_last_track = new_recorder()
 
         if self.save_ele_potential_and_field:
             self.save_ele_potential = True
             self.save_ele_field = True
 
         if self.save_ele_potential:
-            self.phi_ele_last_track = []
+            self.phi_ele_last_track = new_recorder()
 
         if self.save_ele_field:
-            self.Ex_ele_last_track = []
-            self.Ey_ele_last_track = []
+            self.Ex_ele_last_track = new_recorder()
+            self.Ey_ele_last_track = new_recorder()
 
         if self.save_beam_distributions_last_track:
-            self.rho_beam_last_track = []
+            self.rho_beam_last_track = new_recorder()
 
         if self.save_beam_potential_and_field:
             self.save_beam_potential = True
             self.save_beam_field = True
 
         if self.save_beam_potential:
-            self.phi_beam_last_track = []
+            self.phi_beam_last_track = new_recorder()
 
         if self.save_beam_field:
-            self.Ex_beam_last_track = []
-            self.Ey_beam_last_track = []
+            self.Ex_beam_last_track = new_recorder()
+            self.Ey_beam_last_track = new_recorder()
 
         if self.save_ele_MP_position:
-            self.x_MP_last_track = []
-            self.y_MP_last_track = []
+            self.x_MP_last_track = new_MP_recorder()
+            self.y_MP_last_track = new_MP_recorder()
 
         if self.save_ele_MP_velocity:
-            self.vx_MP_last_track = []
-            self.vy_MP_last_track = []
+            self.vx_MP_last_track = new_MP_recorder()
+            self.vy_MP_last_track = new_MP_recorder()
 
         if self.save_ele_MP_size:
-            self.nel_MP_last_track = []
+            self.nel_MP_last_track = new_MP_recorder()
 
         if (
             self.save_ele_MP_position
@@ -789,8 +960,8 @@ class Ecloud(object):
             self.N_MP_last_track = []
 
         if self.save_ele_field_probes:
-            self.Ex_ele_last_track_at_probes = []
-            self.Ey_ele_last_track_at_probes = []
+            self.Ex_ele_last_track_at_probes = new_recorder()
+            self.Ey_ele_last_track_at_probes = new_recorder()
 
         # ~ self.t_sim = 0.
         self.i_curr_bunch = -1
@@ -799,35 +970,35 @@ class Ecloud(object):
     def _finalize(self):
 
         if self.save_ele_distributions_last_track:
-            self.rho_ele_last_track = np.array(self.rho_ele_last_track[::-1])
+            self.rho_ele_last_track = self.rho_ele_last_track.get()
 
         if self.save_ele_potential:
-            self.phi_ele_last_track = np.array(self.phi_ele_last_track[::-1])
+            self.phi_ele_last_track = self.phi_ele_last_track.get()
 
         if self.save_ele_field:
-            self.Ex_ele_last_track = np.array(self.Ex_ele_last_track[::-1])
-            self.Ey_ele_last_track = np.array(self.Ey_ele_last_track[::-1])
+            self.Ex_ele_last_track = self.Ex_ele_last_track.get()
+            self.Ey_ele_last_track = self.Ey_ele_last_track.get()
 
         if self.save_beam_distributions_last_track:
-            self.rho_beam_last_track = np.array(self.rho_beam_last_track[::-1])
+            self.rho_beam_last_track = self.rho_beam_last_track.get()
 
         if self.save_beam_potential:
-            self.phi_beam_last_track = np.array(self.phi_beam_last_track[::-1])
+            self.phi_beam_last_track = self.phi_beam_last_track.get()
 
         if self.save_beam_field:
-            self.Ex_beam_last_track = np.array(self.Ex_beam_last_track[::-1])
-            self.Ey_beam_last_track = np.array(self.Ey_beam_last_track[::-1])
+            self.Ex_beam_last_track = self.Ex_beam_last_track.get()
+            self.Ey_beam_last_track = self.Ey_beam_last_track.get()
 
         if self.save_ele_MP_position:
-            self.x_MP_last_track = np.array(self.x_MP_last_track[::-1])
-            self.y_MP_last_track = np.array(self.y_MP_last_track[::-1])
+            self.x_MP_last_track = self.x_MP_last_track.get()
+            self.y_MP_last_track = self.y_MP_last_track.get()
 
         if self.save_ele_MP_velocity:
-            self.vx_MP_last_track = np.array(self.vx_MP_last_track[::-1])
-            self.vy_MP_last_track = np.array(self.vy_MP_last_track[::-1])
+            self.vx_MP_last_track = self.vx_MP_last_track.get()
+            self.vy_MP_last_track = self.vy_MP_last_track.get()
 
         if self.save_ele_MP_size:
-            self.nel_MP_last_track = np.array(self.nel_MP_last_track[::-1])
+            self.nel_MP_last_track = self.nel_MP_last_track.get()
 
         if (
             self.save_ele_MP_position
@@ -837,12 +1008,8 @@ class Ecloud(object):
             self.N_MP_last_track = np.array(self.N_MP_last_track[::-1])
 
         if self.save_ele_field_probes:
-            self.Ex_ele_last_track_at_probes = np.array(
-                self.Ex_ele_last_track_at_probes[::-1]
-            )
-            self.Ey_ele_last_track_at_probes = np.array(
-                self.Ey_ele_last_track_at_probes[::-1]
-            )
+            self.Ex_ele_last_track_at_probes = self.Ex_ele_last_track_at_probes.get()
+            self.Ey_ele_last_track_at_probes = self.Ey_ele_last_track_at_probes.get()
 
     def _finalize_and_reinitialize(self):
         print("Exec. finalize and reinitialize")
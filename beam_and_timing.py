@@ -89,8 +89,10 @@ class beam_and_timing:
                  chamb=None, sigmax=None, sigmay=None,
                  x_beam_pos=0., y_beam_pos=0., save_beam_field_file_as=None,
                  flag_secodary_beam=False, t_primary_beam=None,
-                 Nx=None, Ny=None, nimag=None,
-                 progress_mapgen_file=None):
+                 Nx=None, Ny=None, nimag=None, N_processes_beam_field=1,
+                 progress_mapgen_file=None,
+                 beam_field_cache_dir=None, beam_field_cache_max_size_MB=1000.,
+                 flag_cache_sparse_solver=False, sparse_solver_cache_dir=None):
 
         if chamb.is_outside(np.array([x_beam_pos]), np.array([y_beam_pos])):
             raise ValueError('The beam is outside the chamber!')
@@ -166,15 +168,79 @@ class beam_and_timing:
         N_pass_tot = int(np.ceil(t_inter / b_spac))
 
         flag_PyPIC_state_mode = False
-        if beam_field_file == -1 or beam_field_file == 'computeFD':
-            print('No beam field file provided -> Calculate field using Poisson solver')
 
+        # Inputs of the field computation, checked before the cache lookup so
+        # that a cached field is never used for an invalid configuration
+        if beam_field_file == -1 or beam_field_file == 'computeFD':
+            if Dh_beam_field is None:
+                raise ValueError('Grid size Dh_beam_field MUST be provided for beam field computation!')
+        elif beam_field_file == 'computeBE':
+            if chamb.chamb_type != 'ellip':
+                raise ValueError('You can only use Bassetti Erskine formula with an elliptic chamber!')
+            if Nx is None or Ny is None or nimag is None:
+                raise ValueError('Nx, Ny and nimag MUST be provided for Bassetti Erskine formula!')
+            if x_beam_pos != 0. or y_beam_pos != 0.:
+                raise ValueError('x_beam_pos, y_beam_pos and MUST be 0 for Bassetti Erskine formula!')
+            if int(N_processes_beam_field) != N_processes_beam_field or N_processes_beam_field < 1:
+                raise ValueError('N_processes_beam_field must be a positive integer!')
+        elif beam_field_file == 'compute_FDSW_multigrid':
             if Dh_beam_field is None:
                 raise ValueError('Grid size Dh_beam_field MUST be provided for beam field computation!')
+            if f_telescope_beam is None:
+                raise ValueError('Aspect ratio MUST be provided for multigrid beam field computation!')
+            if target_grid_beam is None:
+                raise ValueError('Target grid MUST be provided for multigrid beam field computation!')
+            if N_nodes_discard_beam is None:
+                raise ValueError(' N_nodes_discard_beam MUST be provided for multigrid beam field computation!')
+            if N_min_Dh_main_beam is None:
+                raise ValueError(' N_min_Dh_main_beam MUST be provided for multigrid beam field computation!')
+            if save_beam_field_file_as is not None:
+                raise ValueError('You cannot save the field maps in multigrid mode! Sorry...')
+
+        # Computed fields can be reused from the cache
+        field_cache = None
+        cached_field = None
+        if beam_field_cache_dir is not None:
+            field_params = None
+            if beam_field_file == -1 or beam_field_file == 'computeFD':
+                mode_name = 'computeFD'
+                field_params = {'Dh_beam_field': Dh_beam_field}
+            elif beam_field_file == 'computeBE':
+                mode_name = 'computeBE'
+                field_params = {'Nx': Nx, 'Ny': Ny, 'nimag': nimag}
+            elif beam_field_file == 'compute_FDSW_multigrid':
+                mode_name = 'compute_FDSW_multigrid'
+                field_params = {'Dh_beam_field': Dh_beam_field, 'f_telescope_beam': f_telescope_beam,
+                                'target_grid_beam': repr(target_grid_beam), 'N_nodes_discard_beam': N_nodes_discard_beam,
+                                'N_min_Dh_main_beam': N_min_Dh_main_beam}
+
+            if field_params is not None:
+                from . import beam_field_cache as bfc
+                field_params.update({'sigmax': sigmax, 'sigmay': sigmay,
+                                     'x_beam_pos': x_beam_pos, 'y_beam_pos': y_beam_pos})
+                field_cache = bfc.beam_field_cache(beam_field_cache_dir, beam_field_cache_max_size_MB)
+                field_key = bfc.beam_field_key(chamb, mode_name, field_params)
+                cached_field = field_cache.load(field_key)
+
+        if cached_field is not None:
+            print('Beam field loaded from cache %s (key %s)' % (beam_field_cache_dir, field_key))
+            if 'PyPIC_state' in cached_field:
+                self.PyPIC_state = cached_field['PyPIC_state']
+                self.get_beam_eletric_field = self._get_beam_eletric_field_PyPICstate
+                flag_PyPIC_state_mode = True
+            else:
+                Ex_beam = cached_field['Ex']
+                Ey_beam = cached_field['Ey']
+                xx_beam = cached_field['xx']
+                yy_beam = cached_field['yy']
+
+        elif beam_field_file == -1 or beam_field_file == 'computeFD':
+            print('No beam field file provided -> Calculate field using Poisson solver')
 
             from . import space_charge_class as scc
             from numpy import exp, pi
-            scb = scc.space_charge(chamb, Dh_beam_field, Dt_sc=1.)
+            scb = scc.space_charge(chamb, Dh_beam_field, Dt_sc=1., flag_cache_sparse_solver=flag_cache_sparse_solver,
+                                   sparse_solver_cache_dir=sparse_solver_cache_dir)
 
             print('Computing beam charge density')
             #rho=1./(2.*pi*sigmax*sigmay)*exp(-(scb.xn-x_beam_pos)**2/(2.*sigmax**2)-(scb.yn-y_beam_pos)**2/(2.*sigmay**2))
@@ -197,13 +263,6 @@ class beam_and_timing:
 
             print('No beam field file provided -> Calculate field using Bassetti Erskine formula')
 
-            if chamb.chamb_type != 'ellip':
-                raise ValueError('You can only use Bassetti Erskine formula with an elliptic chamber!')
-            if Nx is None or Ny is None or nimag is None:
-                raise ValueError('Nx, Ny and nimag MUST be provided for Bassetti Erskine formula!')
-            if x_beam_pos != 0. or y_beam_pos != 0.:
-                raise ValueError('x_beam_pos, y_beam_pos and MUST be 0 for Bassetti Erskine formula!')
-
             print("sigmax=%.3e, sigmay=%.3e, Nx=%d, Ny=%d, nimag=%d"%(sigmax, sigmay, Nx, Ny, nimag))
 
             if progress_mapgen_file is not None:
@@ -221,31 +280,19 @@ class beam_and_timing:
             xx = np.linspace(-xmax, xmax, Nx)
             yy = np.linspace(-ymax, ymax, Ny)
 
-            Ex = np.zeros((len(xx), len(yy)), dtype=complex)
-            Ey = np.zeros((len(xx), len(yy)), dtype=complex)
+            def log_progress(frac_done):
+                print(('Beam field map generation %.0f'%(frac_done * 100) + """%"""))
+                if progress_mapgen_file is not None:
+                    fprog = open(progress_mapgen_file, 'a')
+                    fprog.write(('Done %.0f'%(frac_done * 100) + """%""" + '\n'))
+                    fprog.close()
+
             print('Start beam field map generation.')
-            for ii in range(len(xx)):
-
-                if np.mod(ii, Nx / 20) == 0:
-                    print(('Beam field map generation %.0f'%(float(ii) / float(Nx) * 100) + """%"""))
-
-                    if progress_mapgen_file is not None:
-                        fprog = open(progress_mapgen_file, 'a')
-                        fprog.write(('Done %.0f'%(float(ii) / float(Nx) * 100) + """%""" + '\n'))
-                        fprog.close()
-
-                for jj in range(len(yy)):
-                    x = xx[ii]
-                    y = yy[jj]
-                    Ex_imag, Ey_imag = BE.ImageTerms(x, y, a, b, 0, 0, nimag)
-                    Ex_BE, Ey_BE = BE.BassErsk(x, y, sigmax, sigmay)
-                    Ex[ii, jj] = Ex_BE + Ex_imag
-                    Ey[ii, jj] = Ey_BE + Ey_imag
-                    Ex_beam = Ex.real
-                    Ey_beam = Ey.real
-                    xx_beam = xx
-                    yy_beam = yy
-                #to do: 1 - log progress somehow 2 - save file and check 3 - check secondary beams 4 - check the beam is centered
+            Ex_beam, Ey_beam = BE.field_map_BE(xx, yy, sigmax, sigmay, a, b, nimag,
+                                               N_processes=N_processes_beam_field, progress_callback=log_progress)
+            xx_beam = xx
+            yy_beam = yy
+
             if progress_mapgen_file is not None:
                 fprog = open(progress_mapgen_file, 'a')
                 fprog.write('Done.\n')
@@ -253,17 +300,6 @@ class beam_and_timing:
             print('Done beam field map generation.')
         elif beam_field_file == 'compute_FDSW_multigrid':
 
-            if Dh_beam_field is None:
-                raise ValueError('Grid size Dh_beam_field MUST be provided for beam field computation!')
-            if f_telescope_beam is None:
-                raise ValueError('Aspect ratio MUST be provided for multigrid beam field computation!')
-            if target_grid_beam is None:
-                raise ValueError('Target grid MUST be provided for multigrid beam field computation!')
-            if N_nodes_discard_beam is None:
-                raise ValueError(' N_nodes_discard_beam MUST be provided for multigrid beam field computation!')
-            if N_min_Dh_main_beam is None:
-                raise ValueError(' N_min_Dh_main_beam MUST be provided for multigrid beam field computation!')
-
             import PyPIC.FiniteDifferences_ShortleyWeller_SquareGrid as PIC_FDSW
             PyPICmain = PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb, Dh=Dh_beam_field, sparse_solver='PyKLU')
             import PyPIC.MultiGrid as PIC_MG
@@ -304,6 +340,12 @@ class beam_and_timing:
             xx_beam = np.squeeze(dict_beam['xx'].T)
             yy_beam = np.squeeze(dict_beam['yy'].T)
 
+        if field_cache is not None and cached_field is None:
+            if flag_PyPIC_state_mode:
+                field_cache.save(field_key, {'PyPIC_state': self.PyPIC_state})
+            else:
+                field_cache.save(field_key, {'xx': xx_beam, 'yy': yy_beam, 'Ex': Ex_beam, 'Ey': Ey_beam})
+
         if save_beam_field_file_as is not None:
             if flag_PyPIC_state_mode:
                 raise ValueError('You cannot save the field maps in multigrid mode! Sorry...')
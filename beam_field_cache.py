@@ -0,0 +1,198 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+
+import os
+import pickle
+import hashlib
+
+import numpy as np
+
+
+# Bump when the content of the cached entries changes
+_cache_format_version = 1
+
+# Entries already loaded or saved in this process (shared with the processes
+# forked afterwards, e.g. by a parameter scan), keyed by prefix and key
+_memory_cache = {}
+
+
+def beam_field_key(chamb, beam_field_file, field_params):
+    '''
+    Returns the key identifying a computed beam field: a hash of the chamber
+    geometry, of the computation mode (beam_field_file) and of the beam and
+    solver parameters in the dictionary field_params.
+    '''
+
+    hasher = hashlib.sha1()
+    hasher.update(('%d|%s|%s|' % (_cache_format_version, beam_field_file, chamb.chamb_type)).encode())
+    for attr in ['x_aper', 'y_aper']:
+        hasher.update(repr(float(getattr(chamb, attr))).encode())
+    for attr in ['Vx', 'Vy']:
+        if hasattr(chamb, attr):
+            hasher.update(np.ascontiguousarray(getattr(chamb, attr), dtype=np.float64).tobytes())
+    hasher.update(repr(sorted(field_params.items())).encode())
+
+    return hasher.hexdigest()
+
+
+class beam_field_cache(object):
+    '''
+    On-disk cache of computed beam fields, shared by all the runs (and
+    beams) pointing to the same cache_dir. Other startup products (e.g. the
+    extracted SEY curves) can be stored with a different entry_prefix.
+
+    Entries are written to a temporary file and renamed, so that concurrent
+    runs never read a partially written field. The modification time of an
+    entry is refreshed whenever it is used and the least recently used
+    entries are removed when the total size exceeds max_size_MB.
+    '''
+
+    def __init__(self, cache_dir, max_size_MB=1000., entry_prefix='beam_field'):
+
+        self.cache_dir = cache_dir
+        self.entry_prefix = entry_prefix
+        self.max_size_bytes = max_size_MB * 1024 * 1024
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, '%s_%s.pkl' % (self.entry_prefix, key))
+
+    def _list_entries(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith(self.entry_prefix + '_') and filename.endswith('.pkl'):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def load(self, key):
+        '''
+        Returns the dictionary stored for key, or None if there is no valid
+        entry. Entries already used in this process are not read again.
+        '''
+
+        if (self.entry_prefix, key) in _memory_cache:
+            return _memory_cache[(self.entry_prefix, key)]
+
+        path = self._entry_path(key)
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with open(path, 'rb') as fid:
+                entry = pickle.load(fid)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as err:
+            print('Warning: cache entry %s could not be read (%s)' % (path, err))
+            return None
+
+        if entry.get('key') != key:
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        _memory_cache[(self.entry_prefix, key)] = entry['field']
+        return entry['field']
+
+    def save(self, key, field):
+        '''
+        Stores the dictionary field for key and evicts the least recently
+        used entries if the cache is larger than allowed.
+        '''
+
+        _memory_cache[(self.entry_prefix, key)] = field
+
+        path = self._entry_path(key)
+        temp_file = path + '.%d.tmp' % os.getpid()
+        try:
+            with open(temp_file, 'wb') as fid:
+                pickle.dump({'key': key, 'field': field}, fid, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as err:
+            print('Warning: %s could not be saved to cache %s (%s)' % (self.entry_prefix, self.cache_dir, err))
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the total size of the
+        cache is below max_size_bytes.
+        '''
+
+        entries = sorted(self._list_entries())
+        size_tot = sum([size for _, size, _ in entries])
+
+        for _, size, path in entries:
+            if size_tot <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                print('Cache: removed %s' % path)
+            except OSError:
+                # already removed by another run
+                pass
+            size_tot -= size
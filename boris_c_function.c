@@ -1,17 +1,17 @@
 #include "boris_c_function.h"
 
-void boris_c(int N_sub_steps, double Dtt,
-		double* B_field, double* B_skew,
-		double* xn1, double* yn1,  double* zn1,
-		double* vxn1, double* vyn1, double* vzn1,
-		double* Ex_n, double* Ey_n, 
-		double* Bx_n_custom, double* By_n_custom, double* Bz_n_custom,
-		int custom_B,
-		int N_mp, int N_multipoles,
-		double charge, double mass)
+/*
+* Single Boris substep for one particle (multipole + custom magnetic field,
+* transverse electric field), shared by boris_c and boris_c_fused.
+*/
+static inline void boris_substep(double* xp, double* yp, double* zp,
+		double* vxp, double* vyp, double* vzp,
+		double Ex_np, double Ey_np,
+		double Bx_custom, double By_custom, double Bz_custom,
+		int custom_B, double* B_field, double* B_skew, int N_multipoles,
+		double qm, double Dtt)
 {
-	int p, isub, order;
-	double Ex_np, Ey_np;
+	int order;
 	double Bx_n, By_n, Bz_n;
 	double rexy, imxy, rexy_0;
 	double tBx, tBy, tBz, tBsq;
@@ -19,82 +19,144 @@ void boris_c(int N_sub_steps, double Dtt,
 	double vx_prime, vy_prime, vz_prime;
 	double vx_min, vy_min, vz_min;
 	double vx_plus, vy_plus, vz_plus;
-	double vxn1p, vyn1p, vzn1p;
-	double xn1p, yn1p, zn1p;
-	const double qm=charge/mass;
+	double xn1p = *xp, yn1p = *yp, zn1p = *zp;
+	double vxn1p = *vxp, vyn1p = *vyp, vzn1p = *vzp;
 
-	for(p=0; p<N_mp; p++)
+	rexy = 1.;
+	imxy = 0.;
+	By_n = B_field[0];
+	Bx_n = B_skew[0];
+	Bz_n = 0.;
+
+	for(order = 1; order < N_multipoles; order++)
 	{
-		Ex_np = Ex_n[p];
-		Ey_np = Ey_n[p];
+		/* rexy, imxy correspond to real, imaginary part of (x+iy)^(n-1) */
+		rexy_0 = rexy;
+		rexy = rexy_0*xn1p - imxy*yn1p;
+		imxy = imxy*xn1p + rexy_0*yn1p;
+
+		/*
+		* Bx +iBy = sum[ (k + ik')(x + iy)^(n-1) ]
+		* where k, k' are the strengths and skew strengths of the magnet
+		*/
+		By_n += (B_field[order]*rexy - B_skew[order]*imxy);
+		Bx_n += (B_field[order]*imxy + B_skew[order]*rexy);
+	}
 
-		vxn1p = vxn1[p];
-		vyn1p = vyn1[p];
-		vzn1p = vzn1[p];
+	if (custom_B){
+		Bx_n += Bx_custom;
+		By_n += By_custom;
+		Bz_n += Bz_custom;
+	}
 
-		xn1p = xn1[p];
-		yn1p = yn1[p];
-		zn1p = zn1[p];
+	tBx = 0.5*qm*Dtt*Bx_n;
+	tBy = 0.5*qm*Dtt*By_n;
+	tBz = 0.5*qm*Dtt*Bz_n;
+	tBsq = tBx*tBx + tBy*tBy + tBz*tBz;
 
-		for (isub=0; isub<N_sub_steps; isub++)
-		{
-			rexy = 1.;
-			imxy = 0.;
-			By_n = B_field[0];
-			Bx_n = B_skew[0];
-			Bz_n = 0.;
+	sBx = 2.*tBx/(1.+tBsq);
+	sBy = 2.*tBy/(1.+tBsq);
+	sBz = 2.*tBz/(1.+tBsq);
 
-			for(order = 1; order < N_multipoles; order++)
-			{
-				/* rexy, imxy correspond to real, imaginary part of (x+iy)^(n-1) */
-				rexy_0 = rexy;
-				rexy = rexy_0*xn1p - imxy*yn1p;
-				imxy = imxy*xn1p + rexy_0*yn1p;
-
-				/*
-				* Bx +iBy = sum[ (k + ik')(x + iy)^(n-1) ]
-				* where k, k' are the strengths and skew strengths of the magnet
-				*/
-				By_n += (B_field[order]*rexy - B_skew[order]*imxy);
-				Bx_n += (B_field[order]*imxy + B_skew[order]*rexy);
-			}
-			
-			if (custom_B){
-				Bx_n += Bx_n_custom[p];
-				By_n += By_n_custom[p]; 
-				Bz_n += Bz_n_custom[p]; 
-			}
+	vx_min = vxn1p + 0.5*qm*Ex_np*Dtt;
+	vy_min = vyn1p + 0.5*qm*Ey_np*Dtt;
+	vz_min = vzn1p;
 
-			tBx = 0.5*qm*Dtt*Bx_n;
-			tBy = 0.5*qm*Dtt*By_n;
-			tBz = 0.5*qm*Dtt*Bz_n;
-			tBsq = tBx*tBx + tBy*tBy + tBz*tBz;
+	//v_prime = v_min + cross(v_min, tB)
+	vx_prime = vy_min*tBz - vz_min*tBy + vx_min;
+	vy_prime = vz_min*tBx - vx_min*tBz + vy_min;
+	vz_prime = vx_min*tBy - vy_min*tBx + vz_min;
 
-			sBx = 2.*tBx/(1.+tBsq);
-			sBy = 2.*tBy/(1.+tBsq);
-			sBz = 2.*tBz/(1.+tBsq);
+	//v_plus = v_min + cross(v_prime, sB)
+	vx_plus = vy_prime*sBz - vz_prime*sBy + vx_min;
+	vy_plus = vz_prime*sBx - vx_prime*sBz+ vy_min;
+	vz_plus = vx_prime*sBy - vy_prime*sBx + vz_min;
 
-			vx_min = vxn1p + 0.5*qm*Ex_np*Dtt;
-			vy_min = vyn1p + 0.5*qm*Ey_np*Dtt;
-			vz_min = vzn1p;
+	vxn1p = vx_plus + 0.5*qm*Ex_np*Dtt;
+	vyn1p = vy_plus + 0.5*qm*Ey_np*Dtt;
+	vzn1p = vz_plus;
 
-			//v_prime = v_min + cross(v_min, tB)
-			vx_prime = vy_min*tBz - vz_min*tBy + vx_min;
-			vy_prime = vz_min*tBx - vx_min*tBz + vy_min;
-			vz_prime = vx_min*tBy - vy_min*tBx + vz_min;
+	*xp = xn1p + vxn1p * Dtt;
+	*yp = yn1p + vyn1p * Dtt;
+	*zp = zn1p + vzn1p * Dtt;
 
-			//v_plus = v_min + cross(v_prime, sB)
-			vx_plus = vy_prime*sBz - vz_prime*sBy + vx_min;
-			vy_plus = vz_prime*sBx - vx_prime*sBz+ vy_min;
-			vz_plus = vx_prime*sBy - vy_prime*sBx + vz_min;
+	*vxp = vxn1p;
+	*vyp = vyn1p;
+	*vzp = vzn1p;
+}
+
+/*
+* Bilinear interpolation on a uniform grid (C-ordered, Nxg x Nyg),
+* same convention as int_field in interp_field_for.f:
+* outside the grid interior the field is zero.
+*/
+static inline void gather_bilinear(double x, double y, field_map* fm,
+		double* Ex, double* Ey)
+{
+	double fi, fj, hx, hy;
+	int i, j, ij;
 
-			vxn1p = vx_plus + 0.5*qm*Ex_np*Dtt;
-			vyn1p = vy_plus + 0.5*qm*Ey_np*Dtt;
-			vzn1p = vz_plus;
+	fi = 1. + (x - fm->bias_x)/fm->dx;
+	fj = 1. + (y - fm->bias_y)/fm->dy;
+	i = (int)fi;
+	j = (int)fj;
+
+	if (i > 0 && j > 0 && i < fm->Nxg && j < fm->Nyg)
+	{
+		hx = fi - i;
+		hy = fj - j;
+		/* Fortran (i, j) -> C [i-1, j-1] */
+		ij = (i - 1)*fm->Nyg + (j - 1);
+
+		*Ex = fm->efx[ij]*(1-hx)*(1-hy) + fm->efx[ij + fm->Nyg]*hx*(1-hy) +
+			fm->efx[ij + 1]*(1-hx)*hy + fm->efx[ij + fm->Nyg + 1]*hx*hy;
+		*Ey = fm->efy[ij]*(1-hx)*(1-hy) + fm->efy[ij + fm->Nyg]*hx*(1-hy) +
+			fm->efy[ij + 1]*(1-hx)*hy + fm->efy[ij + fm->Nyg + 1]*hx*hy;
+	}
+	else
+	{
+		*Ex = 0.;
+		*Ey = 0.;
+	}
+}
 
-			xn1p = xn1p + vxn1p * Dtt;
-			yn1p = yn1p + vyn1p * Dtt;
-			zn1p = zn1p + vzn1p * Dtt;
+void boris_c(int N_sub_steps, double Dtt,
+		double* B_field, double* B_skew,
+		double* xn1, double* yn1,  double* zn1,
+		double* vxn1, double* vyn1, double* vzn1,
+		double* Ex_n, double* Ey_n, 
+		double* Bx_n_custom, double* By_n_custom, double* Bz_n_custom,
+		int custom_B,
+		int N_mp, int N_multipoles,
+		double charge, double mass, int num_threads)
+{
+	int p;
+	const double qm=charge/mass;
+
+	/* Particles are independent: the result does not depend on num_threads */
+	#pragma omp parallel for num_threads(num_threads) schedule(static)
+	for(p=0; p<N_mp; p++)
+	{
+		int isub;
+		double Bx_cp = 0., By_cp = 0., Bz_cp = 0.;
+		double vxn1p = vxn1[p];
+		double vyn1p = vyn1[p];
+		double vzn1p = vzn1[p];
+		double xn1p = xn1[p];
+		double yn1p = yn1[p];
+		double zn1p = zn1[p];
+
+		if (custom_B){
+			Bx_cp = Bx_n_custom[p];
+			By_cp = By_n_custom[p];
+			Bz_cp = Bz_n_custom[p];
+		}
+
+		for (isub=0; isub<N_sub_steps; isub++)
+		{
+			boris_substep(&xn1p, &yn1p, &zn1p, &vxn1p, &vyn1p, &vzn1p,
+					Ex_n[p], Ey_n[p], Bx_cp, By_cp, Bz_cp,
+					custom_B, B_field, B_skew, N_multipoles, qm, Dtt);
 		}
 
 		xn1[p] = xn1p;
@@ -107,3 +169,61 @@ void boris_c(int N_sub_steps, double Dtt,
 	}
 }
 
+/*
+* Field gather fused with the Boris push: the electric field is
+* interpolated from the space-charge map and from the (scaled) beam map
+* inside the particle loop, avoiding the temporary field arrays.
+* If reinterp_at_substeps is set, fields are re-gathered at every substep.
+*/
+void boris_c_fused(int N_sub_steps, double Dtt, int reinterp_at_substeps,
+		double* B_field, double* B_skew,
+		double* xn1, double* yn1,  double* zn1,
+		double* vxn1, double* vyn1, double* vzn1,
+		field_map sc_map, int flag_beam, field_map beam_map, double fact_beam,
+		double B0x, double B0y, double B0z,
+		int custom_B,
+		int N_mp, int N_multipoles,
+		double charge, double mass, int num_threads)
+{
+	int p;
+	const double qm=charge/mass;
+
+	#pragma omp parallel for num_threads(num_threads) schedule(static)
+	for(p=0; p<N_mp; p++)
+	{
+		int isub;
+		double Ex_np = 0., Ey_np = 0.;
+		double Ex_bp, Ey_bp;
+		double vxn1p = vxn1[p];
+		double vyn1p = vyn1[p];
+		double vzn1p = vzn1[p];
+		double xn1p = xn1[p];
+		double yn1p = yn1[p];
+		double zn1p = zn1[p];
+
+		for (isub=0; isub<N_sub_steps; isub++)
+		{
+			if (isub == 0 || reinterp_at_substeps)
+			{
+				gather_bilinear(xn1p, yn1p, &sc_map, &Ex_np, &Ey_np);
+				if (flag_beam){
+					gather_bilinear(xn1p, yn1p, &beam_map, &Ex_bp, &Ey_bp);
+					Ex_np += fact_beam*Ex_bp;
+					Ey_np += fact_beam*Ey_bp;
+				}
+			}
+
+			boris_substep(&xn1p, &yn1p, &zn1p, &vxn1p, &vyn1p, &vzn1p,
+					Ex_np, Ey_np, B0x, B0y, B0z,
+					custom_B, B_field, B_skew, N_multipoles, qm, Dtt);
+		}
+
+		xn1[p] = xn1p;
+		yn1[p] = yn1p;
+		zn1[p] = zn1p;
+
+		vxn1[p] = vxn1p;
+		vyn1[p] = vyn1p;
+		vzn1[p] = vzn1p;
+	}
+}
@@ -1,6 +1,17 @@
 #ifndef __BORISCFUN
 #define __BORISCFUN
 
+typedef struct {
+	double* efx;
+	double* efy;
+	int Nxg;
+	int Nyg;
+	double bias_x;
+	double bias_y;
+	double dx;
+	double dy;
+} field_map;
+
 void boris_c(int N_sub_steps, double Dtt, 
 		double* B_field, double* B_skew,
 		double* xn1, double* yn1,  double* zn1, 
@@ -9,6 +20,16 @@ void boris_c(int N_sub_steps, double Dtt,
 		double* Bx_n_custom, double* By_n_custom, double* Bz_n_custom,
 		int custom_B,
 		int N_mp, int N_multipoles,
-		double charge, double mass);
+		double charge, double mass, int num_threads);
+
+void boris_c_fused(int N_sub_steps, double Dtt, int reinterp_at_substeps,
+		double* B_field, double* B_skew,
+		double* xn1, double* yn1,  double* zn1,
+		double* vxn1, double* vyn1, double* vzn1,
+		field_map sc_map, int flag_beam, field_map beam_map, double fact_beam,
+		double B0x, double B0y, double B0z,
+		int custom_B,
+		int N_mp, int N_multipoles,
+		double charge, double mass, int num_threads);
 
 #endif
@@ -9,7 +9,7 @@ cpdef boris_step_multipole(N_sub_steps, Dtt, np.ndarray B_field, np.ndarray B_sk
                            np.ndarray Ex_n, np.ndarray Ey_n,
                            np.ndarray Bx_n, np.ndarray By_n, np.ndarray Bz_n,
                            custom_B,
-                           charge, mass):
+                           charge, mass, num_threads=1):
 
 
     cdef double* B_field_data = <double*>B_field.data
@@ -26,10 +26,96 @@ cpdef boris_step_multipole(N_sub_steps, Dtt, np.ndarray B_field, np.ndarray B_sk
     cdef double* By_n_data =  <double*>By_n.data
     cdef double* Bz_n_data =  <double*>Bz_n.data
 
-    boris_c(N_sub_steps, Dtt, B_field_data, B_skew_data,
-          xn1_data, yn1_data,  zn1_data,
-          vxn1_data, vyn1_data, vzn1_data,
-          Ex_n_data, Ey_n_data,
-          Bx_n_data, By_n_data, Bz_n_data, custom_B,
-          len(xn1), len(B_field),
-          charge, mass)
+    # C arguments, the GIL is released during the push
+    cdef int c_N_sub_steps = N_sub_steps
+    cdef double c_Dtt = Dtt
+    cdef int c_custom_B = custom_B
+    cdef int N_mp = len(xn1)
+    cdef int N_multipoles = len(B_field)
+    cdef double c_charge = charge
+    cdef double c_mass = mass
+    cdef int c_num_threads = num_threads
+
+    with nogil:
+        boris_c(c_N_sub_steps, c_Dtt, B_field_data, B_skew_data,
+              xn1_data, yn1_data,  zn1_data,
+              vxn1_data, vyn1_data, vzn1_data,
+              Ex_n_data, Ey_n_data,
+              Bx_n_data, By_n_data, Bz_n_data, c_custom_B,
+              N_mp, N_multipoles,
+              c_charge, c_mass, c_num_threads)
+
+
+cdef field_map _make_field_map(np.ndarray efx, np.ndarray efy, bias_x, bias_y, dx, dy):
+
+    cdef field_map fm
+    fm.efx = <double*>efx.data
+    fm.efy = <double*>efy.data
+    fm.Nxg = efx.shape[0]
+    fm.Nyg = efx.shape[1]
+    fm.bias_x = bias_x
+    fm.bias_y = bias_y
+    fm.dx = dx
+    fm.dy = dy
+    return fm
+
+
+cpdef boris_step_multipole_fused(N_sub_steps, Dtt, reinterp_at_substeps,
+                                 np.ndarray B_field, np.ndarray B_skew,
+                                 np.ndarray xn1, np.ndarray yn1, np.ndarray zn1,
+                                 np.ndarray vxn1, np.ndarray vyn1, np.ndarray vzn1,
+                                 np.ndarray efx_sc, np.ndarray efy_sc,
+                                 bias_x_sc, bias_y_sc, dx_sc, dy_sc,
+                                 flag_beam, np.ndarray efx_beam, np.ndarray efy_beam,
+                                 bias_x_beam, bias_y_beam, dx_beam, dy_beam, fact_beam,
+                                 B0x, B0y, B0z, custom_B,
+                                 charge, mass, num_threads=1):
+
+    # Field maps are accessed as C-ordered (Nxg, Nyg) arrays
+    efx_sc = np.ascontiguousarray(efx_sc, dtype=np.float64)
+    efy_sc = np.ascontiguousarray(efy_sc, dtype=np.float64)
+    efx_beam = np.ascontiguousarray(efx_beam, dtype=np.float64)
+    efy_beam = np.ascontiguousarray(efy_beam, dtype=np.float64)
+
+    if efx_sc.shape[0] != efy_sc.shape[0] or efx_sc.shape[1] != efy_sc.shape[1]:
+        raise ValueError('Space-charge field maps have different shapes!')
+    if efx_beam.shape[0] != efy_beam.shape[0] or efx_beam.shape[1] != efy_beam.shape[1]:
+        raise ValueError('Beam field maps have different shapes!')
+
+    cdef field_map sc_map = _make_field_map(efx_sc, efy_sc, bias_x_sc, bias_y_sc, dx_sc, dy_sc)
+    cdef field_map beam_map = _make_field_map(efx_beam, efy_beam, bias_x_beam, bias_y_beam, dx_beam, dy_beam)
+
+    cdef double* B_field_data = <double*>B_field.data
+    cdef double* B_skew_data = <double*>B_skew.data
+    cdef double* xn1_data =  <double*>xn1.data
+    cdef double* yn1_data =  <double*>yn1.data
+    cdef double* zn1_data =  <double*>zn1.data
+    cdef double* vxn1_data =  <double*>vxn1.data
+    cdef double* vyn1_data =  <double*>vyn1.data
+    cdef double* vzn1_data =  <double*>vzn1.data
+
+    # C arguments, the GIL is released during the push
+    cdef int c_N_sub_steps = N_sub_steps
+    cdef double c_Dtt = Dtt
+    cdef int c_reinterp_at_substeps = reinterp_at_substeps
+    cdef int c_flag_beam = flag_beam
+    cdef double c_fact_beam = fact_beam
+    cdef double c_B0x = B0x
+    cdef double c_B0y = B0y
+    cdef double c_B0z = B0z
+    cdef int c_custom_B = custom_B
+    cdef int N_mp = len(xn1)
+    cdef int N_multipoles = len(B_field)
+    cdef double c_charge = charge
+    cdef double c_mass = mass
+    cdef int c_num_threads = num_threads
+
+    with nogil:
+        boris_c_fused(c_N_sub_steps, c_Dtt, c_reinterp_at_substeps,
+              B_field_data, B_skew_data,
+              xn1_data, yn1_data,  zn1_data,
+              vxn1_data, vyn1_data, vzn1_data,
+              sc_map, c_flag_beam, beam_map, c_fact_beam,
+              c_B0x, c_B0y, c_B0z, c_custom_B,
+              N_mp, N_multipoles,
+              c_charge, c_mass, c_num_threads)
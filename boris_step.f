@@ -12,6 +12,7 @@ Cf2py intent(in) Dtt
 Cf2py intent(inout) xn1
 Cf2py intent(inout) yn1
 Cf2py intent(inout) zn1
+Cf2py threadsafe
  
 Cf2py intent(inout) vxn1
 Cf2py intent(inout) vyn1
@@ -54,6 +54,8 @@
 
 
 from . import init as init
+from . import step_profiler as stprof
+from . import rng_streams as rngs
 import pickle
 import numpy as np
 import os
@@ -68,6 +70,7 @@ class BuildupSimulation(object):
         skip_pyeclsaver=False,
         ignore_kwargs=[],
         spacech_ele=None,
+        comm=None,
         **kwargs
     ):
 
@@ -90,6 +93,7 @@ class BuildupSimulation(object):
             skip_pyeclsaver=skip_pyeclsaver,
             skip_spacech_ele=skip_spacech_ele,
             spacech_ele=spacech_ele,
+            comm=comm,
             ignore_kwargs=ignore_kwargs,
             **kwargs
         )
@@ -107,9 +111,37 @@ class BuildupSimulation(object):
         self.flag_em_tracking = spacech_ele.flag_em_tracking
         self.cross_ion = cross_ion
 
+        # Particle-parallel MPI mode: the MPs are split over the ranks of
+        # comm and the charge density is combined at each field solve
+        self.comm = comm
+        if comm is not None and spacech_ele is not None:
+            spacech_ele.comm = comm
+
         self.flag_reinterp_fields_at_substeps = flag_reinterp_fields_at_substeps
         print(f"Reinterp fields at substeps: {self.flag_reinterp_fields_at_substeps}")
 
+        self.flag_fused_push_gather = config_dict["flag_fused_push_gather"]
+        if self.flag_fused_push_gather:
+            self._check_fused_push_gather()
+        print(f"Fused field gather and push: {self.flag_fused_push_gather}")
+
+        if config_dict["flag_step_profiler"]:
+            self.step_profiler = stprof.step_profiler(
+                cloud_names=[cloud.name for cloud in cloud_list],
+                jsonl_file=config_dict["step_profiler_jsonl_file"],
+            )
+        else:
+            self.step_profiler = None
+
+        # Thread pool stepping the clouds in parallel, each cloud drawing
+        # from its own random stream
+        if config_dict["N_threads_clouds"] > 1:
+            self._init_cloud_threads(
+                config_dict["N_threads_clouds"], config_dict["cloud_rng_seed"]
+            )
+        else:
+            self.cloud_thread_pool = None
+
         # Checking if there are saved checkpoints
         if self.checkpoint_folder is not None:
             if os.path.isdir(self.checkpoint_folder):
@@ -180,49 +212,183 @@ class BuildupSimulation(object):
             t_curr=beamtim.tt_curr
         )
 
-        # Loop over clouds: gather fields, move, generate new MPs
-        for i_cloud, cloud in enumerate(self.cloud_list):
-
-            ## Save position before motion step
-            old_pos = cloud.MP_e.get_positions()
-
-            ## Motion
-            ## (external B field, beam and cloud fields are taken
-            ## into account)
-            self._cloud_motion(
-                cloud,
-                beamtim,
-                Dt_substep_custom,
-                N_sub_steps_custom,
-                kick_mode_for_beam_field,
-                force_reinterp_fields_at_substeps,
-            )
-
-            ## Impacts: backtracking and secondary emission
-            cloud.MP_e = cloud.impact_man.backtrack_and_second_emiss(
-                old_pos, cloud.MP_e, beamtim.tt_curr
-            )
-
-            ## Evolve SEY module (e.g. charge decay for insulators
-            cloud.impact_man.sey_mod.SEY_model_evol(Dt=beamtim.Dt_curr)
+        prof = self.step_profiler
+        if prof is not None:
+            t0 = prof.tic()
+        else:
+            t0 = None
 
-            ## Beam-gas ionization and photoemission
-            self._primary_generation(cloud, beamtim)
+        # Loop over clouds: gather fields, move, generate new MPs
+        step_args = (
+            beamtim,
+            Dt_substep_custom,
+            N_sub_steps_custom,
+            kick_mode_for_beam_field,
+            force_reinterp_fields_at_substeps,
+        )
+        if self.cloud_thread_pool is not None:
+            futures = [
+                self.cloud_thread_pool.submit(
+                    self._cloud_step_in_thread, i_cloud, cloud, step_args
+                )
+                for i_cloud, cloud in enumerate(self.cloud_list)
+            ]
+            for future in futures:
+                future.result()
+            if prof is not None:
+                t0 = prof.tic()
+        else:
+            for i_cloud, cloud in enumerate(self.cloud_list):
+                t0 = self._cloud_step(i_cloud, cloud, step_args, t0)
 
         ## Cross_ionization
         if self.cross_ion is not None:
             self.cross_ion.generate(Dt=beamtim.Dt_curr, cloud_list=self.cloud_list)
+            if prof is not None:
+                t0 = prof.toc("cross_ion", -1, t0)
 
         ## Compute space charge field (PIC: scatter and solve)
         self._recompute_cloud_spacecharge(
             beamtim, flag_recompute_space_charge, force_recompute_space_charge
         )
+        if prof is not None:
+            t0 = prof.toc("spacecharge", -1, t0)
+            prof.end_step(self.cloud_list)
+            # The counters of the passage are closed here to be saved
+            # in the output of this step
+            if beamtim.flag_new_bunch_pass:
+                prof.end_pass(beamtim)
+                t0 = prof.tic()
 
         ## Saving output
         self._save_output_data(beamtim)
+        if prof is not None:
+            t0 = prof.toc("save_output", -1, t0)
 
         ## Cleaning and regeneration
         self._MP_cleaning_and_regenerations(beamtim, skip_MP_cleaning, skip_MP_regen)
+        if prof is not None:
+            prof.toc("cleaning", -1, t0)
+
+    def _cloud_step(self, i_cloud, cloud, step_args, t0=None):
+        # Phases of the time step involving only this cloud (they read the
+        # fields of the last space charge solve and can run in parallel)
+        (
+            beamtim,
+            Dt_substep_custom,
+            N_sub_steps_custom,
+            kick_mode_for_beam_field,
+            force_reinterp_fields_at_substeps,
+        ) = step_args
+        prof = self.step_profiler
+
+        ## Save position before motion step
+        old_pos = cloud.MP_e.get_positions()
+
+        ## Motion
+        ## (external B field, beam and cloud fields are taken
+        ## into account)
+        self._cloud_motion(
+            cloud,
+            beamtim,
+            Dt_substep_custom,
+            N_sub_steps_custom,
+            kick_mode_for_beam_field,
+            force_reinterp_fields_at_substeps,
+        )
+        if prof is not None:
+            t0 = prof.toc("cloud_motion", i_cloud, t0)
+
+        ## Impacts: backtracking and secondary emission
+        cloud.MP_e = cloud.impact_man.backtrack_and_second_emiss(
+            old_pos, cloud.MP_e, beamtim.tt_curr
+        )
+
+        ## Evolve SEY module (e.g. charge decay for insulators
+        cloud.impact_man.sey_mod.SEY_model_evol(Dt=beamtim.Dt_curr)
+        if prof is not None:
+            t0 = prof.toc("impacts", i_cloud, t0)
+
+        ## Beam-gas ionization and photoemission
+        self._primary_generation(cloud, beamtim)
+        if prof is not None:
+            t0 = prof.toc("primary_generation", i_cloud, t0)
+
+        return t0
+
+    def _cloud_step_in_thread(self, i_cloud, cloud, step_args):
+        if self.step_profiler is not None:
+            t0 = self.step_profiler.tic()
+        else:
+            t0 = None
+        with rngs.use_stream(cloud.rng_stream):
+            self._cloud_step(i_cloud, cloud, step_args, t0)
+
+    def _init_cloud_threads(self, N_threads_clouds, cloud_rng_seed):
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.comm is not None and cloud_rng_seed is not None:
+            # Different streams on the different MPI ranks
+            cloud_rng_seed = [cloud_rng_seed, self.comm.Get_rank()]
+
+        N_clouds = len(self.cloud_list)
+        for cloud, stream in zip(
+            self.cloud_list, rngs.spawn_streams(N_clouds, seed=cloud_rng_seed)
+        ):
+            cloud.rng_stream = stream
+        N_workers = min(N_threads_clouds, N_clouds)
+        self.cloud_thread_pool = ThreadPoolExecutor(max_workers=N_workers)
+        print("Clouds stepped on %d threads." % N_workers)
+
+        # The OpenMP kernels of the chamber and of the trackers run inside
+        # the pool threads: their width is divided among the workers not to
+        # oversubscribe the cores
+        objs_with_threads = [self.chamb] + [cloud.dynamics for cloud in self.cloud_list]
+        for obj in objs_with_threads:
+            num_threads = getattr(obj, "num_threads", 1)
+            if num_threads > 1:
+                obj.num_threads = max(1, num_threads // N_workers)
+                print(
+                    "%s: num_threads reduced from %d to %d"
+                    % (obj.__class__.__name__, num_threads, obj.num_threads)
+                )
+
+    def _check_fused_push_gather(self):
+        # The fused kernel interpolates bilinearly on the uniform space-charge
+        # grid and on the beam field map, with electrostatic fields only
+        if self.config_dict["track_method"] != "BorisMultipole":
+            raise ValueError(
+                """flag_fused_push_gather can be used only with track_method = 'BorisMultipole'!"""
+            )
+        if self.flag_em_tracking:
+            raise ValueError(
+                """flag_fused_push_gather cannot be used with electromagnetic tracking!"""
+            )
+        if self.flag_presence_sec_beams:
+            raise ValueError(
+                """flag_fused_push_gather cannot be used with secondary beams!"""
+            )
+        # Only the modes gathering with plain bilinear interpolation (the
+        # Shortley-Weller gather treats the cells next to the wall using the
+        # flags of the nodes inside the chamber, not done by the kernel)
+        if self.config_dict["PyPICmode"] not in [
+            "FiniteDifferences_Staircase",
+            "FFT_PEC_Boundary",
+        ]:
+            raise ValueError(
+                """flag_fused_push_gather cannot be used with PyPICmode = '%s' (only 'FiniteDifferences_Staircase' and 'FFT_PEC_Boundary' are supported)!"""
+                % self.config_dict["PyPICmode"]
+            )
+        if not hasattr(self.beamtim, "Ex_beam"):
+            raise ValueError(
+                """flag_fused_push_gather requires the beam field to be stored on a uniform map!"""
+            )
+        for cloud in self.cloud_list:
+            if not hasattr(cloud.dynamics, "step_fused_gather"):
+                raise ValueError(
+                    """flag_fused_push_gather: tracker of cloud %s does not support it!"""
+                    % cloud.name
+                )
 
     def _get_field_from_beams_at_particles(self, MP_e, beamtim):
         Ex_n_beam, Ey_n_beam = beamtim.get_beam_eletric_field(MP_e)
@@ -358,6 +524,21 @@ class BuildupSimulation(object):
             N_substeps_external = 1
             N_substeps_internal = N_substeps_curr
 
+        if self.flag_fused_push_gather and not kick_mode_for_beam_field:
+            # Field gather and push in a single compiled loop
+            if not flag_substeps:
+                Dt_substep_curr = None
+                N_substeps_curr = None
+            cloud.MP_e = cloud.dynamics.step_fused_gather(
+                cloud.MP_e,
+                self.spacech_ele,
+                beamtim,
+                Dt_substep=Dt_substep_curr,
+                N_sub_steps=N_substeps_curr,
+                flag_reinterp_at_substeps=(N_substeps_external > 1),
+            )
+            return
+
         # print(f'external {N_substeps_external}')
         # print(f'internal {N_substeps_internal}')
         for i_substep in range(N_substeps_external):
@@ -494,6 +675,7 @@ class BuildupSimulation(object):
 
         for i_cloud, new_cloud in enumerate(self.cloud_list):
             new_pyeclsaver = new_cloud.pyeclsaver
+            new_rng_stream = new_cloud.rng_stream
             self.cloud_list[i_cloud] = dict_state["cloud_list"][
                 i_cloud
             ]  # Replace new_cloud with saved cloud
@@ -502,18 +684,24 @@ class BuildupSimulation(object):
             # if reset_pyeclsaver or cloud.pyeclsaver is None:
             cloud.pyeclsaver = new_pyeclsaver
 
+            # States saved without the per-cloud random streams
+            if getattr(cloud, "rng_stream", None) is None:
+                cloud.rng_stream = new_rng_stream
+
             if force_disable_save_simulation_state:
                 cloud.pyeclsaver.flag_save_simulation_state = False
 
             if filen_main_outp is not None:
                 filen_outp_ext = filen_main_outp.split("Pyecltest")[-1]
-                filen_outp_root = cloud.pyeclsaver.filen_main_outp.split(".mat")[0]
+                filen_outp_root, filen_outp_format = os.path.splitext(
+                    cloud.pyeclsaver.filen_main_outp
+                )
                 cloud.pyeclsaver.filen_main_outp = (
-                    filen_outp_root + filen_outp_ext + ".mat"
+                    filen_outp_root + filen_outp_ext + filen_outp_format
                 )
 
         print("Restoring PyPIC LU object...")
-        self.spacech_ele.PyPICobj.build_sparse_solver()
+        self.spacech_ele.build_sparse_solver()
 
         if self.spacech_ele.flag_em_tracking:
             print("Restoring PyPIC Ax, Ay and As state objects...")
@@ -0,0 +1,151 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import numpy as np
+
+from . import geom_impact_poly_cython as gipc
+
+# Cell classes
+INSIDE = 0
+OUTSIDE = 1
+BOUNDARY = 2
+
+
+class inside_raster(object):
+    '''
+    Classification of the cells of a uniform grid covering the chamber as
+    fully inside, fully outside or crossed by the chamber boundary.
+
+    is_outside classifies particles in inside/outside cells with a single
+    lookup and applies the exact test of the chamber only to particles in
+    boundary cells. Cells are enlarged by a small margin when classified,
+    so that the result is the same as the one of the exact test for all
+    particles. The raster extends by one cell beyond the bounding box of
+    the chamber: particles out of the raster are outside the chamber.
+    '''
+
+    def __init__(self, x_min, x_max, y_min, y_max, N_cells):
+
+        # Square cells, N_cells along the largest dimension of the chamber
+        self.d_cell = max(x_max - x_min, y_max - y_min) / float(N_cells)
+        self.Nx_cells = int(np.ceil((x_max - x_min) / self.d_cell)) + 2
+        self.Ny_cells = int(np.ceil((y_max - y_min) / self.d_cell)) + 2
+        self.x0 = x_min - self.d_cell
+        self.y0 = y_min - self.d_cell
+        self.pad = 1e-6 * self.d_cell
+
+        # Cell edges
+        self.x_edges = self.x0 + self.d_cell * np.arange(self.Nx_cells + 1)
+        self.y_edges = self.y0 + self.d_cell * np.arange(self.Ny_cells + 1)
+
+        self.cell_class = np.zeros((self.Nx_cells, self.Ny_cells), dtype=np.uint8)
+
+    def classify_from_boundary(self, flag_boundary, is_outside_exact):
+        # Cells not crossed by the boundary are entirely inside or outside:
+        # they are classified with the exact test at their centre
+        x_c = 0.5 * (self.x_edges[:-1] + self.x_edges[1:])
+        y_c = 0.5 * (self.y_edges[:-1] + self.y_edges[1:])
+        xx_c, yy_c = np.meshgrid(x_c, y_c, indexing='ij')
+        flag_out_c = is_outside_exact(xx_c.ravel(), yy_c.ravel()).reshape(xx_c.shape)
+
+        self.cell_class[:] = np.where(flag_out_c, OUTSIDE, INSIDE)
+        self.cell_class[flag_boundary] = BOUNDARY
+
+    def is_outside(self, x_mp, y_mp, is_outside_exact, num_threads=1):
+        cell_class_mp = gipc.raster_lookup(x_mp, y_mp, self.cell_class, self.x0, self.y0, self.d_cell,
+                                           num_threads=num_threads)
+        flag_outside = cell_class_mp == OUTSIDE
+        ind_check = np.flatnonzero(cell_class_mp == BOUNDARY)
+        if len(ind_check) > 0:
+            flag_outside[ind_check] = is_outside_exact(
+                np.take(x_mp, ind_check), np.take(y_mp, ind_check))
+        return flag_outside
+
+    def fraction_boundary(self):
+        return np.mean(self.cell_class == BOUNDARY)
+
+
+def polygon_raster(Vx, Vy, is_outside_exact, N_cells):
+    '''
+    Raster for a (closed) polygon: cells intersected by an edge are marked
+    as boundary, the others are classified with is_outside_exact.
+    '''
+    raster = inside_raster(np.min(Vx), np.max(Vx), np.min(Vy), np.max(Vy), N_cells)
+    flag_boundary = np.zeros(raster.cell_class.shape, dtype=bool)
+
+    pad = raster.pad
+    for xa, ya, xb, yb in zip(Vx[:-1], Vy[:-1], Vx[1:], Vy[1:]):
+        # Cells overlapping the (enlarged) bounding box of the edge
+        i0, i1 = raster_cell_range(min(xa, xb) - pad, max(xa, xb) + pad, raster.x0, raster.d_cell, raster.Nx_cells)
+        j0, j1 = raster_cell_range(min(ya, yb) - pad, max(ya, yb) + pad, raster.y0, raster.d_cell, raster.Ny_cells)
+
+        # The edge crosses an (enlarged) cell if the cell corners are not
+        # all on the same side of the edge line
+        xl = raster.x_edges[i0:i1 + 1] - pad
+        xr = raster.x_edges[i0 + 1:i1 + 2] + pad
+        yl = raster.y_edges[j0:j1 + 1] - pad
+        yr = raster.y_edges[j0 + 1:j1 + 2] + pad
+        side = [((xc - xa) * (yb - ya))[:, None] - ((yc - ya) * (xb - xa))[None, :]
+                for xc in (xl, xr) for yc in (yl, yr)]
+        side_min = np.min(side, axis=0)
+        side_max = np.max(side, axis=0)
+        flag_boundary[i0:i1 + 1, j0:j1 + 1] |= (side_min <= 0.) & (side_max >= 0.)
+
+    raster.classify_from_boundary(flag_boundary, is_outside_exact)
+    return raster
+
+
+def raster_cell_range(coord_min, coord_max, coord0, d_cell, N_cells):
+    i_min = int(np.clip(np.floor((coord_min - coord0) / d_cell), 0, N_cells - 1))
+    i_max = int(np.clip(np.floor((coord_max - coord0) / d_cell), 0, N_cells - 1))
+    return i_min, i_max
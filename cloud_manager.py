@@ -66,4 +66,5 @@ class Cloud(object):
         self.phemiss = phemiss
         self.pyeclsaver = pyeclsaver
         self.rho = rho
+        self.rng_stream = None  # random stream when the clouds are stepped in parallel
 
@@ -11,6 +11,7 @@ Cf2py intent(in)  bias_x
 Cf2py intent(in)  Dx
 Cf2py intent(in)  Nxg
 Cf2py intent(inout) hist
+Cf2py threadsafe
         implicit none
 	integer  N_mp
 	real*8   x_mp(N_mp), wei_mp(N_mp)
@@ -52,3 +53,184 @@ Cf2py intent(inout) hist
 	end subroutine
 	
 	
+	subroutine compute_impact_hists(N_mp, x_mp, nel_mp, E_mp,
+     +	cos_mp, i_seg_mp, flags, bias_x, Dx, Nxg, scrub_en_th,
+     +	En_max, DEn, NEn, Dcos, Ncos, N_seg, hist_tot, hist_scrub,
+     +	hist_energ, hist_En, hist_cos, seg_nel, seg_energ,
+     +	seg_En_hist)
+Cf2py intent(in)  N_mp   
+Cf2py intent(in)  x_mp
+Cf2py intent(in)  nel_mp
+Cf2py intent(in)  E_mp
+Cf2py intent(in)  cos_mp
+Cf2py intent(in)  i_seg_mp
+Cf2py intent(in)  flags
+Cf2py intent(in)  bias_x
+Cf2py intent(in)  Dx
+Cf2py intent(in)  Nxg
+Cf2py intent(in)  scrub_en_th
+Cf2py intent(in)  En_max
+Cf2py intent(in)  DEn
+Cf2py intent(in)  NEn
+Cf2py intent(in)  Dcos
+Cf2py intent(in)  Ncos
+Cf2py intent(in)  N_seg
+Cf2py intent(inout) hist_tot
+Cf2py intent(inout) hist_scrub
+Cf2py intent(inout) hist_energ
+Cf2py intent(inout) hist_En
+Cf2py intent(inout) hist_cos
+Cf2py intent(inout) seg_nel
+Cf2py intent(inout) seg_energ
+Cf2py intent(inout) seg_En_hist
+Cf2py threadsafe
+        implicit none
+	integer  N_mp
+	real*8   x_mp(N_mp), nel_mp(N_mp)
+	real*8   E_mp(N_mp), cos_mp(N_mp)
+	integer  i_seg_mp(N_mp)
+	integer  flags(3)
+	real*8   bias_x, Dx, scrub_en_th, En_max, DEn, Dcos
+	integer  Nxg, NEn, Ncos, N_seg
+	real*8   hist_tot(Nxg), hist_scrub(Nxg), hist_energ(Nxg)
+	real*8   hist_En(NEn), hist_cos(Ncos)
+	real*8   seg_nel(N_seg), seg_energ(N_seg)
+	real*8   seg_En_hist(NEn, N_seg)
+	integer  p
+	real*8   wei, weiE, fi, hx, E_clip
+	integer  i, iE, iseg
+	logical  flag_cos, flag_seg, flag_En_seg
+
+	! All the impact histograms in a single pass over the impacts.
+	! flags = (cos angle hist., segment hist., segment energy hist.)
+	! Same interpolation as compute_hist and update_seg_impact.
+	flag_cos = flags(1).ne.0
+	flag_seg = flags(2).ne.0
+	flag_En_seg = flag_seg .and. (flags(3).ne.0)
+
+	do p=1,N_mp
+	!loop over particles
+	wei = nel_mp(p)
+	weiE = wei*E_mp(p)
+
+	! position histograms
+	fi = 1+(x_mp(p)-bias_x)/Dx
+	i = int(fi)
+	hx = fi-dble(i)
+	if (i<Nxg) then
+	hist_tot(i) = hist_tot(i) + wei*(1-hx)
+	hist_tot(i+1) = hist_tot(i+1) + wei*hx
+	if (E_mp(p)>scrub_en_th) then
+	hist_scrub(i) = hist_scrub(i) + wei*(1-hx)
+	hist_scrub(i+1) = hist_scrub(i+1) + wei*hx
+	end if
+	hist_energ(i) = hist_energ(i) + weiE*(1-hx)
+	hist_energ(i+1) = hist_energ(i+1) + weiE*hx
+	else
+	hist_tot(Nxg) = hist_tot(Nxg) + wei
+	if (E_mp(p)>scrub_en_th) then
+	hist_scrub(Nxg) = hist_scrub(Nxg) + wei
+	end if
+	hist_energ(Nxg) = hist_energ(Nxg) + weiE
+	end if
+
+	! energy spectrum (clipped at En_max)
+	E_clip = min(E_mp(p), En_max)
+	fi = 1+E_clip/DEn
+	iE = int(fi)
+	hx = fi-dble(iE)
+	if (iE<NEn) then
+	hist_En(iE) = hist_En(iE) + wei*(1-hx)
+	hist_En(iE+1) = hist_En(iE+1) + wei*hx
+	else
+	hist_En(NEn) = hist_En(NEn) + wei
+	end if
+
+	! segment histograms
+	iseg = i_seg_mp(p)+1
+	if (flag_seg.and.iseg>=1.and.iseg<=N_seg) then
+	seg_nel(iseg) = seg_nel(iseg) + wei
+	seg_energ(iseg) = seg_energ(iseg) + weiE
+	if (flag_En_seg) then
+	if (iE<NEn) then
+	seg_En_hist(iE,iseg) = seg_En_hist(iE,iseg) + wei*(1-hx)
+	seg_En_hist(iE+1,iseg) = seg_En_hist(iE+1,iseg) + wei*hx
+	else
+	seg_En_hist(NEn,iseg) = seg_En_hist(NEn,iseg) + wei
+	end if
+	end if
+	end if
+
+	! angle histogram
+	if (flag_cos) then
+	fi = 1+cos_mp(p)/Dcos
+	i = int(fi)
+	hx = fi-dble(i)
+	if (i<Ncos) then
+	hist_cos(i) = hist_cos(i) + wei*(1-hx)
+	hist_cos(i+1) = hist_cos(i+1) + wei*hx
+	else
+	hist_cos(Ncos) = hist_cos(Ncos) + wei
+	end if
+	end if
+
+	end do
+
+	end subroutine
+	
+	
+	subroutine compute_emit_hists(N_mp, x_mp, nel_mp, E_mp,
+     +	i_seg_mp, flag_seg, bias_x, Dx, Nxg, N_seg, hist_energ,
+     +	seg_energ, seg_nel_emit)
+Cf2py intent(in)  N_mp   
+Cf2py intent(in)  x_mp
+Cf2py intent(in)  nel_mp
+Cf2py intent(in)  E_mp
+Cf2py intent(in)  i_seg_mp
+Cf2py intent(in)  flag_seg
+Cf2py intent(in)  bias_x
+Cf2py intent(in)  Dx
+Cf2py intent(in)  Nxg
+Cf2py intent(in)  N_seg
+Cf2py intent(inout) hist_energ
+Cf2py intent(inout) seg_energ
+Cf2py intent(inout) seg_nel_emit
+Cf2py threadsafe
+        implicit none
+	integer  N_mp
+	real*8   x_mp(N_mp), nel_mp(N_mp), E_mp(N_mp)
+	integer  i_seg_mp(N_mp)
+	integer  flag_seg
+	real*8   bias_x, Dx
+	integer  Nxg, N_seg
+	real*8   hist_energ(Nxg)
+	real*8   seg_energ(N_seg), seg_nel_emit(N_seg)
+	integer  p
+	real*8   wei, fi, hx
+	integer  i, iseg
+
+	! Removes the energy of the emitted MPs from the energy
+	! histograms and counts them in the segment emission histogram
+	do p=1,N_mp
+	!loop over particles
+	wei = -nel_mp(p)*E_mp(p)
+
+	fi = 1+(x_mp(p)-bias_x)/Dx
+	i = int(fi)
+	hx = fi-dble(i)
+	if (i<Nxg) then
+	hist_energ(i) = hist_energ(i) + wei*(1-hx)
+	hist_energ(i+1) = hist_energ(i+1) + wei*hx
+	else
+	hist_energ(Nxg) = hist_energ(Nxg) + wei
+	end if
+
+	iseg = i_seg_mp(p)+1
+	if (flag_seg.ne.0.and.iseg>=1.and.iseg<=N_seg) then
+	seg_energ(iseg) = seg_energ(iseg) + wei
+	seg_nel_emit(iseg) = seg_nel_emit(iseg) + nel_mp(p)
+	end if
+
+	end do
+
+	end subroutine
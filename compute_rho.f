@@ -14,6 +14,7 @@ Cf2py intent(in)  Dh
 Cf2py intent(in)  Nxg
 Cf2py intent(in)  Nyg
 Cf2py intent(out) rho
+Cf2py threadsafe
         implicit none
 	integer  N_mp
 	real*8   x_mp(N_mp), y_mp(N_mp), nel_mp(N_mp)
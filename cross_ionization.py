@@ -148,7 +148,13 @@ class Ionization_Process(object):
 
 
     def generate(self, Dt, cloud_dict, mass_proj, N_proj, nel_mp_proj,
-                 x_proj, y_proj, z_proj, v_mp_proj, flag_generate=True):
+                 x_proj, y_proj, z_proj, v_mp_proj, flag_generate=True,
+                 new_mp_buffers=None):
+        """
+        Generate the products of the process. If new_mp_buffers (a dict of
+        New_MP_Buffer per product) is given, the new MPs are appended to the
+        buffers and None is returned in place of the MP info dict.
+        """
 
         E_eV_mp_proj = 0.5 * mass_proj / qe * v_mp_proj * v_mp_proj
 
@@ -169,31 +175,20 @@ class Ionization_Process(object):
                 print(('Cross-ionization process %s target density = %.2e' %(self.name, self.target_dens)))
                 self.last_reported_target_dens = self.target_dens
 
-        new_mp_info = {}
+        if new_mp_buffers is None:
+            new_mp_info = {}
+        else:
+            new_mp_info = None
 
         if self.generate_equally:
-            # Calculate average product nel_mp_ref
-            nel_mp_ref_products = 0.
-            N_products = len(self.products)
-
-            for product in self.products:
-                thiscloud_gen = cloud_dict[product]
-                MP_e_gen = thiscloud_gen.MP_e
-                nel_mp_ref_products += MP_e_gen.nel_mp_ref / N_products
-
             # Compute N_mp to add (the same for all products)
-            N_mp_per_proj_float = DN_per_proj / nel_mp_ref_products
-            N_mp_per_proj_int = np.floor(N_mp_per_proj_float)
-            rest = N_mp_per_proj_float - N_mp_per_proj_int
-            N_mp_per_proj_int = np.atleast_1d(np.int_(N_mp_per_proj_int))
-            N_mp_per_proj_int += np.atleast_1d(np.int_(rand(N_proj) < rest))
+            nel_mp_ref_products = self._nel_mp_ref_products(cloud_dict)
+            N_mp_per_proj_int = self._N_mp_per_proj(DN_per_proj / nel_mp_ref_products)
 
             N_new_MPs = np.sum(N_mp_per_proj_int)
 
         for product in self.products:
 
-            new_mp_info[product] = {}
-
             thiscloud_gen = cloud_dict[product]
             MP_e_gen = thiscloud_gen.MP_e
             mass_gen = MP_e_gen.mass
@@ -207,11 +202,7 @@ class Ionization_Process(object):
                 nel_mp_ref_gen = MP_e_gen.nel_mp_ref
 
                 # Compute N_mp to add (different for each product)
-                N_mp_per_proj_float = DN_per_proj / nel_mp_ref_gen
-                N_mp_per_proj_int = np.floor(N_mp_per_proj_float)
-                rest = N_mp_per_proj_float - N_mp_per_proj_int
-                N_mp_per_proj_int = np.atleast_1d(np.int_(N_mp_per_proj_int))
-                N_mp_per_proj_int += np.atleast_1d(np.int_(rand(N_proj) < rest))
+                N_mp_per_proj_int = self._N_mp_per_proj(DN_per_proj / nel_mp_ref_gen)
 
                 N_new_MPs = np.sum(N_mp_per_proj_int)
 
@@ -219,21 +210,11 @@ class Ionization_Process(object):
                 mask_gen = N_mp_per_proj_int > 0
                 N_mp_per_proj_int_masked = N_mp_per_proj_int[mask_gen]
 
-                nel_new_MPs_masked = np.ones(np.sum(mask_gen)) * nel_mp_ref_gen
-
-                nel_new_MPs = np.repeat(nel_new_MPs_masked, N_mp_per_proj_int_masked)
-
-                x_masked = x_proj[mask_gen]
-                y_masked = y_proj[mask_gen]
-                z_masked = z_proj[mask_gen]
+                nel_new_MPs = np.ones(N_new_MPs) * nel_mp_ref_gen
 
-                x_new_MPs = np.repeat(x_masked, N_mp_per_proj_int_masked)
-                y_new_MPs = np.repeat(y_masked, N_mp_per_proj_int_masked)
-                z_new_MPs = np.repeat(z_masked, N_mp_per_proj_int_masked)
-
-                vx_new_MPs = np.zeros(N_new_MPs)
-                vy_new_MPs = np.zeros(N_new_MPs)
-                vz_new_MPs = np.zeros(N_new_MPs)
+                x_new_MPs = np.repeat(x_proj[mask_gen], N_mp_per_proj_int_masked)
+                y_new_MPs = np.repeat(y_proj[mask_gen], N_mp_per_proj_int_masked)
+                z_new_MPs = np.repeat(z_proj[mask_gen], N_mp_per_proj_int_masked)
 
                 vx_new_MPs = v0_gen * (rand(N_new_MPs) - 0.5)
                 vy_new_MPs = v0_gen * (rand(N_new_MPs) - 0.5)
@@ -248,6 +229,13 @@ class Ionization_Process(object):
                 vy_new_MPs = np.array([])
                 vz_new_MPs = np.array([])
 
+            if new_mp_buffers is not None:
+                new_mp_buffers[product].append(N_new_MPs, nel_new_MPs,
+                                               x_new_MPs, y_new_MPs, z_new_MPs,
+                                               vx_new_MPs, vy_new_MPs, vz_new_MPs)
+                continue
+
+            new_mp_info[product] = {}
             new_mp_info[product]['N_new_MPs'] = N_new_MPs
             new_mp_info[product]['nel_new_MPs'] = nel_new_MPs
             new_mp_info[product]['x_new_MPs'] = x_new_MPs
@@ -260,6 +248,65 @@ class Ionization_Process(object):
         return new_mp_info, np.sum(DN_per_proj)
 
 
+    def sample_N_new_MPs(self, Dt, cloud_dict, energy_eV_proj, v_mp_proj, nel_mp_proj, n_rep):
+        """
+        Number of MPs that generate would produce for each product from groups
+        of n_rep identical projectiles, one group per element of
+        energy_eV_proj. Returns a dict product: (N_new_MPs, nel_mp_ref_gen).
+        The target density is not modified.
+        """
+
+        sigma_mp_proj = self.get_sigma(energy_eV_proj=energy_eV_proj)
+        DN_per_proj = sigma_mp_proj * self.target_dens * v_mp_proj * Dt * nel_mp_proj
+
+        N_new_MPs_dict = {}
+
+        if self.generate_equally:
+            nel_mp_ref_products = self._nel_mp_ref_products(cloud_dict)
+            N_new_MPs = self._N_mp_per_group(DN_per_proj / nel_mp_ref_products, n_rep)
+
+        for product in self.products:
+            if self.generate_equally:
+                nel_mp_ref_gen = nel_mp_ref_products
+            else:
+                nel_mp_ref_gen = cloud_dict[product].MP_e.nel_mp_ref
+                N_new_MPs = self._N_mp_per_group(DN_per_proj / nel_mp_ref_gen, n_rep)
+
+            N_new_MPs_dict[product] = (N_new_MPs, nel_mp_ref_gen)
+
+        return N_new_MPs_dict
+
+
+    def _nel_mp_ref_products(self, cloud_dict):
+        # Average product nel_mp_ref
+        nel_mp_ref_products = 0.
+        N_products = len(self.products)
+
+        for product in self.products:
+            nel_mp_ref_products += cloud_dict[product].MP_e.nel_mp_ref / N_products
+
+        return nel_mp_ref_products
+
+
+    def _N_mp_per_proj(self, N_mp_per_proj_float):
+        # Integer number of MPs per projectile, the rest is rounded randomly
+        N_mp_per_proj_int = np.floor(N_mp_per_proj_float)
+        rest = N_mp_per_proj_float - N_mp_per_proj_int
+        N_mp_per_proj_int = np.atleast_1d(np.int_(N_mp_per_proj_int))
+        N_mp_per_proj_int += np.atleast_1d(np.int_(rand(len(N_mp_per_proj_int)) < rest))
+
+        return N_mp_per_proj_int
+
+
+    def _N_mp_per_group(self, N_mp_per_proj_float, n_rep):
+        # Same as summing _N_mp_per_proj over n_rep identical projectiles:
+        # the random roundings add up to a binomial variable
+        N_mp_per_proj_int = np.floor(N_mp_per_proj_float)
+        rest = N_mp_per_proj_float - N_mp_per_proj_int
+
+        return n_rep * np.int_(N_mp_per_proj_int) + np.random.binomial(n_rep, rest)
+
+
     def get_sigma(self, energy_eV_proj):
 
         sigma_cm2_proj = energy_eV_proj * 0.
@@ -292,6 +339,46 @@ class Ionization_Process(object):
 
 
 
+class New_MP_Buffer(object):
+    """
+    Scratch storage for the MPs generated for one product in a time step.
+    It grows geometrically and is reused across time steps.
+    """
+
+    fields = ['nel_new_MPs', 'x_new_MPs', 'y_new_MPs', 'z_new_MPs',
+              'vx_new_MPs', 'vy_new_MPs', 'vz_new_MPs']
+
+    def __init__(self, capacity=1000, buffer_growth_factor=2.):
+        self.buffer_growth_factor = buffer_growth_factor
+        self.buffer = np.empty((len(self.fields), capacity))
+        self.N_new_MPs = 0
+
+    def reset(self):
+        self.N_new_MPs = 0
+
+    def append(self, N_new_MPs, nel, x, y, z, vx, vy, vz):
+        if N_new_MPs == 0:
+            return
+
+        N_old = self.N_new_MPs
+        N_new = N_old + N_new_MPs
+        capacity = self.buffer.shape[1]
+        if N_new > capacity:
+            new_capacity = max(N_new, int(self.buffer_growth_factor * capacity))
+            new_buffer = np.empty((len(self.fields), new_capacity))
+            new_buffer[:, :N_old] = self.buffer[:, :N_old]
+            self.buffer = new_buffer
+
+        for i_field, values in enumerate([nel, x, y, z, vx, vy, vz]):
+            self.buffer[i_field, N_old:N_new] = values
+        self.N_new_MPs = N_new
+
+    def __getitem__(self, field):
+        # View on the MPs stored since the last reset
+        return self.buffer[self.fields.index(field), :self.N_new_MPs]
+
+
+
 class Cross_Ionization(object):
 
     def __init__(self, pyecl_input_folder, cross_ion_definitions, cloud_list,
@@ -329,6 +416,11 @@ class Cross_Ionization(object):
                     if product not in self.products:
                         self.products.append(product)
 
+        # Buffers for the generated MPs, reused at each time step
+        self.new_mp_buffers = {}
+        for product in self.products:
+            self.new_mp_buffers[product] = New_MP_Buffer()
+
         # Extract sigma curves for consistency checks
         self._extract_sigma(Dt=Dt_test, cloud_dict=cloud_dict,
                             n_rep=n_rep_test, energy_eV=energy_eV_test)
@@ -350,7 +442,8 @@ class Cross_Ionization(object):
         for cloud in cloud_list:
             cloud_dict.update({cloud.name : cloud})
 
-        new_mps_to_gen = self._init_new_mp_dict(self.products)
+        for product in self.products:
+            self.new_mp_buffers[product].reset()
 
         for projectile in list(self.projectiles_dict.keys()):
             thiscloud = cloud_dict[projectile]
@@ -376,7 +469,7 @@ class Cross_Ionization(object):
 
                 for process in self.projectiles_dict[projectile]:
 
-                    mp_info_from_proc, DN_proj = process.generate(Dt=Dt,
+                    _, DN_proj = process.generate(Dt=Dt,
                                                          cloud_dict=cloud_dict,
                                                          mass_proj=mass,
                                                          N_proj=N_mp,
@@ -384,21 +477,20 @@ class Cross_Ionization(object):
                                                          x_proj=x_mp,
                                                          y_proj=y_mp,
                                                          z_proj=z_mp,
-                                                         v_mp_proj=v_mp)
+                                                         v_mp_proj=v_mp,
+                                                         new_mp_buffers=self.new_mp_buffers)
 
                     for product in process.products:
-                        self._add_to_mp_dict(new_mps_to_gen[product],
-                                             mp_info_from_proc[product])
                         self.DN_proj[product] += DN_proj
 
         t_last_impact = -1
         for thiscloud in cloud_list:
             if thiscloud.name in self.products:
                 MP_e = thiscloud.MP_e
-                new_mps = new_mps_to_gen[thiscloud.name]
+                new_mps = self.new_mp_buffers[thiscloud.name]
 
-                if new_mps['N_new_MPs'] > 0:
-                    MP_e.add_new_MPs(new_mps['N_new_MPs'],
+                if new_mps.N_new_MPs > 0:
+                    MP_e.add_new_MPs(new_mps.N_new_MPs,
                                      new_mps['nel_new_MPs'],
                                      new_mps['x_new_MPs'],
                                      new_mps['y_new_MPs'],
@@ -410,7 +502,7 @@ class Cross_Ionization(object):
 
                 # Add to saved data
                 self.nel_cross_ion[thiscloud.name] += np.sum(new_mps['nel_new_MPs'])
-                self.N_mp_cross_ion[thiscloud.name] += new_mps['N_new_MPs']
+                self.N_mp_cross_ion[thiscloud.name] += new_mps.N_new_MPs
             else:
                 self.nel_cross_ion[thiscloud.name] += 0.
                 self.N_mp_cross_ion[thiscloud.name] += 0
@@ -430,22 +522,16 @@ class Cross_Ionization(object):
 
     def _extract_sigma(self, Dt, cloud_dict, n_rep, energy_eV):
 
-        v0 = 0.
-        N_ene = len(energy_eV)
-
-        N_mp = n_rep
-
-        x_mp = np.zeros(n_rep)
-        y_mp = np.zeros(n_rep)
-        z_mp = np.zeros(n_rep)
+        # All the test energies are sampled at once, with n_rep projectiles each
 
         for projectile in list(self.projectiles_dict.keys()):
 
             thiscloud = cloud_dict[projectile]
             mass = thiscloud.MP_e.mass
-            nel_mp = np.ones(n_rep) * thiscloud.MP_e.nel_mp_ref
+            nel_mp_ref = thiscloud.MP_e.nel_mp_ref
 
             v_test = np.sqrt(2 * energy_eV * qe / mass)
+            mask_v = v_test > 0
 
             for process in self.projectiles_dict[projectile]:
 
@@ -455,64 +541,25 @@ class Cross_Ionization(object):
 
                     save_dict = {}
                     save_dict['energy_eV'] = energy_eV
-                    save_dict['sigma_cm2_interp'] = np.zeros(len(energy_eV))
-                    for product in process.products:
-                        this_sigma_name = 'sigma_cm2_sampled_%s' %(product)
-                        save_dict[this_sigma_name] = np.zeros(len(energy_eV))
 
-                    for i_ene, energy in enumerate(energy_eV):
+                    # Test process.get_sigma()
+                    save_dict['sigma_cm2_interp'] = process.get_sigma(energy_eV) * 1e4
 
-                        if np.mod(i_ene, N_ene / 10) == 0:
-                            print(('Extracting sigma %.0f'%(float(i_ene) / float(N_ene) * 100) + """%"""))
+                    # Test the MP generation of process.generate()
+                    N_new_MPs_dict = process.sample_N_new_MPs(Dt, cloud_dict=cloud_dict,
+                                                              energy_eV_proj=energy_eV,
+                                                              v_mp_proj=v_test,
+                                                              nel_mp_proj=nel_mp_ref,
+                                                              n_rep=n_rep)
 
-                        # Test process.get_sigma()
-                        sigma_m2 = process.get_sigma(np.array([energy]))
-                        save_dict['sigma_cm2_interp'][i_ene] = sigma_m2 * 1e4
-
-                        # Test process.generate()
-                        v_ene = v_test[i_ene]
-                        v_mp = v_ene * np.ones(n_rep)
-
-                        mp_info_from_proc, _ = process.generate(Dt, cloud_dict=cloud_dict,
-                                                             mass_proj=mass, N_proj=N_mp,
-                                                             nel_mp_proj=nel_mp, x_proj=x_mp,
-                                                             y_proj=y_mp, z_proj=z_mp,
-                                                             v_mp_proj=v_mp, flag_generate=False)
-
-                        for product in list(mp_info_from_proc.keys()):
-                            DN_gen = np.sum(mp_info_from_proc[product]['nel_new_MPs'])
-                            if v_ene > 0:
-                                sigma_m2_est = DN_gen / process.target_dens / v_ene / Dt / np.sum(nel_mp)
-                            else:
-                                sigma_m2_est = 0.
-                            this_sigma_name = 'sigma_cm2_sampled_%s' %(product)
-                            save_dict[this_sigma_name][i_ene] = sigma_m2_est * 1e4
+                    for product in process.products:
+                        N_new_MPs, nel_mp_ref_gen = N_new_MPs_dict[product]
+                        DN_gen = N_new_MPs * nel_mp_ref_gen
+                        sigma_m2_est = np.zeros(len(energy_eV))
+                        sigma_m2_est[mask_v] = (DN_gen[mask_v] / process.target_dens / v_test[mask_v]
+                                                / Dt / (n_rep * nel_mp_ref))
+                        this_sigma_name = 'sigma_cm2_sampled_%s' %(product)
+                        save_dict[this_sigma_name] = sigma_m2_est * 1e4
 
                     sio.savemat(process.extract_sigma_path, save_dict, oned_as='row')
                     print(('Saved extracted cross section as %s' %process.extract_sigma_path))
-
-
-    def _init_new_mp_dict(self, products):
-        # Init new MP dictionary for products
-        new_mp_dict = {}
-        mp_dict_keys = ['N_new_MPs', 'nel_new_MPs', 'x_new_MPs', 'y_new_MPs',
-                        'z_new_MPs', 'vx_new_MPs', 'vy_new_MPs', 'vz_new_MPs']
-        for product in products:
-            new_mp_dict[product] = {}
-            for key in mp_dict_keys:
-                if key == 'N_new_MPs':
-                    new_mp_dict[product][key] = 0
-                else:
-                    new_mp_dict[product][key] = np.array([])
-
-        return new_mp_dict
-
-
-    def _add_to_mp_dict(self, mp_dict, dict_to_add):
-        #sum_dict = {}
-        for key in list(mp_dict.keys()):
-            if key == 'N_new_MPs':
-                mp_dict[key] += dict_to_add['N_new_MPs']
-            else:
-                mp_dict[key] = np.append(mp_dict[key], dict_to_add[key])
-
@@ -64,10 +64,12 @@ parameters_dict = {
             'N_mp_after_soft_regen': None,
             'N_mp_async_regen': None,
             'N_mp_after_async_regen': None,
+            'flag_shrink_MP_buffer': False,
             'stopfile': 'stop',
 
             # Saving settings
             'filen_main_outp': 'Pyecltest.mat',
+            'output_format': 'mat',
             'save_only': None,
             'flag_movie': 0,
             'flag_sc_movie': 0,
@@ -98,8 +100,15 @@ parameters_dict = {
 
             'Dh_electric_energy': None,
             'sparse_solver': 'scipy_slu',
+            'flag_cache_sparse_solver': False,
+            'sparse_solver_cache_dir': None,
             'PyPICmode'    : 'FiniteDifferences_ShortleyWeller',
             'flag_reinterp_fields_at_substeps': False,
+            'flag_fused_push_gather': False,
+
+            # Cache for computed beam fields
+            'beam_field_cache_dir': None,
+            'beam_field_cache_max_size_MB': 1000.,
 
             # Multigrid parameters
             'f_telescope': None,
@@ -118,12 +127,32 @@ parameters_dict = {
             'pass_by_pass_custom_observables': None,
             'save_once_custom_observables': None,
 
+            # Per-stage timing of the time step, saved pass by pass and
+            # optionally streamed to a JSON-lines file
+            'flag_step_profiler': False,
+            'step_profiler_jsonl_file': None,
+
+            # Seed of the random streams of the ranks in MPI mode (drawn by
+            # rank 0 if None)
+            'mpi_seed': None,
+
+            # Per-cloud phases of the time step run on a thread pool, each
+            # cloud with its own random stream (seeded from the global numpy
+            # generator if cloud_rng_seed is None). N_threads_chamber and
+            # N_threads_tracking are divided among the pool threads
+            'N_threads_clouds': 1,
+            'cloud_rng_seed': None,
+
             # Energy extraction parameters
             'extract_ene_dist': False,
             'ene_dist_test_E_impact_eV': None,
             'Nbin_extract_ene': None,
             'factor_ene_dist_max': None,
 
+            # Folder where the extracted SEY curves and energy distributions
+            # are cached (None disables the cache)
+            'sey_test_cache_dir': None,
+
             'flag_em_tracking' : False,
 
             # Cross-ionization
@@ -156,6 +185,7 @@ parameters_dict = {
             'N_sub_steps': 1,
             'B_multip': [],
             'B_skew': None,
+            'N_threads_tracking': 1,
 
             # Optics
             'betafx': None,
@@ -209,6 +239,10 @@ parameters_dict = {
             'y_min_init_unif_edens' : None,
 
             'flag_assume_convex': True,
+            'N_threads_chamber': 1,
+            'N_bins_edge_index': None,
+            'N_cells_inside_raster': None,
+            'edge_index_cache_dir': None,
         },
     },
     'beam_beam': {
@@ -249,6 +283,7 @@ parameters_dict = {
             'Nx': None,
             'Ny': None,
             'nimag': None,
+            'N_processes_beam_field': 1,
 
             # if compute_FDSW_multigrid
             'Dh_beam_field': None,
@@ -357,6 +392,7 @@ parameters_dict = {
             'N_mp_after_soft_regen': (),
             'N_mp_async_regen': (),
             'N_mp_after_async_regen': (),
+            'flag_shrink_MP_buffer': (),
 
             # Tracking and magnetic field
             'N_sub_steps': (),
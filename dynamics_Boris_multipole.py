@@ -52,13 +52,13 @@
 
 import math
 import numpy as np
-from .boris_cython import boris_step_multipole
+from .boris_cython import boris_step_multipole, boris_step_multipole_fused
 
 
 class pusher_Boris_multipole():
 
     def __init__(self, Dt, N_sub_steps=1, B_multip=None, B_skew=None,
-        B0x=None, B0y=None, B0z=None):
+        B0x=None, B0y=None, B0z=None, num_threads=1):
 
         self.N_sub_steps = N_sub_steps
         self.Dt = Dt
@@ -83,7 +83,14 @@ class pusher_Boris_multipole():
         self.B0x = B0x
         self.B0y = B0y
         self.B0z = B0z
+
+        if int(num_threads) != num_threads or num_threads < 1:
+            raise ValueError('num_threads must be a positive integer!')
+        self.num_threads = int(num_threads)
+
         print("Tracker: Boris multipole")
+        if self.num_threads > 1:
+            print("Tracker threads: %d" % self.num_threads)
 
         print("N_subst_init=%d" % self.N_sub_steps)
 
@@ -137,6 +144,50 @@ class pusher_Boris_multipole():
 
             boris_step_multipole(N_sub_steps, Dt_substep, self.B_field, self.B_field_skew,
                          xn1, yn1, zn1, vxn1, vyn1, vzn1,
-                         Ex_n, Ey_n, Bx_arr, By_arr, Bz_arr, custom_B, MP_e.charge, MP_e.mass)
+                         Ex_n, Ey_n, Bx_arr, By_arr, Bz_arr, custom_B, MP_e.charge, MP_e.mass,
+                         num_threads=self.num_threads)
+
+        return MP_e
+
+    def step_fused_gather(self, MP_e, spacech_ele, beamtim,
+        Dt_substep=None, N_sub_steps=None, flag_reinterp_at_substeps=False):
+        """Interpolate space-charge and beam electric fields and push the
+        particles in a single compiled loop (electrostatic tracking only).
+        The beam field is taken from the precomputed map of beamtim.
+        """
+
+        if Dt_substep is None:
+            Dt_substep = self.Dtt
+        if N_sub_steps is None:
+            N_sub_steps = self.N_sub_steps
+
+        custom_B = 0
+        B0 = [0., 0., 0.]
+        for ii, B0_comp in enumerate([self.B0x, self.B0y, self.B0z]):
+            if B0_comp is not None:
+                B0[ii] = float(B0_comp)
+                custom_B = 1
+
+        if MP_e.N_mp > 0:
+
+            xn1 = MP_e.x_mp[0:MP_e.N_mp]
+            yn1 = MP_e.y_mp[0:MP_e.N_mp]
+            zn1 = MP_e.z_mp[0:MP_e.N_mp]
+            vxn1 = MP_e.vx_mp[0:MP_e.N_mp]
+            vyn1 = MP_e.vy_mp[0:MP_e.N_mp]
+            vzn1 = MP_e.vz_mp[0:MP_e.N_mp]
+
+            flag_beam = int(beamtim.lam_t_curr > beamtim.lam_th_beam_field)
+            fact_beam = beamtim.beam_charge * beamtim.lam_t_curr
+
+            boris_step_multipole_fused(N_sub_steps, Dt_substep, int(flag_reinterp_at_substeps),
+                         self.B_field, self.B_field_skew,
+                         xn1, yn1, zn1, vxn1, vyn1, vzn1,
+                         spacech_ele.efx, spacech_ele.efy,
+                         spacech_ele.bias_x, spacech_ele.bias_y, spacech_ele.Dh, spacech_ele.Dh,
+                         flag_beam, beamtim.Ex_beam, beamtim.Ey_beam,
+                         beamtim.xmin_beam, beamtim.ymin_beam, beamtim.dx_beam, beamtim.dy_beam, fact_beam,
+                         B0[0], B0[1], B0[2], custom_B, MP_e.charge, MP_e.mass,
+                         num_threads=self.num_threads)
 
         return MP_e
@@ -53,7 +53,7 @@
 
 import time
 import numpy as np
-import numpy.random as random
+from . import rng_streams as random
 from scipy.constants import e as qe
 import scipy.stats as stats
 
@@ -17,6 +17,7 @@ Cf2py intent(in)  XX
 Cf2py intent(in)  YY                                      
 Cf2py intent(out) WX   
 Cf2py intent(out) WY   
+Cf2py threadsafe
 *----------------------------------------------------------------------*   
 * Purpose:                                                             *   
 *   Modification of WWERF, double precision complex error function,    *   
@@ -51,8 +51,8 @@
 #-End-preamble---------------------------------------------------------
 
 
-from numpy.random import rand
-from numpy.random import randn
+from .rng_streams import rand
+from .rng_streams import randn
 from numpy import *
 from scipy.constants import c, k, e
 
@@ -115,6 +115,8 @@ class residual_gas_ionization:
                 flag_np = self.chamb.is_outside(x_temp, y_temp)  # (((x_temp/x_aper)**2 + (y_temp/y_aper)**2)>=1)
                 Nout = int(sum(flag_np))
 
+            MP_e.ensure_capacity(MP_e.N_mp + Nint_new_MP)
+
             MP_e.x_mp[ MP_e.N_mp: MP_e.N_mp + Nint_new_MP] = x_temp # Be careful to the indexing when translating to python
             MP_e.y_mp[ MP_e.N_mp: MP_e.N_mp + Nint_new_MP] = y_temp
             MP_e.z_mp[ MP_e.N_mp: MP_e.N_mp + Nint_new_MP] = 0. # randn(Nint_new_MP,1)
@@ -52,7 +52,7 @@
 
 
 import numpy as np
-import numpy.random as random
+from . import rng_streams as random
 
 import scipy.io as sio
 from scipy.constants import c
@@ -51,9 +51,14 @@
 #-End-preamble---------------------------------------------------------
 
 
+import threading
 from numpy import sum, sqrt, arctan2, sin, cos, isnan, pi
 
 
+# The impact counters are shared by the clouds, which can be stepped on parallel threads
+_counters_lock = threading.Lock()
+
+
 class ellip_cham_geom_object:
     def __init__(self, x_aper, y_aper, flag_verbose_file=True):
 
@@ -80,7 +85,8 @@ class ellip_cham_geom_object:
 
     def impact_point_and_normal(self, x_in, y_in, z_in, x_out, y_out, z_out, resc_fac=0.99, flag_robust=True):
 
-        self.N_mp_impact = self.N_mp_impact + len(x_in)
+        with _counters_lock:
+            self.N_mp_impact = self.N_mp_impact + len(x_in)
 
         a = self.x_aper
         b = self.y_aper
@@ -134,7 +140,8 @@ class ellip_cham_geom_object:
             flag_impact = (((x_int / a)**2 + (y_int / b)**2) > 1)
 
             if flag_impact.any():
-                self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
+                with _counters_lock:
+                    self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
                 ntrials = 10
                 while (sum(flag_impact) > 0 and ntrials > 0):
                     t0[flag_impact] = 0.9 * t0[flag_impact]
@@ -53,9 +53,14 @@
 
 from numpy import squeeze, array, diff, max, sum, sqrt,\
     logical_and, logical_or, ones, zeros, take, arctan2, sin, cos
+import threading
 import scipy.io as sio
 
 
+# The impact counters are shared by the clouds, which can be stepped on parallel threads
+_counters_lock = threading.Lock()
+
+
 class polyg_cham_geom_object:
     def __init__(self, filename_chm, flag_non_unif_sey,
                  flag_verbose_file=False, flag_verbose_stdout=False):
@@ -151,7 +156,8 @@ class polyg_cham_geom_object:
         i_found = array(N_impacts * [-1])
         mask_found = array(N_impacts * [False])
 
-        self.N_mp_impact = self.N_mp_impact + N_impacts
+        with _counters_lock:
+            self.N_mp_impact = self.N_mp_impact + N_impacts
 
         for ii in range(self.N_edg):
             t_curr = (self.Nx[ii] * (self.Vx[ii] - x_in) + self.Ny[ii] * (self.Vy[ii] - y_in)) / \
@@ -208,7 +214,8 @@ class polyg_cham_geom_object:
             x_out_error = x_out[mask_not_found]
             y_out_error = y_out[mask_not_found]
             N_errors = len(x_in_error)
-            self.N_mp_corrected = self.N_mp_corrected + N_errors
+            with _counters_lock:
+                self.N_mp_corrected = self.N_mp_corrected + N_errors
 
             if self.flag_verbose_stdout:
                 print("""Reporting backtrack error of kind 1: no impact found""")
@@ -227,7 +234,8 @@ class polyg_cham_geom_object:
         if flag_robust:
             flag_impact = self.is_outside(x_int, y_int)
             if flag_impact.any():
-                self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
+                with _counters_lock:
+                    self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
                 x_int[flag_impact] = x_in[flag_impact]
                 y_int[flag_impact] = y_in[flag_impact]
                 x_in_error = x_in[flag_impact]
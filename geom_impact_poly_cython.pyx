@@ -2,45 +2,48 @@ import numpy as np
 cimport numpy as np
 cimport cython
 
-#~ from cython.parallel import parallel, prange
+from cython.parallel import prange
 
-from libc.math cimport sqrt
+from libc.math cimport sqrt, floor, isnan
 
-ctypedef np.float_t DOUBLE_t
-ctypedef np.int_t INT_t
+# All loops are over independent particles: results do not depend on num_threads
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cpdef impact_point_and_normal(double[::1] x_in, double[::1] y_in, double[::1] z_in,
-                              double[::1] x_out, double[::1] y_out, double[::1] z_out,
-                              double[::1] Vx, double[::1] Vy,
-                              double[::1] Nx, double[::1] Ny, int N_edg, double resc_fac):
+@cython.cdivision(True)
+cpdef impact_point_and_normal(const double[:] x_in, const double[:] y_in, const double[:] z_in,
+                              const double[:] x_out, const double[:] y_out, const double[:] z_out,
+                              const double[::1] Vx, const double[::1] Vy,
+                              const double[::1] Nx, const double[::1] Ny, int N_edg, double resc_fac,
+                              int num_threads=1):
     cdef int N_impacts=len(x_in)
-    cdef np.ndarray[DOUBLE_t] x_int = np.zeros((N_impacts,),dtype=np.double)
-    cdef np.ndarray[DOUBLE_t] y_int = np.zeros((N_impacts,),dtype=np.double)
-    cdef np.ndarray[DOUBLE_t] z_int = np.zeros((N_impacts,),dtype=np.double)
-    cdef np.ndarray[DOUBLE_t] Nx_int = np.zeros((N_impacts,),dtype=np.double)
-    cdef np.ndarray[DOUBLE_t] Ny_int = np.zeros((N_impacts,),dtype=np.double)
-    cdef np.ndarray[INT_t] i_found = np.zeros((N_impacts,),dtype=np.int)
-
+    x_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    y_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    z_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    Nx_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    Ny_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    i_found_arr = np.zeros((N_impacts,),dtype=np.int64)
+
+    cdef double[::1] x_int = x_int_arr
+    cdef double[::1] y_int = y_int_arr
+    cdef double[::1] Nx_int = Nx_int_arr
+    cdef double[::1] Ny_int = Ny_int_arr
+    cdef np.int64_t[::1] i_found = i_found_arr
+
+    cdef int N_threads = num_threads
     cdef int i_imp, ii, i_found_curr
-    cdef double t_min_curr, t_ii, t_border, t_border_min_curr
-    cdef int fould_curr
+    cdef double t_min_curr, t_ii, t_border
     cdef double x_in_curr, y_in_curr, x_out_curr, y_out_curr, den
 
-
-    #with nogil, parallel():
-    #for i_imp in prange(N_impacts):
-    for i_imp in xrange(N_impacts):
+    for i_imp in prange(N_impacts, nogil=True, schedule='static', num_threads=N_threads):
         t_min_curr = 1.
         i_found_curr = -1
-        fould_curr = False
         x_in_curr = x_in[i_imp]
         y_in_curr = y_in[i_imp]
         x_out_curr = x_out[i_imp]
         y_out_curr = y_out[i_imp]
 
-        for ii in xrange(N_edg):
+        for ii in range(N_edg):
 
             den    = ((y_out_curr-y_in_curr)*(Vx[ii+1]-Vx[ii])+(x_in_curr-x_out_curr)*(Vy[ii+1]-Vy[ii]))
             if den == 0.:
@@ -56,83 +59,76 @@ cpdef impact_point_and_normal(double[::1] x_in, double[::1] y_in, double[::1] z_
                 t_ii = (Nx[ii]*(Vx[ii]-x_in_curr)+Ny[ii]*(Vy[ii]-y_in_curr)) /(Nx[ii]*(x_out_curr-x_in_curr)+Ny[ii]*(y_out_curr-y_in_curr))
                 if t_ii>=0. and t_ii<t_min_curr:
                     t_min_curr=t_ii
-                    fould_curr = True
                     i_found_curr = ii
 
 
         t_min_curr=resc_fac*t_min_curr
         x_int[i_imp]=t_min_curr*x_out_curr+(1.-t_min_curr)*x_in_curr
         y_int[i_imp]=t_min_curr*y_out_curr+(1.-t_min_curr)*y_in_curr
-        z_int[i_imp]=0
 
         if i_found_curr>=0:
             Nx_int[i_imp] = Nx[i_found_curr]
             Ny_int[i_imp] = Ny[i_found_curr]
             i_found[i_imp] = i_found_curr
 
-    return x_int, y_int, z_int, Nx_int, Ny_int, i_found
+    return x_int_arr, y_int_arr, z_int_arr, Nx_int_arr, Ny_int_arr, i_found_arr
 
 
-ctypedef np.int8_t INT8_t
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cpdef is_outside_convex(np.ndarray[DOUBLE_t] x_mp, np.ndarray[DOUBLE_t] y_mp, np.ndarray[DOUBLE_t] Vx, np.ndarray[DOUBLE_t] Vy, double cx, double cy, int N_edg):
+@cython.cdivision(True)
+cpdef is_outside_convex(const double[:] x_mp, const double[:] y_mp, const double[::1] Vx, const double[::1] Vy, double cx, double cy, int N_edg,
+                        int num_threads=1):
 
     cdef int N_mp = len(x_mp)
-    cdef np.ndarray[INT_t] flag_outside_vec
+    cdef int N_threads = num_threads
     cdef int i_mp
     cdef int  ii
     cdef int flag_inside_curr
     cdef double x_curr, y_curr
 
-    #print 'Convex'
-
-
-    flag_outside_vec = np.zeros((N_mp,),dtype=np.int)
+    flag_outside_arr = np.zeros((N_mp,),dtype=np.bool_)
+    cdef np.uint8_t[::1] flag_outside_vec = flag_outside_arr.view(np.uint8)
 
-#~     with nogil, parallel():
-#~     for i_mp in prange(N_mp):
-    for i_mp in xrange(N_mp):
+    for i_mp in prange(N_mp, nogil=True, schedule='static', num_threads=N_threads):
         x_curr = x_mp[i_mp]
         y_curr = y_mp[i_mp]
         flag_inside_curr = (((x_curr/cx)**2 + (y_curr/cy)**2)<=1.)
-        #print 1, flag_inside_curr
 
         if flag_inside_curr==0:
             flag_inside_curr=1
             ii = 0
             while flag_inside_curr==1 and ii<N_edg:
                 flag_inside_curr=(((y_curr-Vy[ii])*(Vx[ii+1]-Vx[ii])-(x_curr-Vx[ii])*(Vy[ii+1]-Vy[ii]))>0.)
-                ii = ii +1
+                # (no in-place operator: it would make ii a prange reduction)
+                ii = ii + 1
 
-        flag_outside_vec[i_mp] = not(flag_inside_curr)
+        flag_outside_vec[i_mp] = (flag_inside_curr==0)
 
-    return np.bool_(flag_outside_vec)
+    return flag_outside_arr
 
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cpdef is_outside_nonconvex(np.ndarray[DOUBLE_t] x_mp, np.ndarray[DOUBLE_t] y_mp, np.ndarray[DOUBLE_t] Vx, np.ndarray[DOUBLE_t] Vy, double cx, double cy, int N_edg):
+@cython.cdivision(True)
+cpdef is_outside_nonconvex(const double[:] x_mp, const double[:] y_mp, const double[::1] Vx, const double[::1] Vy, double cx, double cy, int N_edg,
+                           int num_threads=1):
 
     cdef int N_mp = len(x_mp)
-    cdef np.ndarray[INT_t] flag_outside_vec
+    cdef int N_threads = num_threads
     cdef int i_mp
     cdef int  ii, jj
     cdef int flag_inside_curr
     cdef double x_curr, y_curr
 
-    #print 'NON convex'
+    flag_outside_arr = np.zeros((N_mp,),dtype=np.bool_)
+    cdef np.uint8_t[::1] flag_outside_vec = flag_outside_arr.view(np.uint8)
 
-
-    flag_outside_vec = np.zeros((N_mp,),dtype=np.int)
-
-
-    for i_mp in xrange(N_mp):
+    for i_mp in prange(N_mp, nogil=True, schedule='static', num_threads=N_threads):
         x_curr = x_mp[i_mp]
         y_curr = y_mp[i_mp]
         flag_inside_curr = (((x_curr/cx)**2 + (y_curr/cy)**2)<=1.)
-        #print 1, flag_inside_curr
 
         if flag_inside_curr==0:
             ii = 0
@@ -140,15 +136,189 @@ cpdef is_outside_nonconvex(np.ndarray[DOUBLE_t] x_mp, np.ndarray[DOUBLE_t] y_mp,
             while ii < N_edg:
                 if ((Vy[ii]>y_curr) != (Vy[jj]>y_curr)):
                     if (x_curr < (Vx[jj]-Vx[ii]) * (y_curr-Vy[ii]) / (Vy[jj]-Vy[ii]) + Vx[ii]) :
-                        flag_inside_curr = not(flag_inside_curr)
+                        flag_inside_curr = (flag_inside_curr==0)
 
                 jj = ii
-                ii += 1
+                ii = ii + 1
+
+
+        flag_outside_vec[i_mp] = (flag_inside_curr==0)
+
+    return flag_outside_arr
+
+
+
+# Kernels using the edge index of polyg_edge_index (non-convex chambers)
+
+cdef inline int _bin(double coord, double coord0, double d_bin, int N_bins) nogil:
+    # Same as polyg_edge_index._bin
+    cdef double f_bin = floor((coord - coord0) / d_bin)
+    if f_bin < 0.:
+        return 0
+    if f_bin > N_bins - 1:
+        return N_bins - 1
+    return <int>f_bin
+
+
+@cython.cdivision(True)
+cdef inline double _t_impact_edge(int ii, double x_in_curr, double y_in_curr, double x_out_curr, double y_out_curr,
+                                  const double* Vx, const double* Vy, const double* Nx, const double* Ny) nogil:
+    # Same test as in impact_point_and_normal, returns -1. if there is no intersection
+    cdef double den, t_border
+    den    = ((y_out_curr-y_in_curr)*(Vx[ii+1]-Vx[ii])+(x_in_curr-x_out_curr)*(Vy[ii+1]-Vy[ii]))
+    if den == 0.:
+        return -1.
+    t_border=((y_out_curr-y_in_curr)*(x_in_curr-Vx[ii])+(x_in_curr-x_out_curr)*(y_in_curr-Vy[ii]))/den
+    if t_border>=0. and t_border<=1.:
+        return (Nx[ii]*(Vx[ii]-x_in_curr)+Ny[ii]*(Vy[ii]-y_in_curr)) /(Nx[ii]*(x_out_curr-x_in_curr)+Ny[ii]*(y_out_curr-y_in_curr))
+    return -1.
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef impact_point_and_normal_indexed(const double[:] x_in, const double[:] y_in, const double[:] z_in,
+                              const double[:] x_out, const double[:] y_out, const double[:] z_out,
+                              const double[::1] Vx, const double[::1] Vy,
+                              const double[::1] Nx, const double[::1] Ny, int N_edg, double resc_fac,
+                              const int[::1] cell_ptr, const int[::1] cell_edges,
+                              double x0, double y0, double dx_bin, double dy_bin, int N_bins,
+                              int num_threads=1):
+    cdef int N_impacts=len(x_in)
+    x_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    y_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    z_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    Nx_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    Ny_int_arr = np.zeros((N_impacts,),dtype=np.double)
+    i_found_arr = np.zeros((N_impacts,),dtype=np.int64)
+
+    cdef double[::1] x_int = x_int_arr
+    cdef double[::1] y_int = y_int_arr
+    cdef double[::1] Nx_int = Nx_int_arr
+    cdef double[::1] Ny_int = Ny_int_arr
+    cdef np.int64_t[::1] i_found = i_found_arr
+
+    cdef const double* pVx = &Vx[0]
+    cdef const double* pVy = &Vy[0]
+    cdef const double* pNx = &Nx[0]
+    cdef const double* pNy = &Ny[0]
+
+    cdef int N_threads = num_threads
+    cdef int i_imp, ii, kk, ic, jc, i_cell, i_found_curr
+    cdef int ic_min, ic_max, jc_min, jc_max
+    cdef double t_min_curr, t_ii
+    cdef double x_in_curr, y_in_curr, x_out_curr, y_out_curr
+
+    for i_imp in prange(N_impacts, nogil=True, schedule='static', num_threads=N_threads):
+        t_min_curr = 1.
+        i_found_curr = -1
+        x_in_curr = x_in[i_imp]
+        y_in_curr = y_in[i_imp]
+        x_out_curr = x_out[i_imp]
+        y_out_curr = y_out[i_imp]
+
+        ic_min = _bin(min(x_in_curr, x_out_curr), x0, dx_bin, N_bins)
+        ic_max = _bin(max(x_in_curr, x_out_curr), x0, dx_bin, N_bins)
+        jc_min = _bin(min(y_in_curr, y_out_curr), y0, dy_bin, N_bins)
+        jc_max = _bin(max(y_in_curr, y_out_curr), y0, dy_bin, N_bins)
+
+        if (ic_max - ic_min + 1) * (jc_max - jc_min + 1) > N_edg:
+            # Long segment: cheaper to test all the edges
+            for ii in range(N_edg):
+                t_ii = _t_impact_edge(ii, x_in_curr, y_in_curr, x_out_curr, y_out_curr, pVx, pVy, pNx, pNy)
+                if t_ii>=0. and t_ii<t_min_curr:
+                    t_min_curr=t_ii
+                    i_found_curr = ii
+        else:
+            for ic in range(ic_min, ic_max + 1):
+                for jc in range(jc_min, jc_max + 1):
+                    i_cell = ic * N_bins + jc
+                    for kk in range(cell_ptr[i_cell], cell_ptr[i_cell + 1]):
+                        ii = cell_edges[kk]
+                        t_ii = _t_impact_edge(ii, x_in_curr, y_in_curr, x_out_curr, y_out_curr, pVx, pVy, pNx, pNy)
+                        # ties go to the lowest edge index, as in the sequential search
+                        if t_ii>=0. and (t_ii<t_min_curr or (t_ii==t_min_curr and i_found_curr>=0 and ii<i_found_curr)):
+                            t_min_curr=t_ii
+                            i_found_curr = ii
+
+        t_min_curr=resc_fac*t_min_curr
+        x_int[i_imp]=t_min_curr*x_out_curr+(1.-t_min_curr)*x_in_curr
+        y_int[i_imp]=t_min_curr*y_out_curr+(1.-t_min_curr)*y_in_curr
+
+        if i_found_curr>=0:
+            Nx_int[i_imp] = Nx[i_found_curr]
+            Ny_int[i_imp] = Ny[i_found_curr]
+            i_found[i_imp] = i_found_curr
 
+    return x_int_arr, y_int_arr, z_int_arr, Nx_int_arr, Ny_int_arr, i_found_arr
 
-        flag_outside_vec[i_mp] = not(flag_inside_curr)
 
-    return np.bool_(flag_outside_vec)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef is_outside_nonconvex_indexed(const double[:] x_mp, const double[:] y_mp, const double[::1] Vx, const double[::1] Vy, double cx, double cy, int N_edg,
+                                   const int[::1] slab_ptr, const int[::1] slab_edges,
+                                   double y0, double y1, double dy_bin, int N_bins,
+                                   int num_threads=1):
 
+    cdef int N_mp = len(x_mp)
+    cdef int N_threads = num_threads
+    cdef int i_mp
+    cdef int  ii, jj, kk, j_slab
+    cdef int flag_inside_curr
+    cdef double x_curr, y_curr
 
+    flag_outside_arr = np.zeros((N_mp,),dtype=np.bool_)
+    cdef np.uint8_t[::1] flag_outside_vec = flag_outside_arr.view(np.uint8)
 
+    for i_mp in prange(N_mp, nogil=True, schedule='static', num_threads=N_threads):
+        x_curr = x_mp[i_mp]
+        y_curr = y_mp[i_mp]
+        flag_inside_curr = (((x_curr/cx)**2 + (y_curr/cy)**2)<=1.)
+
+        # outside the y-range of the polygon no edge can be crossed
+        if flag_inside_curr==0 and y_curr>=y0 and y_curr<=y1:
+            j_slab = _bin(y_curr, y0, dy_bin, N_bins)
+            for kk in range(slab_ptr[j_slab], slab_ptr[j_slab + 1]):
+                # edge from vertex jj to vertex ii (as in is_outside_nonconvex)
+                jj = slab_edges[kk]
+                ii = jj + 1
+                if ((Vy[ii]>y_curr) != (Vy[jj]>y_curr)):
+                    if (x_curr < (Vx[jj]-Vx[ii]) * (y_curr-Vy[ii]) / (Vy[jj]-Vy[ii]) + Vx[ii]) :
+                        flag_inside_curr = (flag_inside_curr==0)
+
+        flag_outside_vec[i_mp] = (flag_inside_curr==0)
+
+    return flag_outside_arr
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef raster_lookup(const double[:] x_mp, const double[:] y_mp, const np.uint8_t[:, ::1] cell_class,
+                    double x0, double y0, double d_cell, int num_threads=1):
+    # Class of the raster cell of each particle (see chamber_raster),
+    # particles out of the raster are outside (1), invalid coordinates
+    # get the boundary class (2) to be checked by the exact test
+
+    cdef int N_mp = len(x_mp)
+    cdef int N_threads = num_threads
+    cdef int Nx_cells = cell_class.shape[0]
+    cdef int Ny_cells = cell_class.shape[1]
+    cdef int i_mp
+    cdef double fx, fy
+
+    class_arr = np.empty((N_mp,), dtype=np.uint8)
+    cdef np.uint8_t[::1] class_mp = class_arr
+
+    for i_mp in prange(N_mp, nogil=True, schedule='static', num_threads=N_threads):
+        fx = floor((x_mp[i_mp] - x0) / d_cell)
+        fy = floor((y_mp[i_mp] - y0) / d_cell)
+        if fx >= 0. and fx < Nx_cells and fy >= 0. and fy < Ny_cells:
+            class_mp[i_mp] = cell_class[<int>fx, <int>fy]
+        elif isnan(fx) or isnan(fy):
+            class_mp[i_mp] = 2
+        else:
+            class_mp[i_mp] = 1
+
+    return class_arr
@@ -52,12 +52,19 @@
 
 
 
+import threading
 from numpy import sum, arctan2, sin, cos
 import scipy.io as sio
 import numpy as np
-import numpy.random as random
+from . import rng_streams as random
 
 from . import geom_impact_poly_cython as gipc
+from . import polyg_edge_index as pei
+from . import chamber_raster as cras
+
+
+# The impact counters are shared by the clouds, which can be stepped on parallel threads
+_counters_lock = threading.Lock()
 
 
 class PyECLOUD_ChamberException(ValueError):
@@ -67,9 +74,13 @@ class PyECLOUD_ChamberException(ValueError):
 class polyg_cham_geom_object(object):
 
     chamb_type = 'polyg'
+    num_threads = 1
+    edge_index = None
+    inside_raster = None
 
     def __init__(self, filename_chm, flag_non_unif_sey, flag_verbose_file=False, flag_verbose_stdout=False,
-                 flag_assume_convex=True):
+                 flag_assume_convex=True, num_threads=1, N_bins_edge_index=None, N_cells_inside_raster=None,
+                 edge_index_cache_dir=None):
 
         print('Polygonal chamber - cython implementation')
 
@@ -146,6 +157,12 @@ class polyg_cham_geom_object(object):
 
         self.flag_assume_convex = flag_assume_convex
 
+        if int(num_threads) != num_threads or num_threads < 1:
+            raise PyECLOUD_ChamberException('num_threads must be a positive integer!')
+        self.num_threads = int(num_threads)
+        if self.num_threads > 1:
+            print('Impact detection on %d threads' % self.num_threads)
+
         if self.flag_verbose_file:
             fbckt = open('bcktr_errors.txt', 'w')
             fbckt.write('kind,x_in,y_in,x_out, y_out\n')
@@ -161,17 +178,48 @@ class polyg_cham_geom_object(object):
             self.cythonisoutside = gipc.is_outside_nonconvex
             print('No assumption on the convexity of the polygon')
 
+            # Edge index to test only the relevant edges (N_bins_edge_index=0 disables it)
+            if N_bins_edge_index != 0:
+                self.edge_index = pei.get_edge_index(self.Vx, self.Vy, N_bins=N_bins_edge_index,
+                                                     cache_dir=edge_index_cache_dir)
+                print('Using edge index with %d x %d bins' % (self.edge_index.N_bins, self.edge_index.N_bins))
+
+        if N_cells_inside_raster is not None:
+            self.inside_raster = cras.polygon_raster(self.Vx, self.Vy, self._is_outside_exact, N_cells_inside_raster)
+            print('Using inside raster with %d x %d cells (%.1f%% boundary cells)' % (
+                self.inside_raster.Nx_cells, self.inside_raster.Ny_cells, 100 * self.inside_raster.fraction_boundary()))
+
     def is_outside(self, x_mp, y_mp):
-        return self.cythonisoutside(x_mp, y_mp, self.Vx, self.Vy, self.cx, self.cy, self.N_edg)
+        if self.inside_raster is not None:
+            return self.inside_raster.is_outside(x_mp, y_mp, self._is_outside_exact, num_threads=self.num_threads)
+        return self._is_outside_exact(x_mp, y_mp)
+
+    def _is_outside_exact(self, x_mp, y_mp):
+        if self.edge_index is not None:
+            ei = self.edge_index
+            return gipc.is_outside_nonconvex_indexed(x_mp, y_mp, self.Vx, self.Vy, self.cx, self.cy, self.N_edg,
+                                                     ei.slab_ptr, ei.slab_edges, ei.y0, ei.y1, ei.dy_bin, ei.N_bins,
+                                                     num_threads=self.num_threads)
+        return self.cythonisoutside(x_mp, y_mp, self.Vx, self.Vy, self.cx, self.cy, self.N_edg,
+                                    num_threads=self.num_threads)
 
     #@profile
     def impact_point_and_normal(self, x_in, y_in, z_in, x_out, y_out, z_out, resc_fac=0.99, flag_robust=True):
 
         N_impacts = len(x_in)
-        self.N_mp_impact = self.N_mp_impact + N_impacts
-
-        x_int, y_int, z_int, Nx_int, Ny_int, i_found = gipc.impact_point_and_normal(x_in, y_in, z_in, x_out, y_out, z_out,
-                                                                                    self.Vx, self.Vy, self.Nx, self.Ny, self.N_edg, resc_fac)
+        with _counters_lock:
+            self.N_mp_impact = self.N_mp_impact + N_impacts
+
+        if self.edge_index is not None:
+            ei = self.edge_index
+            x_int, y_int, z_int, Nx_int, Ny_int, i_found = gipc.impact_point_and_normal_indexed(
+                x_in, y_in, z_in, x_out, y_out, z_out, self.Vx, self.Vy, self.Nx, self.Ny, self.N_edg, resc_fac,
+                ei.cell_ptr, ei.cell_edges, ei.x0, ei.y0, ei.dx_bin, ei.dy_bin, ei.N_bins,
+                num_threads=self.num_threads)
+        else:
+            x_int, y_int, z_int, Nx_int, Ny_int, i_found = gipc.impact_point_and_normal(x_in, y_in, z_in, x_out, y_out, z_out,
+                                                                                        self.Vx, self.Vy, self.Nx, self.Ny, self.N_edg, resc_fac,
+                                                                                        num_threads=self.num_threads)
 
         mask_found = i_found >= 0
 
@@ -203,7 +251,8 @@ class polyg_cham_geom_object(object):
             x_out_error = x_out[mask_not_found]
             y_out_error = y_out[mask_not_found]
             N_errors = len(x_in_error)
-            self.N_mp_corrected = self.N_mp_corrected + N_errors
+            with _counters_lock:
+                self.N_mp_corrected = self.N_mp_corrected + N_errors
 
             if self.flag_verbose_stdout:
                 print('Reporting backtrack error of kind 1: no impact found')
@@ -222,7 +271,8 @@ class polyg_cham_geom_object(object):
         if flag_robust:
             flag_impact = self.is_outside(x_int, y_int)
             if flag_impact.any():
-                self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
+                with _counters_lock:
+                    self.N_mp_corrected = self.N_mp_corrected + sum(flag_impact)
                 x_int[flag_impact] = x_in[flag_impact]
                 y_int[flag_impact] = y_in[flag_impact]
                 x_in_error = x_in[flag_impact]
@@ -0,0 +1,182 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import numpy as np
+
+
+class h5_outp_writer(object):
+    '''
+    Append-only writer for the main output file in HDF5 format.
+
+    Quantities listed in growing_keys (pass-by-pass and step-by-step data)
+    are stored in chunked, resizable datasets and at each call of write only
+    the rows that were not yet on disk are added. All other quantities are
+    written when they first appear and rewritten only if they change.
+    '''
+
+    def __init__(self, filename, growing_keys, growth_axis=None, chunk_size_bytes=256 * 1024):
+
+        self.filename = filename
+        self.growing_keys = set(growing_keys)
+        if growth_axis is None:
+            growth_axis = {}
+        self.growth_axis = growth_axis
+        self.chunk_size_bytes = chunk_size_bytes
+
+        self.n_written = {}
+        self.static_written = {}
+        self.file_initialized = False
+
+    def write(self, saved_dict):
+        import h5py
+
+        # The file is opened and closed at each call so that it is always
+        # in a consistent state and can be read or copied between passages
+        if self.file_initialized:
+            mode = 'a'
+        else:
+            mode = 'w'
+
+        with h5py.File(self.filename, mode) as fid:
+            for kk in list(saved_dict.keys()):
+                if kk in self.growing_keys:
+                    self._append(fid, kk, saved_dict[kk])
+                else:
+                    self._write_static(fid, kk, saved_dict[kk])
+
+        self.file_initialized = True
+
+    def _append(self, fid, kk, vv):
+        axis = self.growth_axis.get(kk, 0)
+
+        # Convert only the new part of the lists
+        if kk in self.n_written and kk in fid and isinstance(vv, list) and axis == 0:
+            n_old = self.n_written[kk]
+            n_tot = len(vv)
+            if n_tot == n_old:
+                return
+            if n_tot > n_old:
+                new_rows = np.array(vv[n_old:])
+                if self._can_append(fid[kk], new_rows, axis, n_old):
+                    self._resize_and_fill(fid[kk], new_rows, axis, n_old, n_tot)
+                    self.n_written[kk] = n_tot
+                    return
+
+        vv = np.array(vv)
+
+        if vv.ndim == 0:
+            self.n_written.pop(kk, None)
+            self._write_static(fid, kk, vv)
+            return
+
+        n_tot = vv.shape[axis]
+        if kk in self.n_written and kk in fid:
+            n_old = self.n_written[kk]
+            if n_tot == n_old and fid[kk].shape == vv.shape:
+                return
+            if n_tot > n_old:
+                slices = [slice(None)] * vv.ndim
+                slices[axis] = slice(n_old, n_tot)
+                new_rows = vv[tuple(slices)]
+                if self._can_append(fid[kk], new_rows, axis, n_old):
+                    self._resize_and_fill(fid[kk], new_rows, axis, n_old, n_tot)
+                    self.n_written[kk] = n_tot
+                    return
+
+        # First write or incompatible shape: (re)create the dataset
+        if kk in fid:
+            del fid[kk]
+        self.static_written.pop(kk, None)
+        maxshape = list(vv.shape)
+        maxshape[axis] = None
+        fid.create_dataset(kk, data=vv, maxshape=tuple(maxshape),
+                           chunks=self._chunk_shape(vv, axis))
+        self.n_written[kk] = n_tot
+
+    def _can_append(self, dset, new_rows, axis, n_old):
+        if dset.maxshape[axis] is not None or dset.shape[axis] != n_old:
+            return False
+        if new_rows.ndim != dset.ndim:
+            return False
+        for ii in range(dset.ndim):
+            if ii != axis and new_rows.shape[ii] != dset.shape[ii]:
+                return False
+        return True
+
+    def _resize_and_fill(self, dset, new_rows, axis, n_old, n_tot):
+        dset.resize(n_tot, axis=axis)
+        slices = [slice(None)] * dset.ndim
+        slices[axis] = slice(n_old, n_tot)
+        dset[tuple(slices)] = new_rows
+
+    def _chunk_shape(self, vv, axis):
+        other_size = 1
+        for ii in range(vv.ndim):
+            if ii != axis:
+                other_size *= max(vv.shape[ii], 1)
+        n_chunk = max(1, self.chunk_size_bytes // (other_size * max(vv.dtype.itemsize, 1)))
+        chunks = [max(nn, 1) for nn in vv.shape]
+        chunks[axis] = int(n_chunk)
+        return tuple(chunks)
+
+    def _write_static(self, fid, kk, vv):
+        vv = np.array(vv)
+        if kk in fid and kk in self.static_written:
+            old = self.static_written[kk]
+            if old.shape == vv.shape and old.dtype == vv.dtype and np.array_equal(old, vv):
+                return
+        if kk in fid:
+            del fid[kk]
+        self.n_written.pop(kk, None)
+        fid.create_dataset(kk, data=vv)
+        self.static_written[kk] = vv.copy()
@@ -50,9 +50,11 @@
 #
 #-End-preamble---------------------------------------------------------
 
+import hashlib
+
 import numpy as np
 from . import hist_for as histf
-from . import seg_impact as segi
+from . import beam_field_cache as bfc
 from scipy.constants import e as qe
 
 
@@ -108,6 +110,7 @@ class impact_management(object):
         self.Nel_emit_last_step = None
         self.En_imp_last_step_eV = None
         self.En_emit_last_step_eV = None
+        self.N_mp_impact_last_step = 0
 
         self.nel_impact_hist_tot = np.zeros(Nxg_hist, float)
         self.nel_impact_hist_scrub = np.zeros(Nxg_hist, float)
@@ -131,8 +134,15 @@ class impact_management(object):
             self.nel_hist_emit_seg = np.zeros(chamb.N_vert, float)
             self.energ_eV_impact_seg = np.zeros(chamb.N_vert, float)
             if flag_En_hist_seg:
-                self.seg_En_hist_lines = [
-                    np.zeros(Nbin_En_hist, float) for _ in range(chamb.N_vert)]
+                # One row per segment, filled together with the other impact
+                # histograms by histf.compute_impact_hists
+                self.seg_En_hist_lines = np.zeros((chamb.N_vert, Nbin_En_hist), float)
+
+        # Placeholders passed to the compiled kernels for the disabled histograms
+        self.no_hist = np.zeros(1)
+        if not (flag_seg and flag_En_hist_seg):
+            N_seg = chamb.N_vert if flag_seg else 1
+            self.no_seg_En_hist = np.zeros((Nbin_En_hist, N_seg), order='F')
 
         print('Done impact man. init.')
 
@@ -149,8 +159,7 @@ class impact_management(object):
         self.En_hist_line *= 0.
 
     def reset_seg_En_hist_lines(self):
-        for ii in range(self.chamb.N_vert):
-            self.seg_En_hist_lines[ii] *= 0.
+        self.seg_En_hist_lines *= 0.
 
     def reset_hist_impact_seg(self):
         if self.flag_seg:
@@ -170,6 +179,22 @@ class impact_management(object):
     def reset_lifetime_hist_line(self):
         self.lifetime_hist_line *= 0.
 
+    def reset_all_hist(self):
+        self.reset_impact_hist_tot()
+        self.reset_impact_hist_scrub()
+        self.reset_energ_eV_impact_hist()
+        self.reset_En_hist_line()
+        if self.flag_cos_angle_hist:
+            self.reset_cos_angle_hist()
+        if self.flag_lifetime_hist:
+            self.reset_lifetime_hist_line()
+        if self.flag_seg:
+            self.reset_hist_impact_seg()
+            self.reset_hist_emit_seg()
+            self.reset_energ_impact_seg()
+            if self.flag_En_hist_seg:
+                self.reset_seg_En_hist_lines()
+
     # @profile
     def backtrack_and_second_emiss(self, old_pos, MP_e, tt_curr=None):
 
@@ -177,6 +202,7 @@ class impact_management(object):
         self.Nel_emit_last_step = 0.
         self.En_imp_last_step_eV = 0.
         self.En_emit_last_step_eV = 0.
+        self.N_mp_impact_last_step = 0
 
         if MP_e.N_mp > 0:
 
@@ -196,16 +222,11 @@ class impact_management(object):
             nel_mp_th = MP_e.nel_mp_split
             chamb = self.chamb
             sey_mod = self.sey_mod
-            bias_x_hist = self.bias_x_hist
-            Dx_hist = self.Dx_hist
-            En_hist_max = self.En_hist_max
-            DEn_hist = self.DEn_hist
 
             if self.flag_lifetime_hist:
                 Dt_lifetime_hist = self.Dt_lifetime_hist
 
             flag_seg = self.flag_seg
-            scrub_en_th = self.scrub_en_th
 
             # impact management
 
@@ -217,6 +238,7 @@ class impact_management(object):
                 x_mp[0:N_mp_old], y_mp[0:N_mp_old])
 
             Nimpact = int(np.sum(flag_impact))
+            self.N_mp_impact_last_step = Nimpact
 
             if Nimpact > 0:
 
@@ -258,39 +280,8 @@ class impact_management(object):
                 # Mathematically correct would be -(v_impact_n)/v_impact_mod
                 costheta_impact = np.abs(v_impact_n / v_impact_mod)
 
-                # electron histogram
-                histf.compute_hist(
-                    x_impact, nel_impact, bias_x_hist, Dx_hist, self.nel_impact_hist_tot)
-                histf.compute_hist(x_impact, nel_impact * (E_impact_eV > scrub_en_th),
-                                   bias_x_hist, Dx_hist, self.nel_impact_hist_scrub)
-                histf.compute_hist(x_impact, nel_impact * E_impact_eV,
-                                   bias_x_hist, Dx_hist, self.energ_eV_impact_hist)
-
-                # angle histogram
-                if self.flag_cos_angle_hist:
-                    histf.compute_hist(
-                        costheta_impact, nel_impact, 0., self.cos_angle_width, self.cos_angle_hist)
-
-                if flag_seg:
-                    segi.update_seg_impact(
-                        i_found, nel_impact, self.nel_hist_impact_seg)
-                    segi.update_seg_impact(
-                        i_found, nel_impact * E_impact_eV, self.energ_eV_impact_seg)
-
-                    if self.flag_En_hist_seg:
-                        for iseg in range(self.chamb.N_vert):
-                            mask_this_seg = i_found == iseg
-                            if np.sum(mask_this_seg) > 0:
-                                En_imp_hist_this_seg = E_impact_eV[mask_this_seg]
-                                En_imp_hist_this_seg[En_imp_hist_this_seg >
-                                                     En_hist_max] = En_hist_max
-                                histf.compute_hist(En_imp_hist_this_seg, nel_impact[mask_this_seg], 0., DEn_hist,
-                                                   self.seg_En_hist_lines[iseg])
-
-                En_imp_hist = E_impact_eV.copy()
-                En_imp_hist[En_imp_hist > En_hist_max] = En_hist_max
-                histf.compute_hist(En_imp_hist, nel_impact,
-                                   0., DEn_hist, self.En_hist_line)
+                # all the impact histograms in a single pass
+                self._fill_impact_hists(x_impact, nel_impact, E_impact_eV, costheta_impact, i_found)
 
                 self.Nel_impact_last_step = np.sum(nel_impact)
                 self.En_imp_last_step_eV = np.sum(E_impact_eV * nel_impact)
@@ -325,13 +316,7 @@ class impact_management(object):
 
                 self.En_emit_last_step_eV = np.sum(E_replace_eV * nel_replace)
 
-                histf.compute_hist(x_replace, -nel_replace * E_replace_eV,
-                                   bias_x_hist, Dx_hist, self.energ_eV_impact_hist)
-                if flag_seg:
-                    segi.update_seg_impact(
-                        i_seg_replace, -nel_replace * E_replace_eV, self.energ_eV_impact_seg)
-                    segi.update_seg_impact(
-                        i_seg_replace, nel_replace, self.nel_hist_emit_seg)
+                self._fill_emit_hists(x_replace, nel_replace, E_replace_eV, i_seg_replace)
 
                 # New macroparticles
                 N_new_MPs = len(nel_new_MPs)
@@ -344,69 +329,178 @@ class impact_management(object):
                         vx_new_MPs**2 + vy_new_MPs**2 + vz_new_MPs**2)
                     E_new_MPs_eV = 0.5 * MP_e.mass / qe * v_new_MPs_mod * v_new_MPs_mod
 
-                    histf.compute_hist(x_new_MPs, -nel_new_MPs * E_new_MPs_eV,
-                                       bias_x_hist, Dx_hist, self.energ_eV_impact_hist)
-
-                    if flag_seg:
-                        segi.update_seg_impact(
-                            i_seg_new_MPs, -nel_new_MPs * E_new_MPs_eV, self.energ_eV_impact_seg)
-                        segi.update_seg_impact(
-                            i_seg_new_MPs, nel_new_MPs, self.nel_hist_emit_seg)
+                    self._fill_emit_hists(x_new_MPs, nel_new_MPs, E_new_MPs_eV, i_seg_new_MPs)
 
                     self.En_emit_last_step_eV += np.sum(
                         E_new_MPs_eV * nel_new_MPs)
 
         return MP_e
 
-    def extract_sey_curves(self, n_rep, E_impact_eV_test, cos_theta_test, charge, mass):
+    def _fill_impact_hists(self, x_impact, nel_impact, E_impact_eV, costheta_impact, i_found):
+        # Histograms of the impacting MPs, filled by a single compiled pass.
+        # The flags tell the kernel which of the optional histograms are
+        # enabled, the others get a placeholder.
+        flags = np.array([self.flag_cos_angle_hist, self.flag_seg,
+                          self.flag_seg and self.flag_En_hist_seg], dtype=np.int32)
+        no_hist = self.no_hist
+
+        if self.flag_cos_angle_hist:
+            cos_angle_width, cos_angle_hist = self.cos_angle_width, self.cos_angle_hist
+        else:
+            cos_angle_width, cos_angle_hist = 1., no_hist
+
+        if self.flag_seg:
+            seg_nel, seg_energ = self.nel_hist_impact_seg, self.energ_eV_impact_seg
+        else:
+            i_found = np.zeros(len(x_impact), dtype=np.int32)
+            seg_nel, seg_energ = no_hist, no_hist
+
+        if self.flag_seg and self.flag_En_hist_seg:
+            # the transpose is the Fortran-ordered (energy x segment) view
+            seg_En_hist = self.seg_En_hist_lines.T
+        else:
+            seg_En_hist = self.no_seg_En_hist
+
+        histf.compute_impact_hists(
+            x_impact, nel_impact, E_impact_eV, costheta_impact, i_found, flags,
+            self.bias_x_hist, self.Dx_hist, self.scrub_en_th, self.En_hist_max, self.DEn_hist,
+            cos_angle_width, self.nel_impact_hist_tot, self.nel_impact_hist_scrub,
+            self.energ_eV_impact_hist, self.En_hist_line, cos_angle_hist,
+            seg_nel, seg_energ, seg_En_hist)
+
+    def _fill_emit_hists(self, x_emit, nel_emit, E_emit_eV, i_seg_emit):
+        # Removes the energy of the emitted MPs from the energy histograms
+        # and counts them per segment, in a single compiled pass
+        if self.flag_seg:
+            seg_energ, seg_nel_emit = self.energ_eV_impact_seg, self.nel_hist_emit_seg
+        else:
+            i_seg_emit = np.zeros(len(x_emit), dtype=np.int32)
+            seg_energ, seg_nel_emit = self.no_hist, self.no_hist
+
+        histf.compute_emit_hists(
+            x_emit, nel_emit, E_emit_eV, i_seg_emit, self.flag_seg,
+            self.bias_x_hist, self.Dx_hist, self.energ_eV_impact_hist,
+            seg_energ, seg_nel_emit)
+
+    def _test_impacts(self, n_rep, E_impact_eV_test, cos_theta_test, mass):
+        # n_rep impacts for each (energy, cos_theta) pair of the test grid.
+        # Assuming normal is along x. The index of the pair is stored in z,
+        # which the emission models copy to the new MPs.
+        N_points = len(E_impact_eV_test)
+        E_impact_eV = np.repeat(E_impact_eV_test, n_rep)
+        costheta_impact = np.repeat(cos_theta_test, n_rep)
+        i_point = np.repeat(np.arange(N_points), n_rep)
+
+        nel_impact = np.ones(N_points * n_rep)
+        v_mod = np.sqrt(2 * E_impact_eV * qe / mass)
+        vx = v_mod * costheta_impact
+        vy = v_mod * np.sqrt(1 - costheta_impact * costheta_impact)
+
+        return i_point, self.sey_mod.impacts_on_surface(
+            mass=mass, nel_impact=nel_impact, x_impact=nel_impact * 0, y_impact=nel_impact * 0,
+            z_impact=i_point.astype(float),
+            vx_impact=vx,
+            vy_impact=vy,
+            vz_impact=nel_impact * 0,
+            Norm_x=np.ones_like(nel_impact), Norm_y=np.zeros_like(nel_impact),
+            i_found=np.int_(np.ones_like(nel_impact)),
+            v_impact_n=vx,
+            E_impact_eV=E_impact_eV,
+            costheta_impact=costheta_impact,
+            nel_mp_th=1,
+            flag_seg=True)
+
+    def _test_chunks(self, N_points, n_rep, N_mp_chunk):
+        # Slices of the test grid with at most N_mp_chunk impacts each
+        N_points_chunk = max(1, int(N_mp_chunk) // n_rep)
+        return [slice(i_start, min(i_start + N_points_chunk, N_points))
+                for i_start in range(0, N_points, N_points_chunk)]
+
+    def _sey_test_key(self, test_name, test_params):
+        # Hash of the SEY model parameters and of the test grid
+        hasher = hashlib.sha1()
+        hasher.update(('%s|%s.%s|' % (test_name, type(self.sey_mod).__module__,
+                                      type(self.sey_mod).__name__)).encode())
+        for name in sorted(vars(self.sey_mod).keys()) + sorted(test_params.keys()):
+            if name in test_params:
+                value = test_params[name]
+            else:
+                value = getattr(self.sey_mod, name)
+            if isinstance(value, np.ndarray):
+                hasher.update(('%s|%s|' % (name, value.dtype)).encode())
+                hasher.update(np.ascontiguousarray(value).tobytes())
+            elif value is None or isinstance(value, (bool, int, float, str, list, tuple, dict)):
+                hasher.update(('%s|%r|' % (name, value)).encode())
+            # other attributes (functions, random generators) are built
+            # from the ones above
+
+        return hasher.hexdigest()
+
+    def _load_sey_test(self, cache_dir, test_name, test_params):
+        if cache_dir is None:
+            return None, None
+        cache = bfc.beam_field_cache(cache_dir, entry_prefix='sey_test')
+        key = self._sey_test_key(test_name, test_params)
+        result = cache.load(key)
+        if result is not None:
+            print('Loaded %s from cache %s' % (test_name, cache_dir))
+        return result, (cache, key)
+
+    def extract_sey_curves(self, n_rep, E_impact_eV_test, cos_theta_test, charge, mass,
+                           N_mp_chunk=1e5, cache_dir=None):
+
+        deltas, cache_entry = self._load_sey_test(cache_dir, 'SEY curves', {
+            'n_rep': n_rep, 'E_impact_eV_test': np.asarray(E_impact_eV_test, dtype=float),
+            'cos_theta_test': np.asarray(cos_theta_test, dtype=float), 'mass': mass})
+        if deltas is not None:
+            return deltas
+
+        # The (cos_theta, energy) grid is flattened and processed in chunks
+        N_ct = len(cos_theta_test)
+        N_ene = len(E_impact_eV_test)
+        E_grid = np.tile(E_impact_eV_test, N_ct)
+        ct_grid = np.repeat(cos_theta_test, N_ene)
 
         deltas = {}
         for etype in list(self.sey_mod.event_types.keys()):
             etype_name = self.sey_mod.event_types[etype]
-            deltas[etype_name] = np.zeros(
-                (len(cos_theta_test), len(E_impact_eV_test)))
+            deltas[etype_name] = np.zeros(N_ct * N_ene)
         print('Extracting SEY curves...')
-        for i_ct, ct in enumerate(cos_theta_test):
-            print(('%d/%d' % (i_ct + 1, len(cos_theta_test))))
-            for i_ene, Ene in enumerate(E_impact_eV_test):
-
-                # nel_emit, flag_elast, flag_truesec = sey_mod.SEY_process(nel_impact=np.ones(n_rep),
-                #                 E_impact_eV=Ene*np.ones(n_rep), costheta_impact=np.ones(n_rep)*ct, i_impact=np.array(n_rep*[0]))
-                nel_impact = np.ones(n_rep)
-                # Assuming normal is along x
-                v_mod = np.sqrt(2 * Ene * qe / mass) * np.ones_like(nel_impact)
-                vx = v_mod * ct
-                vy = v_mod * np.sqrt(1 - ct * ct)
-
-                nel_emit_tot_events, event_type, event_info,\
-                    nel_replace, x_replace, y_replace, z_replace, vx_replace, vy_replace, vz_replace, i_seg_replace,\
-                    nel_new_MPs, x_new_MPs, y_new_MPs, z_new_MPs, vx_new_MPs, vy_new_MPs, vz_new_MPs, i_seg_new_MPs =\
-                    self.sey_mod.impacts_on_surface(
-                        mass=mass, nel_impact=nel_impact, x_impact=nel_impact * 0, y_impact=nel_impact * 0, z_impact=nel_impact * 0,
-                        vx_impact=vx * np.ones_like(nel_impact),
-                        vy_impact=vy * np.ones_like(nel_impact),
-                        vz_impact=nel_impact * 0,
-                        Norm_x=np.ones_like(nel_impact), Norm_y=np.zeros_like(nel_impact),
-                        i_found=np.int_(np.ones_like(nel_impact)),
-                        v_impact_n=vx * np.ones_like(nel_impact),
-                        E_impact_eV=Ene * np.ones_like(nel_impact),
-                        costheta_impact=ct * np.ones_like(nel_impact),
-                        nel_mp_th=1,
-                        flag_seg=True)
-
-                for etype in list(self.sey_mod.event_types.keys()):
-                    etype_name = self.sey_mod.event_types[etype]
-                    thisdelta = deltas[etype_name]
-                    thisdelta[i_ct, i_ene] = np.sum(
-                        nel_emit_tot_events[event_type == etype]) / np.sum(nel_impact)
-                    deltas[etype_name] = thisdelta
+        chunks = self._test_chunks(N_ct * N_ene, n_rep, N_mp_chunk)
+        for i_chunk, chunk in enumerate(chunks):
+            print(('%d/%d' % (i_chunk + 1, len(chunks))))
+            N_points = chunk.stop - chunk.start
+
+            i_point, impact_output = self._test_impacts(n_rep, E_grid[chunk], ct_grid[chunk], mass)
+            nel_emit_tot_events, event_type = impact_output[:2]
+
+            for etype in list(self.sey_mod.event_types.keys()):
+                etype_name = self.sey_mod.event_types[etype]
+                mask_type = event_type == etype
+                deltas[etype_name][chunk] = np.bincount(i_point[mask_type], weights=nel_emit_tot_events[mask_type],
+                                                        minlength=N_points) / n_rep
+
+        for etype_name in list(deltas.keys()):
+            deltas[etype_name] = deltas[etype_name].reshape(N_ct, N_ene)
 
         print('Done extracting SEY curves.')
 
+        if cache_entry is not None:
+            cache_entry[0].save(cache_entry[1], deltas)
+
         return deltas
 
-    def extract_energy_distributions(self, n_rep, E_impact_eV_test, cos_theta_test, mass, Nbin_extract_ene, factor_ene_dist_max):
+    def extract_energy_distributions(self, n_rep, E_impact_eV_test, cos_theta_test, mass, Nbin_extract_ene, factor_ene_dist_max,
+                                     N_mp_chunk=1e5, cache_dir=None):
         """Extract energy distributions for secondary electrons."""
+
+        extract_ene_hist, cache_entry = self._load_sey_test(cache_dir, 'energy distributions', {
+            'n_rep': n_rep, 'E_impact_eV_test': E_impact_eV_test,
+            'cos_theta_test': np.asarray(cos_theta_test, dtype=float), 'mass': mass,
+            'Nbin_extract_ene': Nbin_extract_ene, 'factor_ene_dist_max': factor_ene_dist_max})
+        if extract_ene_hist is not None:
+            return extract_ene_hist
+
         emit_ene_g_hist = np.linspace(
             0., E_impact_eV_test * factor_ene_dist_max, Nbin_extract_ene)
         Dextract_ene = emit_ene_g_hist[1] - emit_ene_g_hist[0]
@@ -418,30 +512,16 @@ class impact_management(object):
                 shape=(len(emit_ene_g_hist), len(cos_theta_test)), dtype=float)
 
         print('Extracting energy distributions...')
-        for i_ct, ct in enumerate(cos_theta_test):
-            print(('%d/%d' % (i_ct + 1, len(cos_theta_test))))
-            Ene = E_impact_eV_test
-            nel_impact = np.ones(n_rep)
-            # Assuming normal is along x
-            v_mod = np.sqrt(2 * Ene * qe / mass) * np.ones_like(nel_impact)
-            vx = v_mod * ct
-            vy = v_mod * np.sqrt(1 - ct * ct)
-
-            nel_emit_tot_events, event_type, event_info,\
-                nel_replace, x_replace, y_replace, z_replace, vx_replace, vy_replace, vz_replace, i_seg_replace,\
-                nel_new_MPs, x_new_MPs, y_new_MPs, z_new_MPs, vx_new_MPs, vy_new_MPs, vz_new_MPs, i_seg_new_MPs =\
-                self.sey_mod.impacts_on_surface(
-                    mass=mass, nel_impact=nel_impact, x_impact=nel_impact * 0, y_impact=nel_impact * 0, z_impact=nel_impact * 0,
-                    vx_impact=vx * np.ones_like(nel_impact),
-                    vy_impact=vy * np.ones_like(nel_impact),
-                    vz_impact=nel_impact * 0,
-                    Norm_x=np.ones_like(nel_impact), Norm_y=np.zeros_like(nel_impact),
-                    i_found=np.int_(np.ones_like(nel_impact)),
-                    v_impact_n=vx * np.ones_like(nel_impact),
-                    E_impact_eV=Ene * np.ones_like(nel_impact),
-                    costheta_impact=ct * np.ones_like(nel_impact),
-                    nel_mp_th=1,
-                    flag_seg=True)
+        N_ct = len(cos_theta_test)
+        E_grid = E_impact_eV_test * np.ones(N_ct)
+        chunks = self._test_chunks(N_ct, n_rep, N_mp_chunk)
+        for i_chunk, chunk in enumerate(chunks):
+            print(('%d/%d' % (i_chunk + 1, len(chunks))))
+
+            i_point_replace, impact_output = self._test_impacts(n_rep, E_grid[chunk], cos_theta_test[chunk], mass)
+            event_info = impact_output[2]
+            vx_replace, vy_replace, vz_replace = impact_output[7:10]
+            z_new_MPs, vx_new_MPs, vy_new_MPs, vz_new_MPs = impact_output[14:18]
 
             v_replace_mod = np.sqrt(
                 vx_replace**2 + vy_replace**2 + vz_replace**2)
@@ -452,23 +532,29 @@ class impact_management(object):
             E_new_MPs_eV = 0.5 * mass / qe * v_new_MPs_mod * v_new_MPs_mod
 
             E_all_MPs_eV = np.concatenate([E_replace_eV, E_new_MPs_eV])
+            i_point_all_MPs = np.concatenate([i_point_replace, np.int_(z_new_MPs)])
 
             extended_event_type = event_info['extended_event_type']
             for etype in list(self.sey_mod.event_types.keys()):
                 etype_name = self.sey_mod.event_types[etype]
                 extract_type = extract_ene_hist[etype_name]
-                # if there are no events of type etype
-                if E_all_MPs_eV[extended_event_type == etype].shape == (0,):
-                    pass
-                else:
+                mask_type = extended_event_type == etype
+                E_type_eV = E_all_MPs_eV[mask_type]
+                i_point_type = i_point_all_MPs[mask_type]
+                for i_point, i_ct in enumerate(range(chunk.start, chunk.stop)):
+                    E_this_ct = E_type_eV[i_point_type == i_point]
+                    # if there are no events of type etype
+                    if len(E_this_ct) == 0:
+                        continue
                     temp = extract_type[:, i_ct].copy()
-                    histf.compute_hist(E_all_MPs_eV[extended_event_type == etype], np.ones(
-                        len(E_all_MPs_eV[extended_event_type == etype])), 0., Dextract_ene, temp)
+                    histf.compute_hist(E_this_ct, np.ones(len(E_this_ct)), 0., Dextract_ene, temp)
                     extract_type[:, i_ct] = temp
-                extract_ene_hist[etype_name] = extract_type
 
         extract_ene_hist['emit_ene_g_hist'] = emit_ene_g_hist
 
         print('Done extracting energy distributions.')
 
+        if cache_entry is not None:
+            cache_entry[0].save(cache_entry[1], extract_ene_hist)
+
         return extract_ene_hist
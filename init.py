@@ -125,9 +125,29 @@ def read_parameter_files(pyecl_input_folder='./', skip_beam_files=False):
     return config_dict
 
 
+def _seed_mpi_rank(comm, mpi_seed):
+    # Statistically independent random streams spawned from a common seed
+    if mpi_seed is None:
+        mpi_seed = comm.bcast(np.random.SeedSequence().entropy, root=0)
+    seed_seq = np.random.SeedSequence(mpi_seed).spawn(comm.Get_size())[comm.Get_rank()]
+    np.random.seed(seed_seq.generate_state(4))
+    print('MPI rank %d/%d, random stream seeded from %r' % (comm.Get_rank(), comm.Get_size(), mpi_seed))
+
+
+def _split_cloud_over_ranks(thiscloud, n_ranks):
+    # Every rank simulates the full cloud with 1/n_ranks of the MPs
+    thiscloud.nel_mp_ref_0 = thiscloud.nel_mp_ref_0 * n_ranks
+    for nn in ['N_mp_regen', 'N_mp_regen_low', 'N_mp_after_regen',
+               'N_mp_soft_regen', 'N_mp_after_soft_regen',
+               'N_mp_async_regen', 'N_mp_after_async_regen']:
+        vv = getattr(thiscloud, nn)
+        if vv is not None:
+            setattr(thiscloud, nn, int(np.ceil(vv / float(n_ranks))))
+
+
 def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=False,
                                          skip_pyeclsaver=False, skip_spacech_ele=False,
-                                         spacech_ele=None,
+                                         spacech_ele=None, comm=None,
                                          ignore_kwargs=(), **kwargs):
 
     config_dict = read_parameter_files(pyecl_input_folder, skip_beam_files=skip_beam)
@@ -144,6 +164,16 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
     # Config object
     cc = mlm.obj_from_dict(config_dict)
 
+    # Particle-parallel MPI mode
+    if comm is not None:
+        if cc.flag_em_tracking:
+            raise ValueError('Electromagnetic tracking is not supported in MPI mode!')
+        _seed_mpi_rank(comm, cc.mpi_seed)
+        if comm.Get_rank() != 0:
+            # Log and progress are written by rank 0
+            cc.logfile_path = None
+            cc.progress_path = None
+
     # Init beam and possibly second beams
     if not skip_beam:
         flag_presence_sec_beams = len(cc.secondary_beams_file_list) > 0
@@ -180,10 +210,21 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
         if cloud_par.cc.switch_model=="ECLOUD_nunif" or cloud_par.cc.switch_model=="ECLOUD_nunif_charging":
             flag_non_unif_sey = True
 
+    # The inside raster is faster than the exact test only for polygons, for
+    # ellipses and rectangles the exact test is a single vectorized expression
+    N_cells_inside_raster = cc.N_cells_inside_raster
+    if N_cells_inside_raster is not None and cc.chamb_type in ('ellip', 'rect'):
+        print('Warning: N_cells_inside_raster is used only for polygonal chambers --> disabled!')
+        N_cells_inside_raster = None
+
     chamber_kwargs = {
         'flag_verbose_file': cc.flag_verbose_file,
         'flag_verbose_stdout': cc.flag_verbose_stdout,
         'flag_assume_convex': cc.flag_assume_convex,
+        'num_threads': cc.N_threads_chamber,
+        'N_bins_edge_index': cc.N_bins_edge_index,
+        'N_cells_inside_raster': N_cells_inside_raster,
+        'edge_index_cache_dir': cc.edge_index_cache_dir,
     }
 
     if cc.chamb_type == 'ellip':
@@ -225,7 +266,9 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
                                          target_grid_beam=b_par.target_grid_beam, N_nodes_discard_beam=b_par.N_nodes_discard_beam, N_min_Dh_main_beam=b_par.N_min_Dh_main_beam,
                                          chamb=chamb, sigmax=b_par.sigmax, sigmay=b_par.sigmay,
                                          x_beam_pos=b_par.x_beam_pos, y_beam_pos=b_par.y_beam_pos, save_beam_field_file_as=b_par.save_beam_field_file_as,
-                                         Nx=b_par.Nx, Ny=b_par.Ny, nimag=b_par.nimag, progress_mapgen_file=progress_mapgen_file)
+                                         Nx=b_par.Nx, Ny=b_par.Ny, nimag=b_par.nimag, N_processes_beam_field=b_par.N_processes_beam_field, progress_mapgen_file=progress_mapgen_file,
+                                         beam_field_cache_dir=cc.beam_field_cache_dir, beam_field_cache_max_size_MB=cc.beam_field_cache_max_size_MB,
+                                         flag_cache_sparse_solver=cc.flag_cache_sparse_solver, sparse_solver_cache_dir=cc.sparse_solver_cache_dir)
 
         sec_beams_list = []
         if flag_presence_sec_beams:
@@ -252,7 +295,9 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
                                                              chamb=chamb, sigmax=sb_par.sigmax, sigmay=sb_par.sigmay,
                                                              x_beam_pos=sb_par.x_beam_pos, y_beam_pos=sb_par.y_beam_pos, save_beam_field_file_as=sb_par.save_beam_field_file_as,
                                                              flag_secodary_beam=True, t_primary_beam=beamtim.t,
-                                                             Nx=sb_par.Nx, Ny=sb_par.Ny, nimag=sb_par.nimag, progress_mapgen_file=(cc.progress_path + ('_mapgen_sec_%d' % ii))))
+                                                             Nx=sb_par.Nx, Ny=sb_par.Ny, nimag=sb_par.nimag, N_processes_beam_field=sb_par.N_processes_beam_field, progress_mapgen_file=(cc.progress_path + ('_mapgen_sec_%d' % ii)),
+                                                             beam_field_cache_dir=cc.beam_field_cache_dir, beam_field_cache_max_size_MB=cc.beam_field_cache_max_size_MB,
+                                                             flag_cache_sparse_solver=cc.flag_cache_sparse_solver, sparse_solver_cache_dir=cc.sparse_solver_cache_dir))
     else:
         beamtim = None
         sec_beams_list = []
@@ -273,11 +318,13 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
 
             spacech_ele_sim = scc_em.space_charge_electromagnetic(chamb, cc.Dh_sc, b_par.gamma_rel, Dt_sc=cc.Dt_sc, sparse_solver=cc.sparse_solver, PyPICmode=cc.PyPICmode,
                                            f_telescope=cc.f_telescope, target_grid=cc.target_grid, N_nodes_discard=cc.N_nodes_discard, N_min_Dh_main=cc.N_min_Dh_main,
-                                           Dh_U_eV=cc.Dh_electric_energy)
+                                           Dh_U_eV=cc.Dh_electric_energy, flag_cache_sparse_solver=cc.flag_cache_sparse_solver,
+                                           sparse_solver_cache_dir=cc.sparse_solver_cache_dir)
         else:
             spacech_ele_sim = scc.space_charge(chamb, cc.Dh_sc, Dt_sc=cc.Dt_sc, sparse_solver=cc.sparse_solver, PyPICmode=cc.PyPICmode,
                                         f_telescope=cc.f_telescope, target_grid=cc.target_grid, N_nodes_discard=cc.N_nodes_discard, N_min_Dh_main=cc.N_min_Dh_main,
-                                        Dh_U_eV=cc.Dh_electric_energy)
+                                        Dh_U_eV=cc.Dh_electric_energy, flag_cache_sparse_solver=cc.flag_cache_sparse_solver,
+                                        sparse_solver_cache_dir=cc.sparse_solver_cache_dir)
 
     # Init cross-ionization
     flag_cross_ion = False
@@ -291,6 +338,9 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
 
         print('Initialize cloud %s:' % (thiscloud.cloud_name))
 
+        if comm is not None:
+            _split_cloud_over_ranks(thiscloud, comm.Get_size())
+
         # Init saver for all but default cloud (which is already initialized)
         if cloud_par is not cloud_par_list[0]:
             if not skip_pyeclsaver:
@@ -306,7 +356,7 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
                              N_mp_soft_regen=thiscloud.N_mp_soft_regen, N_mp_after_soft_regen=thiscloud.N_mp_after_soft_regen,
                              N_mp_async_regen=thiscloud.N_mp_async_regen, N_mp_after_async_regen=thiscloud.N_mp_after_async_regen,
                              charge=thiscloud.cloud_charge, mass=thiscloud.cloud_mass, flag_lifetime_hist = thiscloud.flag_lifetime_hist,
-                             name=thiscloud.cloud_name)
+                             name=thiscloud.cloud_name, flag_shrink_buffer=thiscloud.flag_shrink_MP_buffer)
 
         # Init secondary emission object
         if thiscloud.switch_model == 'perfect_absorber':
@@ -471,9 +521,13 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
                                        ene_dist_test_E_impact_eV=cc.ene_dist_test_E_impact_eV,
                                        Nbin_extract_ene=cc.Nbin_extract_ene,
                                        factor_ene_dist_max=cc.factor_ene_dist_max,
+                                       sey_test_cache_dir=cc.sey_test_cache_dir,
                                        flag_cross_ion=flag_cross_ion,
+                                       flag_step_profiler=cc.flag_step_profiler,
                                        save_only = thiscloud.save_only,
-                                       flag_electric_energy=(cc.Dh_electric_energy is not None)
+                                       flag_electric_energy=(cc.Dh_electric_energy is not None),
+                                       output_format=cc.output_format,
+                                       comm=comm
                                        )
             print('pyeclsaver saves to file: %s' % pyeclsaver.filen_main_outp)
 
@@ -508,7 +562,7 @@ def read_input_files_and_init_components(pyecl_input_folder='./', skip_beam=Fals
                                                           cc.B_map_file, cc.fact_Bmap, cc.B_zero_thrhld)
         elif cc.track_method == 'BorisMultipole':
             dynamics = dynmul.pusher_Boris_multipole(Dt=cc.Dt, N_sub_steps=cc.N_sub_steps, B_multip=cc.B_multip, B_skew=cc.B_skew,
-                        B0x=cc.B0x, B0y=cc.B0y, B0z=cc.B0z)
+                        B0x=cc.B0x, B0y=cc.B0y, B0z=cc.B0z, num_threads=cc.N_threads_tracking)
         else:
             raise inp_spec.PyECLOUD_ConfigException("track_method should be 'Boris' or 'StrongBdip' or 'StrongBgen' or 'BorisMultipole'")
 
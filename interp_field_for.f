@@ -17,6 +17,7 @@ Cf2py intent(in)  Nxg
 Cf2py intent(in)  Nyg
 Cf2py intent(out) Ex_n
 Cf2py intent(out) Ey_n
+Cf2py threadsafe
 
 
         implicit none
@@ -15,8 +15,15 @@ def obj_to_dict(obj):
     return dict_out
 
 def myloadmat(filename, squeeze = True):
-    import scipy.io as sio
-    dict_var=sio.loadmat(filename)
+    if filename.endswith('.h5'):
+        import h5py
+        with h5py.File(filename, 'r') as fid:
+            dict_var = {}
+            for kk in list(fid.keys()):
+                dict_var[kk] = np.array(fid[kk]).copy()
+    else:
+        import scipy.io as sio
+        dict_var=sio.loadmat(filename)
     if squeeze:
         for kk in list(dict_var.keys()):
             try:
@@ -0,0 +1,336 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import os
+import ast
+import json
+import time
+import itertools
+import traceback
+
+import numpy as np
+
+# Quantities copied from the output of each cloud to the scan store
+default_saved_observables = ['t', 'Nel_timep', 'Nel_imp_time', 'Nel_emit_time',
+                             'En_imp_eV_time', 'En_emit_eV_time', 'En_kin_eV_time',
+                             'cen_density', 'N_mp_time', 't_hist', 'N_mp_pass',
+                             'nel_impact_hist_tot', 'xg_hist']
+
+# Scan run by the worker processes, set before the pool is forked
+_worker_scan = None
+
+
+def grid_points(param_grid):
+    '''
+    Returns the list of points (dictionaries of input parameters) of the
+    cartesian product of the values in param_grid ({name: list of values}).
+    The last parameter varies fastest.
+    '''
+    names = list(param_grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[nn] for nn in names])]
+
+
+def _to_json(vv):
+    if isinstance(vv, np.ndarray):
+        return vv.tolist()
+    if isinstance(vv, np.generic):
+        return vv.item()
+    raise TypeError('Scan parameter value %r cannot be stored' % vv)
+
+
+def _run_point_in_worker(i_point):
+    return _worker_scan.run_point(i_point)
+
+
+class parameter_scan(object):
+    '''
+    Runs the buildup simulation defined in base_folder for each point of a
+    parameter scan (param_grid, or an explicit list of points), with at most
+    N_processes simulations running at the same time.
+
+    The computed beam fields, sparse LU factors and extracted SEY curves are
+    prepared once in the main process and inherited by the workers, which
+    are forked from it (a cache folder in scan_folder keeps them across
+    restarts). The process running the scan should not have run the OpenMP
+    kernels (N_threads_chamber, N_threads_tracking) with more than one
+    thread before, as the forked workers could then hang. The quantities in saved_observables are collected in
+    scan_folder/scan_results.h5, one group per point, and the points already
+    stored are skipped when the scan is run again (e.g. after a crash). The
+    full output of each point is kept in scan_folder/point_NNNNN.
+
+    Other keyword arguments are passed to all the simulations.
+    '''
+
+    def __init__(self, base_folder, scan_folder, param_grid=None, points=None,
+                 N_processes=1, t_end_sim=None, saved_observables=default_saved_observables,
+                 **common_kwargs):
+
+        if (param_grid is None) == (points is None):
+            raise ValueError('Exactly one among param_grid and points must be provided!')
+        if param_grid is not None:
+            points = grid_points(param_grid)
+        if int(N_processes) != N_processes or N_processes < 1:
+            raise ValueError('N_processes must be a positive integer!')
+
+        self.base_folder = base_folder
+        self.scan_folder = scan_folder
+        self.points = [dict(pp) for pp in points]
+        self.N_processes = int(N_processes)
+        self.t_end_sim = t_end_sim
+        self.saved_observables = list(saved_observables)
+        self.store_file = os.path.join(scan_folder, 'scan_results.h5')
+
+        cache_dir = os.path.join(scan_folder, 'cache')
+        self.common_kwargs = dict(common_kwargs)
+        self.common_kwargs.setdefault('flag_cache_sparse_solver', True)
+        self.common_kwargs.setdefault('sparse_solver_cache_dir', cache_dir)
+        self.common_kwargs.setdefault('beam_field_cache_dir', cache_dir)
+        self.common_kwargs.setdefault('sey_test_cache_dir', cache_dir)
+
+        if not os.path.isdir(scan_folder):
+            os.makedirs(scan_folder)
+
+        self._init_store()
+
+    def _points_json(self):
+        return json.dumps(self.points, default=_to_json, sort_keys=True)
+
+    def _init_store(self):
+        import h5py
+        with h5py.File(self.store_file, 'a') as fid:
+            if 'points' in fid.attrs:
+                if fid.attrs['points'] != self._points_json():
+                    raise ValueError('%s belongs to a different scan!' % self.store_file)
+            else:
+                fid.attrs['base_folder'] = self.base_folder
+                fid.attrs['points'] = self._points_json()
+                fid.attrs['param_names'] = json.dumps(sorted(set().union(*[pp.keys() for pp in self.points])))
+
+    def done_points(self):
+        import h5py
+        with h5py.File(self.store_file, 'r') as fid:
+            return sorted([int(gg.split('_')[1]) for gg in fid.keys()
+                           if gg.startswith('point_') and fid[gg].attrs.get('done', False)])
+
+    def pending_points(self):
+        done = set(self.done_points())
+        return [ii for ii in range(len(self.points)) if ii not in done]
+
+    def _point_folder(self, i_point):
+        return os.path.join(self.scan_folder, 'point_%05d' % i_point)
+
+    def _sim_kwargs(self, i_point):
+        point_folder = self._point_folder(i_point)
+        sim_kwargs = dict(self.common_kwargs)
+        sim_kwargs.update(self.points[i_point])
+        sim_kwargs.update({'filen_main_outp': os.path.join(point_folder, 'Pyecltest.mat'),
+                           'logfile_path': os.path.join(point_folder, 'logfile.txt'),
+                           'progress_path': os.path.join(point_folder, 'progress.txt')})
+        return sim_kwargs
+
+    def prepare_shared_artefacts(self, i_point=0):
+        '''
+        Builds the components of one point in this process, so that chamber
+        dependent quantities are computed once and reused by all the workers.
+
+        The workers are forked afterwards and libgomp is not fork-safe once a
+        parallel region has run on more than one thread (the workers would
+        hang), so the OpenMP kernels run here on a single thread. The thread
+        numbers do not change the shared artefacts, the workers use the
+        requested ones.
+        '''
+        from .buildup_simulation import BuildupSimulation
+        sim_kwargs = self._sim_kwargs(i_point)
+        for kk in ['filen_main_outp', 'logfile_path', 'progress_path']:
+            del sim_kwargs[kk]
+        sim_kwargs.update({'N_threads_chamber': 1, 'N_threads_tracking': 1, 'N_threads_clouds': 1})
+        print('Scan: preparing shared artefacts with point %d' % i_point)
+        BuildupSimulation(pyecl_input_folder=self.base_folder, skip_pyeclsaver=True, **sim_kwargs)
+
+    def run_point(self, i_point):
+        '''
+        Runs one point and returns (i_point, outputs, run time, error): outputs
+        is a dictionary with the saved observables of each cloud, error the
+        traceback if the simulation failed (outputs is then None).
+        '''
+        from .buildup_simulation import BuildupSimulation
+
+        t_start = time.time()
+        point_folder = self._point_folder(i_point)
+        if not os.path.isdir(point_folder):
+            os.makedirs(point_folder)
+        try:
+            sim = BuildupSimulation(pyecl_input_folder=self.base_folder, **self._sim_kwargs(i_point))
+            sim.run(t_end_sim=self.t_end_sim)
+
+            outputs = {}
+            for cloud in sim.cloud_list:
+                saved_dict = cloud.pyeclsaver.build_outp_dict(sim)
+                # single-cloud simulations have no cloud name
+                cloud_name = cloud.name if cloud.name is not None else 'cloud'
+                outputs[cloud_name] = {kk: np.array(saved_dict[kk]) for kk in self.saved_observables
+                                       if kk in saved_dict}
+        except Exception:
+            return i_point, None, time.time() - t_start, traceback.format_exc()
+
+        return i_point, outputs, time.time() - t_start, None
+
+    def _store_point(self, i_point, outputs, t_run):
+        import h5py
+        # Written by the main process only, the group is flagged as done last
+        with h5py.File(self.store_file, 'a') as fid:
+            grp_name = 'point_%05d' % i_point
+            if grp_name in fid:
+                del fid[grp_name]
+            grp = fid.create_group(grp_name)
+            grp.attrs['params'] = json.dumps(self.points[i_point], default=_to_json, sort_keys=True)
+            grp.attrs['t_run'] = t_run
+            for cloud_name, outp in outputs.items():
+                grp_cloud = grp.create_group(cloud_name)
+                for kk, vv in outp.items():
+                    grp_cloud.create_dataset(kk, data=vv)
+            grp.attrs['done'] = True
+
+    def run(self):
+        global _worker_scan
+
+        pending = self.pending_points()
+        print('Scan: %d points, %d already done, %d to run on %d processes' % (
+            len(self.points), len(self.points) - len(pending), len(pending), self.N_processes))
+        if len(pending) == 0:
+            return []
+
+        self.prepare_shared_artefacts(pending[0])
+
+        failed = []
+        if self.N_processes == 1:
+            results = map(self.run_point, pending)
+            pool = None
+        else:
+            import multiprocessing as mp
+            _worker_scan = self
+            # The workers are forked here, once, and inherit the shared
+            # artefacts (no process is forked while the store is open)
+            pool = mp.get_context('fork').Pool(processes=self.N_processes)
+            results = pool.imap_unordered(_run_point_in_worker, pending)
+
+        try:
+            for i_point, outputs, t_run, error in results:
+                if error is not None:
+                    print('Scan: point %d %s FAILED:\n%s' % (i_point, self.points[i_point], error))
+                    failed.append(i_point)
+                    continue
+                self._store_point(i_point, outputs, t_run)
+                print('Scan: point %d %s done in %.1f s' % (i_point, self.points[i_point], t_run))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            _worker_scan = None
+
+        return failed
+
+
+def load_scan_results(store_file):
+    '''
+    Returns the list of points of the scan and a dictionary
+    {i_point: {cloud_name: {observable: array}}} with the points done.
+    '''
+    import h5py
+    results = {}
+    with h5py.File(store_file, 'r') as fid:
+        points = json.loads(fid.attrs['points'])
+        for gg in fid.keys():
+            if gg.startswith('point_') and fid[gg].attrs.get('done', False):
+                results[int(gg.split('_')[1])] = {
+                    cloud_name: {kk: fid[gg][cloud_name][kk][()] for kk in fid[gg][cloud_name].keys()}
+                    for cloud_name in fid[gg].keys()}
+    return points, results
+
+
+def _parse_value(string):
+    try:
+        return ast.literal_eval(string)
+    except (ValueError, SyntaxError):
+        return string
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Runs a buildup simulation for each point of a parameter grid.',
+        epilog='Example: python -m PyECLOUD.parameter_scan --input-folder sim --scan-folder scan '
+               '--scan del_max 1.3 1.5 1.7 --scan fact_beam 1e11 2e11 --N-processes 4')
+    parser.add_argument('--input-folder', required=True, help='Folder with the input files of the base simulation')
+    parser.add_argument('--scan-folder', required=True, help='Folder for the results (resumed if existing)')
+    parser.add_argument('--scan', nargs='+', action='append', required=True, metavar=('NAME', 'VALUE'),
+                        help='Scanned input parameter and its values (can be repeated)')
+    parser.add_argument('--set', nargs=2, action='append', default=[], metavar=('NAME', 'VALUE'),
+                        help='Input parameter set for all the points (can be repeated)')
+    parser.add_argument('--N-processes', type=int, default=1, help='Simulations running at the same time')
+    parser.add_argument('--t-end-sim', type=float, default=None, help='Simulated time for each point')
+    args = parser.parse_args()
+
+    param_grid = {}
+    for scan_spec in args.scan:
+        if len(scan_spec) < 2:
+            parser.error('--scan needs a parameter name and at least one value')
+        param_grid[scan_spec[0]] = [_parse_value(vv) for vv in scan_spec[1:]]
+
+    scan = parameter_scan(args.input_folder, args.scan_folder, param_grid=param_grid,
+                          N_processes=args.N_processes, t_end_sim=args.t_end_sim,
+                          **{nn: _parse_value(vv) for nn, vv in args.set})
+    failed = scan.run()
+    if len(failed) > 0:
+        print('Scan: %d points failed, run again to retry them' % len(failed))
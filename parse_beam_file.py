@@ -95,4 +95,5 @@ class beam_descr_from_fil:
         self.Nx = cc.Nx
         self.Ny = cc.Ny
         self.nimag = cc.nimag
+        self.N_processes_beam_field = cc.N_processes_beam_field
 
@@ -0,0 +1,206 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import os
+import hashlib
+
+import numpy as np
+
+
+# Indexes already built in this process, keyed by polygon and bin numbers
+_index_cache = {}
+
+
+class polyg_edge_index(object):
+    '''
+    Uniform-bin index over the edges of a polygon, used by the non-convex
+    chamber kernels to test only the edges that can be relevant for a
+    given particle:
+
+    - y slabs (N_bins): an edge is listed in all slabs overlapped by its
+      y-range, so the crossing-number test for a point only needs the
+      edges of the point's slab;
+    - x-y cells (N_bins x N_bins): an edge is listed in all cells overlapped
+      by its bounding box, so an intersection with a particle segment can
+      only be found among the edges of the cells overlapped by the segment's
+      bounding box.
+
+    The bin of a coordinate is computed with the same expression here and
+    in the compiled kernels, so that the candidate lists are conservative.
+    '''
+
+    def __init__(self, Vx, Vy, N_bins):
+
+        # Vx, Vy are closed (last vertex equal to the first)
+        N_edg = len(Vx) - 1
+        self.N_bins = N_bins
+
+        self.x0 = np.min(Vx)
+        self.y0 = np.min(Vy)
+        self.x1 = np.max(Vx)
+        self.y1 = np.max(Vy)
+        self.dx_bin = (self.x1 - self.x0) / N_bins
+        self.dy_bin = (self.y1 - self.y0) / N_bins
+
+        # Edge ii goes from vertex ii to vertex ii + 1. Bounding boxes are
+        # slightly enlarged to include intersections found at edge ends
+        pad_x = 1e-9 * (self.x1 - self.x0)
+        pad_y = 1e-9 * (self.y1 - self.y0)
+        ex_min = np.minimum(Vx[:-1], Vx[1:]) - pad_x
+        ex_max = np.maximum(Vx[:-1], Vx[1:]) + pad_x
+        ey_min = np.minimum(Vy[:-1], Vy[1:]) - pad_y
+        ey_max = np.maximum(Vy[:-1], Vy[1:]) + pad_y
+
+        i_min = self._bin(ex_min, self.x0, self.dx_bin)
+        i_max = self._bin(ex_max, self.x0, self.dx_bin)
+        j_min = self._bin(ey_min, self.y0, self.dy_bin)
+        j_max = self._bin(ey_max, self.y0, self.dy_bin)
+
+        # Slabs
+        edges = np.repeat(np.arange(N_edg), j_max - j_min + 1)
+        slabs = np.concatenate([np.arange(j0, j1 + 1) for j0, j1 in zip(j_min, j_max)])
+        self.slab_ptr, self.slab_edges = self._to_csr(slabs, edges, N_bins)
+
+        # Cells (cell index i * N_bins + j)
+        cells_list = []
+        edges_list = []
+        for ii in range(N_edg):
+            ic, jc = np.meshgrid(np.arange(i_min[ii], i_max[ii] + 1),
+                                 np.arange(j_min[ii], j_max[ii] + 1), indexing='ij')
+            cells_list.append((ic * N_bins + jc).ravel())
+            edges_list.append(np.full(ic.size, ii))
+        self.cell_ptr, self.cell_edges = self._to_csr(
+            np.concatenate(cells_list), np.concatenate(edges_list), N_bins * N_bins)
+
+    def _bin(self, coord, coord0, d_bin):
+        # Same as the compiled kernels: floor, then clamped to the grid
+        return np.clip(np.floor((coord - coord0) / d_bin), 0, self.N_bins - 1).astype(np.int32)
+
+    def _to_csr(self, bins, edges, N_tot):
+        ind_sort = np.argsort(bins, kind='stable')
+        ptr = np.zeros(N_tot + 1, dtype=np.int32)
+        ptr[1:] = np.cumsum(np.bincount(bins, minlength=N_tot))
+        return ptr, np.ascontiguousarray(edges[ind_sort], dtype=np.int32)
+
+    def to_dict(self):
+        return {kk: getattr(self, kk) for kk in [
+            'N_bins', 'x0', 'y0', 'x1', 'y1', 'dx_bin', 'dy_bin',
+            'slab_ptr', 'slab_edges', 'cell_ptr', 'cell_edges']}
+
+    @classmethod
+    def from_dict(cls, dict_ind):
+        obj = cls.__new__(cls)
+        for kk, vv in dict_ind.items():
+            setattr(obj, kk, vv)
+        obj.N_bins = int(obj.N_bins)
+        for kk in ['x0', 'y0', 'x1', 'y1', 'dx_bin', 'dy_bin']:
+            setattr(obj, kk, float(getattr(obj, kk)))
+        return obj
+
+
+def default_N_bins(N_edg):
+    return int(np.clip(2 * np.sqrt(N_edg), 4, 512))
+
+
+def get_edge_index(Vx, Vy, N_bins=None, cache_dir=None):
+    '''
+    Returns the edge index of the (closed) polygon Vx, Vy, reusing an index
+    built earlier in this process or stored in cache_dir (if given).
+    Otherwise the index is built and, if cache_dir is given, saved there.
+    '''
+
+    if N_bins is None:
+        N_bins = default_N_bins(len(Vx) - 1)
+    N_bins = int(N_bins)
+
+    hasher = hashlib.sha1()
+    hasher.update(np.ascontiguousarray(Vx, dtype=np.float64).tobytes())
+    hasher.update(np.ascontiguousarray(Vy, dtype=np.float64).tobytes())
+    hasher.update(str(N_bins).encode())
+    key = hasher.hexdigest()
+
+    if key in _index_cache:
+        return _index_cache[key]
+
+    edge_index = None
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, 'edge_index_%s.npz' % key)
+        if os.path.isfile(cache_file):
+            try:
+                with np.load(cache_file) as dict_ind:
+                    edge_index = polyg_edge_index.from_dict({kk: dict_ind[kk] for kk in dict_ind.files})
+                print('Edge index loaded from %s' % cache_file)
+            except (OSError, KeyError, ValueError) as err:
+                print('Warning: edge index could not be loaded from %s (%s)' % (cache_file, err))
+                edge_index = None
+
+    if edge_index is None:
+        edge_index = polyg_edge_index(Vx, Vy, N_bins)
+        if cache_file is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file and rename, so that concurrent runs
+            # never see a partially written index
+            temp_file = cache_file + '.%d.tmp' % os.getpid()
+            try:
+                with open(temp_file, 'wb') as fid:
+                    np.savez(fid, **edge_index.to_dict())
+                os.replace(temp_file, cache_file)
+            except OSError as err:
+                print('Warning: edge index could not be saved to %s (%s)' % (cache_file, err))
+                if os.path.isfile(temp_file):
+                    os.remove(temp_file)
+
+    _index_cache[key] = edge_index
+    return edge_index
@@ -59,6 +59,8 @@ from . import hist_for as histf
 import time
 from scipy.constants import e as qe
 from . import myloadmat_to_obj as mlm
+from . import h5_outp_writer as h5ow
+from . import step_profiler as stprof
 import shutil
 try:
     # cPickle is faster in python2
@@ -68,6 +70,54 @@ except ImportError:
     import pickle
 
 
+# Quantities saved step by step and pass by pass in the main output
+saved_every_timestep_list = ['En_emit_eV_time',
+                             'En_imp_eV_time',
+                             'En_kin_eV_time',
+                             'Nel_emit_time',
+                             'Nel_imp_time',
+                             'Nel_timep',
+                             'cen_density',
+                             'lam_t_array',
+                             'N_mp_time',
+                             'nel_mp_ref_time',
+                             'Nel_cross_ion',
+                             'N_mp_cross_ion',
+                             'DN_cross_ion',
+                             'En_electric_eV_time',
+                             't']
+
+saved_every_passage_list = ['En_hist',
+                            'all_Ekin_hist',
+                            't_En_hist',
+                            'N_mp_corrected_pass',
+                            'N_mp_impact_pass',
+                            'N_mp_pass',
+                            'N_mp_ref_pass',
+                            'energ_eV_impact_hist',
+                            'energ_eV_impact_seg',
+                            'nel_hist',
+                            'nel_hist_det',
+                            'nel_hist_impact_seg',
+                            'nel_hist_emit_seg',
+                            'nel_impact_hist_scrub',
+                            'nel_impact_hist_tot',
+                            'cos_angle_hist',
+                            't_hist',
+                            'lifetime_hist',
+                            't_lifetime_hist']
+
+
+# Numbers of MPs, summed over the ranks in MPI mode (the other quantities are averaged)
+mpi_summed_list = ['N_mp_time',
+                   'N_mp_cross_ion',
+                   'N_mp_corrected_pass',
+                   'N_mp_impact_pass',
+                   'N_mp_pass',
+                   'prof_N_mp_steps_pass',
+                   'prof_N_mp_impact_pass']
+
+
 class pyecloud_saver:
 
     def __init__(self, logfile_path):
@@ -124,12 +174,23 @@ class pyecloud_saver:
                         ene_dist_test_E_impact_eV=None,
                         Nbin_extract_ene=None,
                         factor_ene_dist_max=None,
+                        sey_test_cache_dir=None,
                         flag_cross_ion=False,
+                        flag_step_profiler=False,
                         save_only=None,
-                        flag_electric_energy=False
+                        flag_electric_energy=False,
+                        output_format='mat',
+                        comm=None
                         ):
         print('Start pyecloud_saver observation')
 
+        if output_format not in ('mat', 'h5'):
+            raise ValueError('output_format must be either "mat" or "h5"!')
+        self.output_format = output_format
+        self.h5_writer = None
+
+        if self.output_format == 'h5' and not filen_main_outp.endswith('.h5'):
+            filen_main_outp = filen_main_outp.split('.mat')[0] + '.h5'
         self.filen_main_outp = filen_main_outp
 
         self.save_only = save_only
@@ -159,6 +220,7 @@ class pyecloud_saver:
         self.flag_detailed_MP_info = flag_detailed_MP_info
 
         self.flag_cross_ion = flag_cross_ion
+        self.flag_step_profiler = flag_step_profiler
 
         # cloud info
         self.flag_multiple_clouds = flag_multiple_clouds
@@ -174,6 +236,9 @@ class pyecloud_saver:
         # Init checkpoint saving
         self._checkpoint_init(checkpoint_DT, checkpoint_folder)
 
+        # Init reduction of the data over the MPI ranks
+        self._mpi_reduce_init(comm)
+
         # Copying main output to safety
         self._copy_main_outp_init(copy_main_outp_DT, copy_main_outp_folder)
 
@@ -225,7 +290,8 @@ class pyecloud_saver:
             self.sey_test_E_impact_eV = np.array(list(np.arange(0, 499., 1.)) + list(np.arange(500., 2000, 5)))
             self.sey_test_cos_theta = np.linspace(0, 1., 10)
             self.sey_test_deltas = \
-                impact_man.extract_sey_curves(n_rep, self.sey_test_E_impact_eV, self.sey_test_cos_theta, MP_e.charge, MP_e.mass)
+                impact_man.extract_sey_curves(n_rep, self.sey_test_E_impact_eV, self.sey_test_cos_theta, MP_e.charge, MP_e.mass,
+                                              cache_dir=sey_test_cache_dir)
         else:
             self.sey_test_E_impact_eV = 0.
             self.sey_test_cos_theta = 0.
@@ -236,7 +302,8 @@ class pyecloud_saver:
             n_rep = int(1e5)
             self.ene_dist_test_cos_theta = np.linspace(0., 1., 10)
             self.emit_ene_dist_test = impact_man.extract_energy_distributions(n_rep, self.ene_dist_test_E_impact_eV,
-                self.ene_dist_test_cos_theta, mass=MP_e.mass, Nbin_extract_ene=self.Nbin_extract_ene, factor_ene_dist_max=self.factor_ene_dist_max)
+                self.ene_dist_test_cos_theta, mass=MP_e.mass, Nbin_extract_ene=self.Nbin_extract_ene, factor_ene_dist_max=self.factor_ene_dist_max,
+                cache_dir=sey_test_cache_dir)
         else:
             self.ene_dist_test_cos_theta = 0.
             self.ene_dist_test_E_impact_eV = 0.
@@ -251,6 +318,84 @@ class pyecloud_saver:
             flog.write('Initialization finished on %s\n'%timestr)
             flog.close()
 
+    def restart_observing(self, impact_man):
+        """
+        Starts a new observation with the settings of the last call to
+        start_observing. The step-by-step buffers are reused (zeroed in
+        place), the impact histograms are zeroed, and the SEY curves and
+        energy distributions already extracted are kept.
+        """
+
+        self.h5_writer = None
+
+        # Step by step data
+        self.i_last_save = -1
+        self.t_last_save = -1.
+        self.Nel_impact_last_step_group = 0
+        self.Nel_emit_last_step_group = 0
+        self.En_imp_last_step_group_eV = 0
+        self.En_emit_last_step_group_eV = 0
+        for mm in self._stepbystep_members():
+            getattr(self, mm)[:] = 0.
+        if self.flag_el_dens_probes:
+            self.el_dens_at_probes[:] = 0.
+        for kk in list(self.sbs_custom_data.keys()):
+            self.sbs_custom_data[kk][:] = 0.
+
+        # Pass by pass data
+        self.t_hist = []
+        self.nel_impact_hist_tot = []
+        self.nel_impact_hist_scrub = []
+        self.energ_eV_impact_hist = []
+        self.nel_hist = []
+        self.N_mp_impact_pass = []
+        self.N_mp_corrected_pass = []
+        self.N_mp_pass = []
+        self.N_mp_ref_pass = []
+        if impact_man.flag_seg:
+            self.nel_hist_impact_seg = []
+            self.nel_hist_emit_seg = []
+            self.energ_eV_impact_seg = []
+            if impact_man.flag_En_hist_seg:
+                self.En_hist_seg = [ [] for _ in range(impact_man.chamb.N_vert)]
+        if self.flag_hist_det:
+            self.nel_hist_det = []
+        for kk in list(self.pbp_prof_data.keys()):
+            self.pbp_prof_data[kk] = []
+        for kk in list(self.pbp_custom_data.keys()):
+            self.pbp_custom_data[kk] = []
+
+        # Energy, angle and lifetime histograms
+        self.t_last_En_hist = -1.
+        self.En_hist = []
+        self.t_En_hist = []
+        if self.flag_cos_angle_hist:
+            self.cos_angle_hist = []
+        if self.flag_lifetime_hist:
+            self.t_last_lifetime_hist = -1.
+            self.lifetime_hist = []
+            self.t_lifetime_hist = []
+        self.all_Ekin_hist = []
+        impact_man.reset_all_hist()
+
+        # State savings, checkpoints and videos
+        if self.flag_save_MP_state:
+            self.i_obs = 0
+        if self.flag_save_simulation_state:
+            self.i_obs_sim = 0
+        if self.flag_save_checkpoint:
+            self.t_last_checkp = 0
+            self.i_checkp = 0
+        if self.flag_copy_main_output:
+            self.t_last_copy = 0
+        self._rho_video_init(int(self.flag_video))
+        self._sc_video_init(int(self.flag_sc_video))
+
+        self.t_sc_video = []
+        self.U_sc_eV = []
+        self.nel_hist_line[:] = 0.
+        self.mpi_n_reduced = {}
+
     def witness(self, MP_e, beamtim, spacech_ele, impact_man,
                 dynamics, gas_ion_flag, resgasion, t_ion,
                 t_sc_ON, photoem_flag, phemiss, flag_presence_sec_beams,
@@ -268,11 +413,12 @@ class pyecloud_saver:
         self._sim_state_save(beamtim, spacech_ele, t_sc_ON, flag_presence_sec_beams,
                              sec_beams_list, self.flag_multiple_clouds, cloud_list)
 
-        # Check for save video charge density
-        self._rho_video_save(spacech_ele, beamtim, rho_cloud)
+        if self.flag_mpi_writer:
+            # Check for save video charge density
+            self._rho_video_save(spacech_ele, beamtim, rho_cloud)
 
-        # Check for save video electric field
-        self._sc_video_save(spacech_ele, beamtim)
+            # Check for save video electric field
+            self._sc_video_save(spacech_ele, beamtim)
 
         # Check for energy and cos angle hist update
         self._energy_cos_and_lifetime_angle_hist_save(beamtim, impact_man, MP_e)
@@ -295,6 +441,9 @@ class pyecloud_saver:
 
             self._pass_by_pass_data_save(MP_e, impact_man, beamtim, buildup_sim)
 
+            if self.comm is not None:
+                self._mpi_reduce_pass_data()
+
             # I want all elements that go to the output file to be members of this object
             self.xg_hist = impact_man.xg_hist
             self.En_g_hist = impact_man.En_g_hist
@@ -305,13 +454,14 @@ class pyecloud_saver:
             self.b_spac = beamtim.b_spac
             self.area = impact_man.chamb.area
 
-            sio.savemat(self.filen_main_outp, self.build_outp_dict(buildup_sim), oned_as='row')
+            if self.flag_mpi_writer:
+                self._main_outp_save(buildup_sim)
 
-            # Check for checkpoint save state
-            self._checkpoint_save(beamtim, spacech_ele, t_sc_ON, flag_presence_sec_beams,
-                                  sec_beams_list, self.flag_multiple_clouds, cloud_list)
+                # Check for checkpoint save state
+                self._checkpoint_save(beamtim, spacech_ele, t_sc_ON, flag_presence_sec_beams,
+                                      sec_beams_list, self.flag_multiple_clouds, cloud_list)
 
-            self._copy_main_outp_save(beamtim)
+                self._copy_main_outp_save(beamtim)
 
         if beamtim.flag_new_bunch_pass:
             self._logfile_progressfile_stofile(beamtim, MP_e)
@@ -365,6 +515,12 @@ class pyecloud_saver:
             self.nel_hist_det_line = np.zeros(self.Nxg_hist_det, float)
             self.nel_hist_det = []
 
+        # Step profiler
+        self.pbp_prof_data = {}
+        if self.flag_step_profiler:
+            for kk in stprof.pass_by_pass_keys():
+                self.pbp_prof_data[kk] = []
+
         # Custom data
         self.pbp_custom_data = {}
         if self.pass_by_pass_custom_observables is not None:
@@ -421,12 +577,36 @@ class pyecloud_saver:
         if self.flag_hist_det:
             self.nel_hist_det.append(self.nel_hist_det_line.copy())
 
+        if self.flag_step_profiler:
+            prof_data = buildup_sim.step_profiler.save_pass_data(self.cloud_name)
+            for kk in list(self.pbp_prof_data.keys()):
+                self.pbp_prof_data[kk].append(prof_data[kk])
+
         if self.pass_by_pass_custom_observables is not None:
             for kk in list(self.pass_by_pass_custom_observables.keys()):
                self.pbp_custom_data[kk].append(
                        self.pass_by_pass_custom_observables[kk](buildup_sim))
 
-    def build_outp_dict(self, buildup_sim):
+    def _main_outp_save(self, buildup_sim):
+        if self.output_format == 'h5':
+            # Only the rows added since the last passage are written
+            if self.h5_writer is None or self.h5_writer.filename != self.filen_main_outp:
+                self.h5_writer = h5ow.h5_outp_writer(self.filen_main_outp,
+                                                     growing_keys=self._get_growing_outp_keys(),
+                                                     growth_axis={'el_dens_at_probes': 1, 'En_hist_seg': 1})
+            self.h5_writer.write(self.build_outp_dict(buildup_sim, convert_to_arrays=False))
+        else:
+            sio.savemat(self.filen_main_outp, self.build_outp_dict(buildup_sim), oned_as='row')
+
+    def _get_growing_outp_keys(self):
+        growing_keys = saved_every_timestep_list + saved_every_passage_list
+        growing_keys += ['t_sc_video', 'U_sc_eV', 'el_dens_at_probes', 'En_hist_seg']
+        growing_keys += list(self.sbs_custom_data.keys())
+        growing_keys += list(self.pbp_prof_data.keys())
+        growing_keys += list(self.pbp_custom_data.keys())
+        return growing_keys
+
+    def build_outp_dict(self, buildup_sim, convert_to_arrays=True):
         saved_dict = {
                     't_hist': self.t_hist,
                     'nel_hist': self.nel_hist,
@@ -440,8 +620,8 @@ class pyecloud_saver:
                     'all_Ekin_hist': self.all_Ekin_hist,
                     't_En_hist': self.t_En_hist,
                     'b_spac': self.b_spac,
-                    't_sc_video': np.array(self.t_sc_video),
-                    'U_sc_eV': np.array(self.U_sc_eV),
+                    't_sc_video': self.t_sc_video,
+                    'U_sc_eV': self.U_sc_eV,
                     'N_mp_impact_pass': self.N_mp_impact_pass,
                     'N_mp_corrected_pass': self.N_mp_corrected_pass,
                     'N_mp_pass': self.N_mp_pass,
@@ -485,6 +665,8 @@ class pyecloud_saver:
 
         saved_dict.update(self._stepbystep_get_dict())
 
+        saved_dict.update(self.pbp_prof_data)
+
         #custom step-by-step
         saved_dict.update(self.pbp_custom_data)
 
@@ -493,8 +675,9 @@ class pyecloud_saver:
             for kk in list(self.save_once_custom_observables.keys()):
                 saved_dict[kk] = self.save_once_custom_observables[kk](buildup_sim)
 
-        for kk in list(saved_dict.keys()):
-            saved_dict[kk] = np.array(saved_dict[kk])
+        if convert_to_arrays:
+            for kk in list(saved_dict.keys()):
+                saved_dict[kk] = np.array(saved_dict[kk])
 
         if self.save_only is not None:
             old_dict = saved_dict
@@ -543,6 +726,88 @@ class pyecloud_saver:
                 self.i_checkp += 1
                 self.t_last_checkp = beamtim.tt_curr
 
+    def _mpi_reduce_init(self, comm):
+        # In the particle-parallel mode every rank simulates the full cloud
+        # with a fraction of the MPs, the output is written by rank 0
+        self.comm = comm
+        self.mpi_n_reduced = {}
+        if comm is None:
+            self.mpi_rank = 0
+            self.mpi_size = 1
+        else:
+            self.mpi_rank = comm.Get_rank()
+            self.mpi_size = comm.Get_size()
+            if self.flag_save_MP_state or self.flag_save_simulation_state or self.flag_save_checkpoint:
+                raise ValueError('MP state, simulation state and checkpoint saving are not supported in MPI mode!')
+        self.flag_mpi_writer = (self.mpi_rank == 0)
+
+    def _mpi_reduce_targets(self):
+        # Containers growing along their first axis, with the flag telling if
+        # the quantity is a number of MPs (summed over the ranks) or an
+        # estimate from the local MPs (averaged over the ranks)
+        targets = []
+        for mm in self._stepbystep_members():
+            if mm not in ('t', 'lam_t_array'):
+                targets.append((mm, getattr(self, mm), mm in mpi_summed_list))
+        if self.flag_el_dens_probes:
+            targets.append(('el_dens_at_probes', self.el_dens_at_probes.T, False))
+        for kk in sorted(self.sbs_custom_data.keys()):
+            targets.append(('sbs_' + kk, self.sbs_custom_data[kk], False))
+
+        for mm in saved_every_passage_list:
+            vv = getattr(self, mm, None)
+            if isinstance(vv, list) and not mm.startswith('t_'):
+                targets.append((mm, vv, mm in mpi_summed_list))
+        if isinstance(self.En_hist_seg, list):
+            for iseg, vv in enumerate(self.En_hist_seg):
+                targets.append(('En_hist_seg_%d' % iseg, vv, False))
+        for kk in sorted(self.pbp_prof_data.keys()):
+            targets.append((kk, self.pbp_prof_data[kk], kk in mpi_summed_list))
+        for kk in sorted(self.pbp_custom_data.keys()):
+            targets.append(('pbp_' + kk, self.pbp_custom_data[kk], False))
+        return targets
+
+    def _mpi_reduce_pass_data(self):
+        # The rows added since the last passage are reduced to rank 0 with a
+        # single collective
+        from mpi4py import MPI
+
+        chunks = []
+        for name, container, flag_sum in self._mpi_reduce_targets():
+            if isinstance(container, list):
+                i_end = len(container)
+            else:
+                i_end = self.i_last_save + 1
+            i_start = self.mpi_n_reduced.get(name, 0)
+            rows = np.array(container[i_start:i_end], dtype=np.float64)
+            chunks.append((name, container, flag_sum, i_start, i_end, rows))
+            self.mpi_n_reduced[name] = i_end
+
+        sendbuf = np.concatenate([np.zeros(0)] + [rows.ravel() for _, _, _, _, _, rows in chunks])
+        if self.flag_mpi_writer:
+            recvbuf = np.empty_like(sendbuf)
+        else:
+            recvbuf = None
+        self.comm.Reduce(sendbuf, recvbuf, op=MPI.SUM, root=0)
+
+        if not self.flag_mpi_writer:
+            return
+
+        i_buf = 0
+        for name, container, flag_sum, i_start, i_end, rows in chunks:
+            reduced = recvbuf[i_buf:i_buf + rows.size].reshape(rows.shape)
+            i_buf += rows.size
+            if not flag_sum:
+                reduced /= self.mpi_size
+            if isinstance(container, list):
+                for ii in range(i_end - i_start):
+                    if np.ndim(container[i_start + ii]) == 0:
+                        container[i_start + ii] = type(container[i_start + ii])(reduced[ii])
+                    else:
+                        container[i_start + ii] = reduced[ii].copy()
+            else:
+                container[i_start:i_end] = reduced
+
     def _copy_main_outp_to_safety(self, outpath, beamtim):
         shutil.copy(self.filen_main_outp, outpath)
         self.t_last_copy = beamtim.tt_curr
@@ -589,42 +854,6 @@ class pyecloud_saver:
         idx_t_sc_video = (np.abs(dict_history['t_sc_video'] - last_t)).argmin()
 
         # Delete everything in Pyecltest.mat recorded after the last checkpoint
-        saved_every_timestep_list = ['En_emit_eV_time',
-                                     'En_imp_eV_time',
-                                     'En_kin_eV_time',
-                                     'Nel_emit_time',
-                                     'Nel_imp_time',
-                                     'Nel_timep',
-                                     'cen_density',
-                                     'lam_t_array',
-                                     'N_mp_time',
-                                     'nel_mp_ref_time',
-                                     'Nel_cross_ion',
-                                     'N_mp_cross_ion',
-                                     'DN_cross_ion',
-                                     'En_electric_eV_time',
-                                     't']
-
-        saved_every_passage_list = ['En_hist',
-                                    'all_Ekin_hist',
-                                    't_En_hist',
-                                    'N_mp_corrected_pass',
-                                    'N_mp_impact_pass',
-                                    'N_mp_pass',
-                                    'N_mp_ref_pass',
-                                    'energ_eV_impact_hist',
-                                    'energ_eV_impact_seg',
-                                    'nel_hist',
-                                    'nel_hist_det',
-                                    'nel_hist_impact_seg',
-                                    'nel_hist_emit_seg',
-                                    'nel_impact_hist_scrub',
-                                    'nel_impact_hist_tot',
-                                    'cos_angle_hist',
-                                    't_hist'
-                                    'lifetime_hist'
-                                    't_lifetime_hist']
-
         not_time_dependent_list = ['xg_hist',
                                    'xg_hist_det',
                                    'En_g_hist',
@@ -689,31 +918,36 @@ class pyecloud_saver:
         for var in list(dict_restored.keys()):
             setattr(self, var, dict_restored[var])
 
+    def _stepbystep_members(self):
+        list_members = [
+            't',
+            'lam_t_array',
+            'Nel_timep',
+            'Nel_imp_time',
+            'Nel_emit_time',
+            'En_imp_eV_time',
+            'En_emit_eV_time',
+            'En_kin_eV_time',
+            'cen_density'
+        ]
+        if self.flag_detailed_MP_info == 1:
+            list_members.append('N_mp_time')
+            list_members.append('nel_mp_ref_time')
+
+        if self.flag_cross_ion:
+            list_members.append('Nel_cross_ion')
+            list_members.append('N_mp_cross_ion')
+            list_members.append('DN_cross_ion')
+
+        if self.flag_electric_energy:
+            list_members.append('En_electric_eV_time')
+
+        return list_members
+
     def _stepbystep_check_for_data_resize(self):
         if self.i_last_save >= (len(self.t) - 1):
             print('Saver: resizing from %d to %d...'%(len(self.t), 2 * len(self.t)))
-            list_members = [
-                't',
-                'lam_t_array',
-                'Nel_timep',
-                'Nel_imp_time',
-                'Nel_emit_time',
-                'En_imp_eV_time',
-                'En_emit_eV_time',
-                'En_kin_eV_time',
-                'cen_density'
-            ]
-            if self.flag_detailed_MP_info == 1:
-                list_members.append('N_mp_time')
-                list_members.append('nel_mp_ref_time')
-
-            if self.flag_cross_ion:
-                list_members.append('Nel_cross_ion')
-                list_members.append('N_mp_cross_ion')
-                list_members.append('DN_cross_ion')
-
-            if self.flag_electric_energy:
-                list_members.append('En_electric_eV_time')
+            list_members = self._stepbystep_members()
 
             for kk in list(self.sbs_custom_data.keys()):
                 vv = self.sbs_custom_data[kk]
@@ -0,0 +1,115 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import threading
+
+import numpy as np
+
+# Random numbers used by the MP generation and emission routines. By default
+# they are drawn from the global numpy generator; a thread can select its own
+# generator with use_stream (used to step the clouds in parallel, each cloud
+# with its own independent stream).
+
+_local = threading.local()
+
+
+def get_stream():
+    stream = getattr(_local, 'stream', None)
+    if stream is None:
+        return np.random
+    return stream
+
+
+class use_stream(object):
+    """
+    Context manager drawing the random numbers of the current thread from
+    stream (a numpy.random.RandomState).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'stream', None)
+        _local.stream = self.stream
+        return self.stream
+
+    def __exit__(self, *args):
+        _local.stream = self.previous
+
+
+def spawn_streams(N_streams, seed=None):
+    """
+    Independent streams spawned from seed (if None, the seed is drawn from
+    the global numpy generator, so that it follows np.random.seed).
+    """
+    if seed is None:
+        seed = np.random.randint(0, 2**32, size=4, dtype=np.uint64)
+    return [np.random.RandomState(ss.generate_state(4))
+            for ss in np.random.SeedSequence(seed).spawn(N_streams)]
+
+
+def rand(*args):
+    return get_stream().rand(*args)
+
+
+def randn(*args):
+    return get_stream().randn(*args)
+
+
+def normal(loc=0.0, scale=1.0, size=None):
+    return get_stream().normal(loc, scale, size)
+
+
+def lognormal(mean=0.0, sigma=1.0, size=None):
+    return get_stream().lognormal(mean, sigma, size)
@@ -52,7 +52,7 @@
 
 import numpy as np
 from numpy import sqrt, exp
-from numpy.random import rand
+from .rng_streams import rand
 from . import electron_emission as ee
 
 
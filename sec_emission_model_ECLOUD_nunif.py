@@ -51,7 +51,7 @@
 #-End-preamble---------------------------------------------------------
 
 from numpy import sqrt, exp, take
-from numpy.random import rand
+from .rng_streams import rand
 import numpy as np
 from .sec_emission_model_ECLOUD import SEY_model_ECLOUD
 from scipy.constants import e as qe
@@ -173,14 +173,12 @@ class SEY_model_ECLOUD_non_unif_charging(SEY_model_ECLOUD_non_unif):
    
         nel_emit = nel_impact * yiel
 
-        for i_edg, flag_Q in enumerate(self.flag_charging):
-
-            if flag_Q:
-                mask_impact_here = (i_impact == i_edg)
-                n_impact_here = np.sum(nel_impact[mask_impact_here])
-                n_emit_here = np.sum(nel_emit[mask_impact_here])
-
-                self.Q_segments[i_edg] += (n_impact_here - n_emit_here)*(-qe)/self.chamb.L_edg[i_edg]
+        # Net charge deposited on each edge, in a single pass over the impacts
+        if np.any(mask_charging):
+            n_net_edg = np.bincount(i_impact, weights=nel_impact - nel_emit,
+                                    minlength=len(self.flag_charging))
+            flag_Q = self.flag_charging
+            self.Q_segments[flag_Q] += n_net_edg[flag_Q]*(-qe)/self.chamb.L_edg[flag_Q]
 
         return nel_emit, flag_elast, flag_truesec
 
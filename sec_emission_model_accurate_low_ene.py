@@ -51,7 +51,7 @@
 #-End-preamble---------------------------------------------------------
 
 from numpy import sqrt, exp
-from numpy.random import rand
+from .rng_streams import rand
 from .sec_emission_model_ECLOUD import SEY_model_ECLOUD
 
 
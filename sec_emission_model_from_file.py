@@ -56,7 +56,7 @@ import os
 
 import numpy as np
 import scipy.io as sio
-from numpy.random import rand
+from .rng_streams import rand
 from .sec_emission_model_ECLOUD import SEY_model_ECLOUD
 
 
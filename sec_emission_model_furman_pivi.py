@@ -51,7 +51,7 @@
 #-End-preamble---------------------------------------------------------
 
 import numpy as np
-import numpy.random as random
+from . import rng_streams as random
 import scipy
 from scipy.special import gamma
 from scipy.special import gammainc
@@ -126,6 +126,9 @@ class SEY_model_furman_pivi():
         self.M_cut = furman_pivi_surface['M_cut']
         self.p_n = furman_pivi_surface['p_n']
         self.eps_n = furman_pivi_surface['eps_n']
+        # Indexed by number of emitted electrons - 1
+        self._p_n_arr = np.array(self.p_n, dtype=float)
+        self._eps_n_arr = np.array(self.eps_n, dtype=float)
         self.exclude_rediffused = furman_pivi_surface['exclude_rediffused']
 
         # Parameters for backscattered (elastically scattered) electrons
@@ -304,12 +307,9 @@ class SEY_model_furman_pivi():
         Returns the value of the CDF as well as the area under the PDF before
         normalisation.
         """
-        if isinstance(nn, int) or isinstance(nn, np.float64):
-            eps_curr = self.eps_n[int(nn - 1)]
-            p_n_curr = self.p_n[int(nn - 1)]
-        else:
-            eps_curr = np.array([self.eps_n[int(ii - 1)] for ii in nn])
-            p_n_curr = np.array([self.p_n[int(ii - 1)] for ii in nn])
+        ind_n = np.asarray(nn, dtype=int) - 1
+        eps_curr = self._eps_n_arr[ind_n]
+        p_n_curr = self._p_n_arr[ind_n]
 
         cdf = gammainc(p_n_curr, energy / eps_curr)
         area = cdf
@@ -324,24 +324,81 @@ class SEY_model_furman_pivi():
         else:
             if len(E_0) == 0:
                 return np.array([])
-            p_n = self.p_n
-            eps_n = self.eps_n
 
-            eps_vec = np.array([eps_n[int(ii - 1)] for ii in nn])
-            p_n_vec = np.array([p_n[int(ii - 1)] for ii in nn])
-            _, area = self._true_sec_energy_CDF(nn, energy=E_0)  # Putting energy=E_0 gives area under the PDF
-            normalisation = 1. / area
-            uu = random.rand(len(E_0))
-            xx = uu / (normalisation)
+            ind_n = np.asarray(nn, dtype=int) - 1
+            eps_vec = self._eps_n_arr[ind_n]
+            p_n_vec = self._p_n_arr[ind_n]
+
+            # Inverse transform sampling of the PDF truncated at E_0,
+            # the area under the PDF up to E_0 is gammainc(p_n, E_0 / eps_n)
+            area = gammainc(p_n_vec, E_0 / eps_vec)
+            xx = random.rand(len(E_0))
+            xx *= area
 
             xx[xx < 1e-12] = 0.0  # gammaincinv returns nan if xx is too small but not zero
 
             return eps_vec * gammaincinv(p_n_vec, xx)
 
+    def _poisson_below_M_cut(self, lam):
+        """
+        Poisson numbers with mean lam, conditioned to be <= M_cut (same
+        distribution as redrawing the numbers above M_cut).
+        Drawn by inverse transform sampling on the truncated PMF.
+        """
+        N_draw = len(lam)
+        kk = np.arange(1, self.M_cut + 1, dtype=float)
+        # Unnormalised PMF lam**k / k! for k = 0, ..., M_cut
+        pmf = np.empty((N_draw, self.M_cut + 1))
+        pmf[:, 0] = 1.
+        np.divide(lam[:, None], kk[None, :], out=pmf[:, 1:])
+        np.cumprod(pmf, axis=1, out=pmf)
+        cdf = np.cumsum(pmf, axis=1, out=pmf)
+
+        uu = random.rand(N_draw)
+        uu *= cdf[:, -1]
+        return np.sum(cdf < uu[:, None], axis=1)
+
+    def _conserve_energy_true_sec(self, nn_events, E_impact_events, n_add_events, En_first, En_add):
+        """
+        Redraws emission energies of true secondaries until, in each event,
+        the first MP (replacing the impacting one) and each of the new MPs
+        do not exceed together the impact energy. As in the original
+        implementation, the first MP is redrawn if the check fails for the
+        last new MP of the event. En_first and En_add are modified in place.
+        Only the events still violating the condition are processed.
+        """
+        i_first_add = np.cumsum(n_add_events) - n_add_events
+        ev_active = np.flatnonzero(n_add_events > 0)
+
+        while len(ev_active) > 0:
+            n_add_active = n_add_events[ev_active]
+            ev_of_add = np.repeat(ev_active, n_add_active)
+            # Index in En_add of the new MPs of the active events
+            i_end_active = np.cumsum(n_add_active)
+            ind_add = (np.arange(i_end_active[-1])
+                       - np.repeat(i_end_active - n_add_active - i_first_add[ev_active], n_add_active))
+
+            flag_violation = (En_first[ev_of_add] + En_add[ind_add]) > E_impact_events[ev_of_add]
+            if not flag_violation.any():
+                break
+
+            # Regenerate energies of the new MPs
+            ev_viol = ev_of_add[flag_violation]
+            En_add[ind_add[flag_violation]] = self.get_energy_true_sec(
+                nn=nn_events[ev_viol], E_0=E_impact_events[ev_viol])
+
+            # Regenerate energies of the replaced MPs
+            ev_replace = ev_active[flag_violation[i_end_active - 1]]
+            En_first[ev_replace] = self.get_energy_true_sec(
+                nn=nn_events[ev_replace], E_0=E_impact_events[ev_replace])
+
+            # Events without violations are not changed anymore
+            ev_active = np.unique(ev_viol)
+
     def inverse_repeat(self, a, repeats, axis):
         """The inverse of numpy.repeat(a, repeats, axis)"""
         if isinstance(repeats, int):
-            indices = np.arange(a.shape[axis] / repeats, dtype=np.int) * repeats
+            indices = np.arange(a.shape[axis] // repeats, dtype=int) * repeats
         else:  # assume array_like of int
             indices = np.cumsum(repeats) - 1
         return a.take(indices, axis)
@@ -365,123 +422,92 @@ class SEY_model_furman_pivi():
         else:
             i_seg_replace = i_found
 
+        # Index arrays are computed once and used instead of boolean masks
+        ind_backscattered = np.flatnonzero(flag_backscattered)
+
         # Backscattered
         if self.use_ECLOUD_energy:
-            vx_replace[flag_backscattered], vy_replace[flag_backscattered] = ee.specular_velocity(
-                vx_impact[flag_backscattered], vy_impact[flag_backscattered],
-                Norm_x[flag_backscattered], Norm_y[flag_backscattered], v_impact_n[flag_backscattered])
+            vx_replace[ind_backscattered], vy_replace[ind_backscattered] = ee.specular_velocity(
+                vx_impact[ind_backscattered], vy_impact[ind_backscattered],
+                Norm_x[ind_backscattered], Norm_y[ind_backscattered], v_impact_n[ind_backscattered])
         else:
-            En_backscattered_eV = self.get_energy_backscattered(E_impact_eV[flag_backscattered])
-            N_backscattered = np.sum(flag_backscattered)
-            vx_replace[flag_backscattered], vy_replace[flag_backscattered], vz_replace[flag_backscattered] = self.angle_dist_func(
-                N_backscattered, En_backscattered_eV, Norm_x[flag_backscattered], Norm_y[flag_backscattered], mass)
+            En_backscattered_eV = self.get_energy_backscattered(E_impact_eV[ind_backscattered])
+            N_backscattered = len(ind_backscattered)
+            vx_replace[ind_backscattered], vy_replace[ind_backscattered], vz_replace[ind_backscattered] = self.angle_dist_func(
+                N_backscattered, En_backscattered_eV, Norm_x[ind_backscattered], Norm_y[ind_backscattered], mass)
 
         if not self.exclude_rediffused:
             # Rediffused
-            En_rediffused_eV = self.get_energy_rediffused(E_impact_eV[flag_rediffused])
-            N_rediffused = np.sum(flag_rediffused)
-            vx_replace[flag_rediffused], vy_replace[flag_rediffused], vz_replace[flag_rediffused] = self.angle_dist_func(
-                N_rediffused, En_rediffused_eV, Norm_x[flag_rediffused], Norm_y[flag_rediffused], mass)
+            ind_rediffused = np.flatnonzero(flag_rediffused)
+            En_rediffused_eV = self.get_energy_rediffused(E_impact_eV[ind_rediffused])
+            N_rediffused = len(ind_rediffused)
+            vx_replace[ind_rediffused], vy_replace[ind_rediffused], vz_replace[ind_rediffused] = self.angle_dist_func(
+                N_rediffused, En_rediffused_eV, Norm_x[ind_rediffused], Norm_y[ind_rediffused], mass)
 
         # True secondary
-        N_true_sec = np.sum(flag_truesec)
+        ind_truesec = np.flatnonzero(flag_truesec)
         n_add_total = 0
-        n_emit_truesec_MPs = np.zeros_like(flag_truesec, dtype=int)
-        if N_true_sec > 0:
+        n_emit_truesec_MPs = np.zeros(len(flag_truesec), dtype=int)
+        if len(ind_truesec) > 0:
+            delta_e_ts = delta_e[ind_truesec]
             if self.exclude_rediffused:
-                delta_ts_prime = delta_ts[flag_truesec] / (1 - delta_e[flag_truesec])
+                delta_ts_prime = delta_ts[ind_truesec] / (1 - delta_e_ts)
             else:
-                delta_ts_prime = delta_ts[flag_truesec] / (1 - delta_e[flag_truesec] - delta_r[flag_truesec])  # delta_ts^prime in FP paper, eq. (39)
-
-            # Decide how many MPs to be emitted
-            n_emit_truesec_MPs[flag_truesec] = random.poisson(lam=delta_ts_prime)  # Using (45)
-            n_emit_truesec_MPs_flag_true_sec = n_emit_truesec_MPs[flag_truesec]
-            # Cut above M_cut
-            flag_above_th = (n_emit_truesec_MPs_flag_true_sec > self.M_cut)
-            Nabove_th = np.sum(flag_above_th)
-            while Nabove_th > 0:
-                n_emit_truesec_MPs_flag_true_sec[flag_above_th] = random.poisson(delta_ts_prime[flag_above_th])
-                flag_above_th = (n_emit_truesec_MPs_flag_true_sec > self.M_cut)
-                Nabove_th = np.sum(flag_above_th)
-            n_emit_truesec_MPs[flag_truesec] = n_emit_truesec_MPs_flag_true_sec
-
-            # MPs to be replaced
-            flag_above_zero = (n_emit_truesec_MPs_flag_true_sec > 0)  # I exclude the absorbed
-            flag_truesec_and_above_zero = flag_truesec & (n_emit_truesec_MPs > 0)
-            En_truesec_eV = self.get_energy_true_sec(
-                nn=n_emit_truesec_MPs_flag_true_sec[flag_above_zero],
-                E_0=E_impact_eV[flag_truesec_and_above_zero])  # First generated MPs
-
-            N_true_sec = np.sum(flag_above_zero)
+                delta_ts_prime = delta_ts[ind_truesec] / (1 - delta_e_ts - delta_r[ind_truesec])  # delta_ts^prime in FP paper, eq. (39)
+
+            # Decide how many MPs to be emitted, using (45) with cut above M_cut
+            n_emit_ts = self._poisson_below_M_cut(delta_ts_prime)
+            n_emit_truesec_MPs[ind_truesec] = n_emit_ts
+
+            # Events emitting at least one MP: the first one replaces the
+            # impacting MP, the others are added (absorbed ones are excluded)
+            flag_above_zero = n_emit_ts > 0
+            ind_emit = ind_truesec[flag_above_zero]
+            nn_events = n_emit_ts[flag_above_zero]
+            E_impact_events = E_impact_eV[ind_emit]
+            En_truesec_eV = self.get_energy_true_sec(nn=nn_events, E_0=E_impact_events)
 
             # Add new MPs
-            n_add = n_emit_truesec_MPs - 1
-            n_add[n_add < 0] = 0
-            n_add_total = np.sum(n_add)
+            n_add_events = nn_events - 1
+            n_add_total = np.sum(n_add_events)
             if n_add_total != 0:
+                # Impacting MP of each new MP
+                ind_add = np.repeat(ind_emit, n_add_events)
+
                 # Clone MPs
-                x_new_MPs = np.repeat(x_impact, n_add)
-                y_new_MPs = np.repeat(y_impact, n_add)
-                z_new_MPs = np.repeat(z_impact, n_add)
-                norm_x_add = np.repeat(Norm_x, n_add)
-                norm_y_add = np.repeat(Norm_y, n_add)
-                nel_new_MPs = np.repeat(nel_replace, n_add)
-                E_impact_eV_add = np.repeat(E_impact_eV, n_add)
+                x_new_MPs = x_impact[ind_add]
+                y_new_MPs = y_impact[ind_add]
+                z_new_MPs = z_impact[ind_add]
+                norm_x_add = Norm_x[ind_add]
+                norm_y_add = Norm_y[ind_add]
+                nel_new_MPs = nel_impact[ind_add]
 
                 # Generate new MP properties, angles and energies
-                n_emit_truesec_MPs_extended = np.repeat(n_emit_truesec_MPs_flag_true_sec, n_add[flag_truesec])
-                En_truesec_eV_add = self.get_energy_true_sec(nn=n_emit_truesec_MPs_extended, E_0=E_impact_eV_add)
+                En_truesec_eV_add = self.get_energy_true_sec(
+                    nn=np.repeat(nn_events, n_add_events), E_0=E_impact_eV[ind_add])
 
                 # Ensure energy conservation in each event
                 if self.conserve_energy:
-                    En_truesec_eV_extended = np.repeat(En_truesec_eV, n_add[flag_truesec][flag_above_zero])  # Energy of replaced MPs
-                    E_impact_eV_add = np.repeat(E_impact_eV[flag_truesec][flag_above_zero], n_add[flag_truesec][flag_above_zero])  # Energy of new MPs
-                    En_emit_eV_event_add = En_truesec_eV_extended + En_truesec_eV_add  # Total energy emitted in each trusec event
+                    self._conserve_energy_true_sec(nn_events, E_impact_events, n_add_events,
+                                                   En_truesec_eV, En_truesec_eV_add)
 
-                    flag_violation = (En_emit_eV_event_add > E_impact_eV_add)  # Violation flag for the new MPs
-                    flag_violation_replace = self.inverse_repeat(flag_violation, repeats=n_add[flag_truesec][flag_above_zero], axis=None)  # Violation flag for the replaced MPs
-
-                    N_violations = np.sum(flag_violation)
-                    while N_violations > 0:
-                        # Regenerating energies for the new MPs
-                        En_truesec_eV_add[flag_violation] = self.get_energy_true_sec(
-                            nn=n_emit_truesec_MPs_extended[flag_violation],
-                            E_0=E_impact_eV_add[flag_violation])
-
-                        # Regenerating energies for the replaced MPs
-                        En_truesec_eV[flag_violation_replace] = self.get_energy_true_sec(
-                            nn=n_emit_truesec_MPs_flag_true_sec[flag_above_zero][flag_violation_replace],
-                            E_0=E_impact_eV[flag_truesec][flag_above_zero][flag_violation_replace])
-
-                        En_truesec_eV_extended = np.repeat(En_truesec_eV, n_add[flag_truesec][flag_above_zero])
-                        En_emit_eV_event_add = En_truesec_eV_extended + En_truesec_eV_add
-
-                        flag_violation = (En_emit_eV_event_add > E_impact_eV_add)
-                        flag_violation_replace = self.inverse_repeat(flag_violation, repeats=n_add[flag_truesec][flag_above_zero], axis=None)
-
-                        N_violations = np.sum(flag_violation)
-
-                # Replace velocities
-                vx_replace[flag_truesec_and_above_zero], vy_replace[flag_truesec_and_above_zero], vz_replace[flag_truesec_and_above_zero] = self.angle_dist_func(
-                    N_true_sec, En_truesec_eV, Norm_x[flag_truesec_and_above_zero], Norm_y[flag_truesec_and_above_zero], mass)
                 # New velocities
                 vx_new_MPs, vy_new_MPs, vz_new_MPs = self.angle_dist_func(
                     n_add_total, En_truesec_eV_add, norm_x_add, norm_y_add, mass)
 
                 if flag_seg:
-                    i_seg_new_MPs = np.repeat(i_found, n_add)
+                    i_seg_new_MPs = i_found[ind_add]
                 else:
                     i_seg_new_MPs = None
 
+            # Replace velocities
+            vx_replace[ind_emit], vy_replace[ind_emit], vz_replace[ind_emit] = self.angle_dist_func(
+                len(ind_emit), En_truesec_eV, Norm_x[ind_emit], Norm_y[ind_emit], mass)
+
             # Handle absorbed MPs
-            flag_truesec_and_zero = flag_truesec & (n_emit_truesec_MPs == 0)
-            nel_replace[flag_truesec_and_zero] = 0.0
-            vx_replace[flag_truesec_and_zero] = 0.0
-            vy_replace[flag_truesec_and_zero] = 0.0
-            vz_replace[flag_truesec_and_zero] = 0.0
-            x_replace[flag_truesec_and_zero] = 0.0
-            y_replace[flag_truesec_and_zero] = 0.0
-            z_replace[flag_truesec_and_zero] = 0.0
+            ind_absorbed = ind_truesec[~flag_above_zero]
+            for arr in (nel_replace, vx_replace, vy_replace, vz_replace, x_replace, y_replace, z_replace):
+                arr[ind_absorbed] = 0.0
 
         if n_add_total == 0:
             nel_new_MPs = np.array([])
@@ -495,25 +521,22 @@ class SEY_model_furman_pivi():
 
         # Elastic and rediffused events emit 1 MP
         n_emit_MPs = n_emit_truesec_MPs
-        n_emit_MPs[flag_backscattered] = 1
+        n_emit_MPs[ind_backscattered] = 1
         if not self.exclude_rediffused:
-            n_emit_MPs[flag_rediffused] = 1
+            n_emit_MPs[ind_rediffused] = 1
 
         nel_emit_tot_events = nel_impact * n_emit_MPs
         events = flag_truesec.astype(int)
         events[n_emit_MPs == 0] = 3  # Absorbed MPs
 
-        if self.exclude_rediffused:
-            pass
-        else:
-            events = events + 2 * flag_rediffused.astype(int)
+        if not self.exclude_rediffused:
+            events[ind_rediffused] = 2
         event_type = events
 
         # extended_event_type keeps track of the event type for new MPs, it is
         # needed for the extraction of emission-energy distributions.
         if n_add_total != 0:
-            events_add = np.repeat(events, n_add)
-            events = np.concatenate([events, events_add])
+            events = np.concatenate([events, events[ind_add]])
         extended_event_type = events
 
         event_info = {'extended_event_type': extended_event_type,
@@ -1,11 +1,25 @@
+import sys
 import numpy
 from distutils.core import setup
 from distutils.extension import Extension
 from Cython.Build import cythonize
 
+# OpenMP is used by the particle loops of the Boris pusher and of the impact detection
+# (the Apple compiler does not support -fopenmp, the code then runs serially)
+if sys.platform == 'darwin':
+    openmp_args = []
+else:
+    openmp_args = ['-fopenmp']
+
 setup(
  ext_modules=cythonize([Extension("boris_cython", ["boris_cython.pyx", 'boris_c_function.c'],
-                                  include_dirs=[numpy.get_include()]),
+                                  include_dirs=[numpy.get_include()],
+                                  extra_compile_args=openmp_args, extra_link_args=openmp_args),
                         Extension("geom_impact_poly_cython", ["geom_impact_poly_cython.pyx"],
-                                  include_dirs=[numpy.get_include()], annotate=True)]))
+                                  include_dirs=[numpy.get_include()], annotate=True,
+                                  extra_compile_args=openmp_args, extra_link_args=openmp_args),
+                        Extension("MP_system_cython", ["MP_system_cython.pyx"],
+                                  include_dirs=[numpy.get_include()]),
+                        Extension("sparse_lu_cython", ["sparse_lu_cython.pyx"],
+                                  include_dirs=[numpy.get_include()])]))
 
@@ -61,19 +61,23 @@ class space_charge:
     #@profile
 
     def __init__(self, chamb, Dh, Dt_sc=None, PyPICmode='FiniteDifferences_ShortleyWeller' , sparse_solver='scipy_slu',
-                 f_telescope=None, target_grid=None, N_nodes_discard=None, N_min_Dh_main=None, Dh_U_eV=None):
+                 f_telescope=None, target_grid=None, N_nodes_discard=None, N_min_Dh_main=None, Dh_U_eV=None,
+                 flag_cache_sparse_solver=False, sparse_solver_cache_dir=None):
 
         print('Start space charge init.')
 
+        self.PyPICmode = PyPICmode
+        self.sparse_solver = sparse_solver
+        self.flag_cache_sparse_solver = flag_cache_sparse_solver
+        self.sparse_solver_cache_dir = sparse_solver_cache_dir
+
         if PyPICmode == 'FiniteDifferences_ShortleyWeller':
-            import PyPIC.FiniteDifferences_ShortleyWeller_SquareGrid as PIC_FDSW
-            self.PyPICobj = PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb, Dh=Dh, sparse_solver=sparse_solver)
+            self.PyPICobj = self._ShortleyWeller_grid(chamb, Dh)
             #To be replaced by a property to make it general (from PyPIC modules not having xn, yn)
             self.xn = self.PyPICobj.xn
             self.yn = self.PyPICobj.yn
         elif PyPICmode == 'ShortleyWeller_WithTelescopicGrids':
-            import PyPIC.FiniteDifferences_ShortleyWeller_SquareGrid as PIC_FDSW
-            PyPICmain = PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb, Dh=Dh, sparse_solver=sparse_solver)
+            PyPICmain = self._ShortleyWeller_grid(chamb, Dh)
             import PyPIC.MultiGrid as PIC_MG
             self.PyPICobj = PIC_MG.AddTelescopicGrids(pic_main=PyPICmain, f_telescope=f_telescope, target_grid=target_grid,
                                                       N_nodes_discard=N_nodes_discard, N_min_Dh_main=N_min_Dh_main, sparse_solver=sparse_solver)
@@ -142,6 +146,29 @@ class space_charge:
         self.comm = None
         print('Done space charge init.')
 
+    def _ShortleyWeller_grid(self, chamb, Dh):
+        import PyPIC.FiniteDifferences_ShortleyWeller_SquareGrid as PIC_FDSW
+
+        if not self.flag_cache_sparse_solver:
+            return PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb, Dh=Dh, sparse_solver=self.sparse_solver)
+
+        # The factorization is taken from the cache when the matrix was
+        # already factorized (by another solver in this process or by an
+        # earlier run using the same cache folder)
+        from . import sparse_lu_cache as slc
+        pic = PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb, Dh=Dh, sparse_solver=self.sparse_solver,
+                                                                   include_solver=False)
+        slc.attach_sparse_solver(pic, self.sparse_solver, self.sparse_solver_cache_dir)
+        return pic
+
+    def build_sparse_solver(self):
+        # Used after reloading a pickled simulation state
+        if getattr(self, 'flag_cache_sparse_solver', False) and self.PyPICmode == 'FiniteDifferences_ShortleyWeller':
+            from . import sparse_lu_cache as slc
+            slc.attach_sparse_solver(self.PyPICobj, self.sparse_solver, self.sparse_solver_cache_dir)
+        else:
+            self.PyPICobj.build_sparse_solver()
+
     @property
     def rho(self):
         return self.PyPICobj.rho
@@ -179,22 +206,13 @@ class space_charge:
         if flag_solve:
 
             if self.comm is not None:
-                n_sims = self.comm.Get_size()
-                myid = self.comm.Get_rank()
-
-                sendbuf = self.PyPICobj.rho.flatten()
-                recvbuf = np.zeros((len(sendbuf)*n_sims))
-                self.comm.Gather(sendbuf, recvbuf) # assumes root is 0
-
-                if myid == 0:
-                    avgrho = np.mean(
-                        recvbuf.reshape(n_sims, len(sendbuf)),
-                        axis = 0)
-                else:
-                    avgrho = 0 * sendbuf # prepare buffer for receive
-                
-                self.comm.Bcast(avgrho)
-                self.PyPICobj.rho = avgrho.reshape(self.PyPICobj.rho.shape)
+                # Every rank tracks an independent sample of the cloud, the
+                # density used for the fields is the average over the ranks
+                from mpi4py import MPI
+                rho = np.ascontiguousarray(self.PyPICobj.rho, dtype=np.float64)
+                self.comm.Allreduce(MPI.IN_PLACE, rho, op=MPI.SUM)
+                rho *= 1. / self.comm.Get_size()
+                self.PyPICobj.rho = rho
 
             self.PyPICobj.solve()
 
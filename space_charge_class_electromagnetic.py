@@ -74,10 +74,12 @@ na = lambda x: np.array([x])
 class space_charge_electromagnetic(space_charge, object):
 
     def __init__(self, chamb, Dh, gamma, Dt_sc=None, PyPICmode='FiniteDifferences_ShortleyWeller' , sparse_solver='scipy_slu',
-                 f_telescope=None, target_grid=None, N_nodes_discard=None, N_min_Dh_main=None, Dh_U_eV=None):
+                 f_telescope=None, target_grid=None, N_nodes_discard=None, N_min_Dh_main=None, Dh_U_eV=None,
+                 flag_cache_sparse_solver=False, sparse_solver_cache_dir=None):
 
         super(space_charge_electromagnetic, self).__init__(chamb, Dh, Dt_sc, PyPICmode , sparse_solver,
-                     f_telescope, target_grid, N_nodes_discard, N_min_Dh_main, Dh_U_eV)
+                     f_telescope, target_grid, N_nodes_discard, N_min_Dh_main, Dh_U_eV,
+                     flag_cache_sparse_solver, sparse_solver_cache_dir)
 
         self.flag_em_tracking = True
         # Initialize additional states for vector potential
@@ -0,0 +1,192 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+
+import os
+import hashlib
+
+import numpy as np
+
+
+# Solvers already built in this process, keyed by matrix and solver type
+_solver_cache = {}
+
+
+class stored_lu_solver(object):
+    '''
+    Solver using the factors of Pr A Pc = L U computed by scipy's splu,
+    stored as plain arrays so that they can be saved to and loaded from
+    disk (SuperLU objects cannot be pickled). Provides the same solve
+    method as the SuperLU object.
+    '''
+
+    def __init__(self, L_indptr, L_indices, L_data, U_indptr, U_indices, U_data, perm_r, perm_c):
+
+        i32 = lambda arr: np.ascontiguousarray(arr, dtype=np.int32)
+        f64 = lambda arr: np.ascontiguousarray(arr, dtype=np.float64)
+
+        self.L_indptr = i32(L_indptr)
+        self.L_indices = i32(L_indices)
+        self.L_data = f64(L_data)
+        self.U_indptr = i32(U_indptr)
+        self.U_indices = i32(U_indices)
+        self.U_data = f64(U_data)
+        self.perm_r = i32(perm_r)
+        self.perm_c = i32(perm_c)
+        self.shape = (len(self.perm_r), len(self.perm_c))
+
+    @classmethod
+    def from_superlu(cls, luobj):
+        L = luobj.L.tocsr()
+        U = luobj.U.tocsr()
+        return cls(L.indptr, L.indices, L.data, U.indptr, U.indices, U.data, luobj.perm_r, luobj.perm_c)
+
+    def to_dict(self):
+        return {kk: getattr(self, kk) for kk in ['L_indptr', 'L_indices', 'L_data',
+                                                 'U_indptr', 'U_indices', 'U_data',
+                                                 'perm_r', 'perm_c']}
+
+    @classmethod
+    def from_dict(cls, dict_lu):
+        return cls(**dict_lu)
+
+    def solve(self, rhs):
+        from .sparse_lu_cython import lu_solve_csr, lu_solve_csr_2d
+
+        rhs = np.asarray(rhs, dtype=np.float64)
+        if rhs.ndim == 1:
+            return lu_solve_csr(self.L_indptr, self.L_indices, self.L_data,
+                                self.U_indptr, self.U_indices, self.U_data,
+                                self.perm_r, self.perm_c, np.ascontiguousarray(rhs))
+
+        # one column per right-hand side
+        return lu_solve_csr_2d(self.L_indptr, self.L_indices, self.L_data,
+                               self.U_indptr, self.U_indices, self.U_data,
+                               self.perm_r, self.perm_c, np.asfortranarray(rhs))
+
+
+def matrix_key(A, sparse_solver):
+    '''
+    Returns a key identifying the sparse matrix A (which encodes chamber
+    geometry and grid) and the solver type.
+    '''
+
+    A = A.tocsc()
+    hasher = hashlib.sha1()
+    hasher.update(('%s|%d|%d|' % (sparse_solver, A.shape[0], A.shape[1])).encode())
+    hasher.update(np.ascontiguousarray(A.indptr, dtype=np.int64).tobytes())
+    hasher.update(np.ascontiguousarray(A.indices, dtype=np.int64).tobytes())
+    hasher.update(np.ascontiguousarray(A.data, dtype=np.float64).tobytes())
+    return hasher.hexdigest()
+
+
+def get_sparse_solver(A, sparse_solver, build_solver, cache_dir=None):
+    '''
+    Returns a solver for the sparse matrix A, reusing one built earlier in
+    this process for the same matrix and solver type or, for 'scipy_slu',
+    the factors stored in cache_dir (if given). Otherwise the solver is
+    built by calling build_solver() and, for 'scipy_slu', its factors are
+    saved in cache_dir.
+    '''
+
+    key = matrix_key(A, sparse_solver)
+
+    if key in _solver_cache:
+        print('Sparse solver reused (key %s)' % key)
+        return _solver_cache[key]
+
+    luobj = None
+    cache_file = None
+    if cache_dir is not None and sparse_solver == 'scipy_slu':
+        cache_file = os.path.join(cache_dir, 'sparse_lu_%s.npz' % key)
+        if os.path.isfile(cache_file):
+            try:
+                with np.load(cache_file) as dict_lu:
+                    luobj = stored_lu_solver.from_dict({kk: dict_lu[kk] for kk in dict_lu.files})
+                print('Sparse LU factors loaded from %s' % cache_file)
+            except (OSError, KeyError, ValueError, TypeError) as err:
+                print('Warning: sparse LU factors could not be loaded from %s (%s)' % (cache_file, err))
+                luobj = None
+
+    if luobj is None:
+        luobj = build_solver()
+        if cache_file is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file and rename, so that concurrent runs
+            # never see partially written factors
+            temp_file = cache_file + '.%d.tmp' % os.getpid()
+            try:
+                with open(temp_file, 'wb') as fid:
+                    np.savez(fid, **stored_lu_solver.from_superlu(luobj).to_dict())
+                os.replace(temp_file, cache_file)
+            except (OSError, AttributeError) as err:
+                print('Warning: sparse LU factors could not be saved to %s (%s)' % (cache_file, err))
+                if os.path.isfile(temp_file):
+                    os.remove(temp_file)
+
+    _solver_cache[key] = luobj
+    return luobj
+
+
+def attach_sparse_solver(pic, sparse_solver, cache_dir=None):
+    '''
+    Sets the solver of a PyPIC finite-difference object (built with
+    include_solver=False) using get_sparse_solver.
+    '''
+
+    def build_solver():
+        pic.build_sparse_solver()
+        return pic.luobj
+
+    pic.luobj = get_sparse_solver(pic.Asel, sparse_solver, build_solver, cache_dir)
@@ -0,0 +1,103 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef lu_solve_csr(const int[::1] L_indptr, const int[::1] L_indices, const double[::1] L_data,
+                   const int[::1] U_indptr, const int[::1] U_indices, const double[::1] U_data,
+                   const int[::1] perm_r, const int[::1] perm_c, const double[::1] b):
+    # Solves A x = b given the factors of Pr A Pc = L U (as returned by
+    # scipy's splu), with L (unit diagonal) and U stored in CSR format.
+
+    cdef int N = b.shape[0]
+    cdef int ii, kk, jj
+    cdef double acc, diag
+
+    x_arr = np.empty(N, dtype=np.float64)
+    w_arr = np.empty(N, dtype=np.float64)
+    cdef double[::1] x = x_arr
+    cdef double[::1] w = w_arr
+
+    with nogil:
+        for ii in range(N):
+            w[perm_r[ii]] = b[ii]
+
+        # forward substitution, L has unit diagonal
+        for ii in range(N):
+            acc = w[ii]
+            for kk in range(L_indptr[ii], L_indptr[ii + 1]):
+                jj = L_indices[kk]
+                if jj < ii:
+                    acc = acc - L_data[kk] * w[jj]
+            w[ii] = acc
+
+        # backward substitution
+        for ii in range(N - 1, -1, -1):
+            acc = w[ii]
+            diag = 1.
+            for kk in range(U_indptr[ii], U_indptr[ii + 1]):
+                jj = U_indices[kk]
+                if jj > ii:
+                    acc = acc - U_data[kk] * w[jj]
+                elif jj == ii:
+                    diag = U_data[kk]
+            w[ii] = acc / diag
+
+        for ii in range(N):
+            x[ii] = w[perm_c[ii]]
+
+    return x_arr
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef lu_solve_csr_2d(const int[::1] L_indptr, const int[::1] L_indices, const double[::1] L_data,
+                      const int[::1] U_indptr, const int[::1] U_indices, const double[::1] U_data,
+                      const int[::1] perm_r, const int[::1] perm_c, const double[::1, :] b):
+    # Same as lu_solve_csr for the columns of the (Fortran-ordered) matrix
+    # b, all solved in a single nogil block.
+
+    cdef int N = b.shape[0]
+    cdef int N_rhs = b.shape[1]
+    cdef int ii, kk, jj, cc
+    cdef double acc, diag
+
+    x_arr = np.empty((N, N_rhs), dtype=np.float64, order='F')
+    w_arr = np.empty(N, dtype=np.float64)
+    cdef double[::1, :] x = x_arr
+    cdef double[::1] w = w_arr
+
+    with nogil:
+        for cc in range(N_rhs):
+            for ii in range(N):
+                w[perm_r[ii]] = b[ii, cc]
+
+            # forward substitution, L has unit diagonal
+            for ii in range(N):
+                acc = w[ii]
+                for kk in range(L_indptr[ii], L_indptr[ii + 1]):
+                    jj = L_indices[kk]
+                    if jj < ii:
+                        acc = acc - L_data[kk] * w[jj]
+                w[ii] = acc
+
+            # backward substitution
+            for ii in range(N - 1, -1, -1):
+                acc = w[ii]
+                diag = 1.
+                for kk in range(U_indptr[ii], U_indptr[ii + 1]):
+                    jj = U_indices[kk]
+                    if jj > ii:
+                        acc = acc - U_data[kk] * w[jj]
+                    elif jj == ii:
+                        diag = U_data[kk]
+                w[ii] = acc / diag
+
+            for ii in range(N):
+                x[ii, cc] = w[perm_c[ii]]
+
+    return x_arr
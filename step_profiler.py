@@ -0,0 +1,179 @@
+#-Begin-preamble-------------------------------------------------------
+#
+#                           CERN
+#
+#     European Organization for Nuclear Research
+#
+#
+#     This file is part of the code:
+#
+#                   PyECLOUD Version 8.4.2
+#
+#
+#     Main author:          Giovanni IADAROLA
+#                           BE-ABP Group
+#                           CERN
+#                           CH-1211 GENEVA 23
+#                           SWITZERLAND
+#                           giovanni.iadarola@cern.ch
+#
+#     Contributors:         Eleonora Belli
+#                           Philipp Dijkstal
+#                           Lorenzo Giacomel
+#                           Lotta Mether
+#                           Annalisa Romano
+#                           Giovanni Rumolo
+#                           Eric Wulff
+#
+#
+#     Copyright  CERN,  Geneva  2011  -  Copyright  and  any   other
+#     appropriate  legal  protection  of  this  computer program and
+#     associated documentation reserved  in  all  countries  of  the
+#     world.
+#
+#     Organizations collaborating with CERN may receive this program
+#     and documentation freely and without charge.
+#
+#     CERN undertakes no obligation  for  the  maintenance  of  this
+#     program,  nor responsibility for its correctness,  and accepts
+#     no liability whatsoever resulting from its use.
+#
+#     Program  and documentation are provided solely for the use  of
+#     the organization to which they are distributed.
+#
+#     This program  may  not  be  copied  or  otherwise  distributed
+#     without  permission. This message must be retained on this and
+#     any other authorized copies.
+#
+#     The material cannot be sold. CERN should be  given  credit  in
+#     all references.
+#
+#-End-preamble---------------------------------------------------------
+
+
+import json
+import time
+
+import numpy as np
+
+# Stages executed for each cloud
+cloud_stages = ['cloud_motion', 'impacts', 'primary_generation']
+# Stages executed once per time step for all clouds together
+global_stages = ['cross_ion', 'spacecharge', 'save_output', 'cleaning']
+stage_names = cloud_stages + global_stages
+
+
+def pass_by_pass_keys():
+    keys = []
+    for stage in stage_names:
+        keys += ['prof_t_%s_pass' % stage, 'prof_n_calls_%s_pass' % stage]
+    keys += ['prof_N_steps_pass', 'prof_N_mp_steps_pass', 'prof_N_mp_impact_pass']
+    return keys
+
+
+class step_profiler(object):
+    """
+    Wall-clock time and number of calls of the stages of
+    BuildupSimulation.sim_time_step, accumulated for each cloud over a
+    bunch passage, together with the number of MPs tracked and of MP
+    impacts. The accumulators of the global stages are shared by all clouds.
+    """
+
+    def __init__(self, cloud_names, jsonl_file=None):
+
+        self.cloud_names = list(cloud_names)
+        self.i_cloud = {nn: ii for ii, nn in enumerate(self.cloud_names)}
+        self.jsonl_file = jsonl_file
+
+        N_clouds = len(self.cloud_names)
+        # The last row holds the global stages
+        self.t_stage = np.zeros((N_clouds + 1, len(stage_names)), float)
+        self.n_calls = np.zeros((N_clouds + 1, len(stage_names)), int)
+        self.i_stage = {ss: ii for ii, ss in enumerate(stage_names)}
+
+        self.N_steps = 0
+        self.N_mp_steps = np.zeros(N_clouds, int)
+        self.N_mp_impact = np.zeros(N_clouds, int)
+
+        self.last_pass = None
+
+        print('Step profiler enabled.')
+        if jsonl_file is not None:
+            print('Step profiler streams to %s' % jsonl_file)
+
+    def tic(self):
+        return time.perf_counter()
+
+    def toc(self, stage, i_cloud, t_start):
+        """
+        Adds the time elapsed since t_start to the stage (i_cloud=-1 for
+        the global stages) and returns the current time.
+        """
+        t_now = time.perf_counter()
+        i_stage = self.i_stage[stage]
+        self.t_stage[i_cloud, i_stage] += t_now - t_start
+        self.n_calls[i_cloud, i_stage] += 1
+        return t_now
+
+    def end_step(self, cloud_list):
+        self.N_steps += 1
+        for i_cloud, cloud in enumerate(cloud_list):
+            self.N_mp_steps[i_cloud] += cloud.MP_e.N_mp
+            self.N_mp_impact[i_cloud] += cloud.impact_man.N_mp_impact_last_step
+
+    def end_pass(self, beamtim):
+        """
+        Stores the counters accumulated since the previous bunch passage
+        in last_pass, writes them to the JSON-lines file and resets them.
+        """
+        self.last_pass = {}
+        for cloud_name, i_cloud in self.i_cloud.items():
+            pass_data = {}
+            for stage, i_stage in self.i_stage.items():
+                i_row = i_cloud if stage in cloud_stages else -1
+                pass_data['prof_t_%s_pass' % stage] = self.t_stage[i_row, i_stage]
+                pass_data['prof_n_calls_%s_pass' % stage] = self.n_calls[i_row, i_stage]
+            pass_data['prof_N_steps_pass'] = self.N_steps
+            pass_data['prof_N_mp_steps_pass'] = self.N_mp_steps[i_cloud]
+            pass_data['prof_N_mp_impact_pass'] = self.N_mp_impact[i_cloud]
+            self.last_pass[cloud_name] = pass_data
+
+        if self.jsonl_file is not None:
+            self._write_jsonl(beamtim)
+
+        self.t_stage[:] = 0.
+        self.n_calls[:] = 0
+        self.N_steps = 0
+        self.N_mp_steps[:] = 0
+        self.N_mp_impact[:] = 0
+
+    def save_pass_data(self, cloud_name):
+        return self.last_pass[cloud_name]
+
+    def _write_jsonl(self, beamtim):
+        record = {
+            'pass_numb': int(beamtim.pass_numb),
+            't': float(beamtim.tt_curr),
+            'time': time.time(),
+            'N_steps': int(self.N_steps),
+            'stages': {},
+            'clouds': {},
+        }
+        for stage in global_stages:
+            i_stage = self.i_stage[stage]
+            record['stages'][stage] = {'t': float(self.t_stage[-1, i_stage]),
+                                       'n_calls': int(self.n_calls[-1, i_stage])}
+        for cloud_name, i_cloud in self.i_cloud.items():
+            cloud_record = {'N_mp_steps': int(self.N_mp_steps[i_cloud]),
+                            'N_mp_impact': int(self.N_mp_impact[i_cloud]),
+                            'stages': {}}
+            for stage in cloud_stages:
+                i_stage = self.i_stage[stage]
+                cloud_record['stages'][stage] = {'t': float(self.t_stage[i_cloud, i_stage]),
+                                                 'n_calls': int(self.n_calls[i_cloud, i_stage])}
+            record['clouds'][cloud_name] = cloud_record
+
+        # The file is reopened at each passage, so that it can be followed
+        # while the simulation runs and the profiler can be pickled
+        with open(self.jsonl_file, 'a') as fid:
+            fid.write(json.dumps(record) + '\n')
@@ -0,0 +1,63 @@
+import sys
+import os
+import time
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+
+from PyECLOUD.MP_system import MP_system
+from PyECLOUD.geom_impact_ellip import ellip_cham_geom_object
+
+# Times the full regeneration (MP_system.check_for_regeneration) for
+# increasing number of MPs and checks charge and energy conservation
+
+N_mp_list = [int(1e4), int(3e4), int(1e5), int(3e5), int(1e6)]
+
+x_aper = 2.3e-2
+y_aper = 1.8e-2
+chamb = ellip_cham_geom_object(x_aper, y_aper, flag_verbose_file=False)
+
+mass = 9.10938356e-31
+qe = 1.602176634e-19
+
+
+def kinetic_energy(MP_e):
+    N_mp = MP_e.N_mp
+    return np.sum(0.5 * MP_e.mass / qe * MP_e.nel_mp[:N_mp] * (
+        MP_e.vx_mp[:N_mp]**2 + MP_e.vy_mp[:N_mp]**2 + MP_e.vz_mp[:N_mp]**2))
+
+
+print('%10s %12s %12s %12s %12s' % ('N_mp', 'N_mp_after', 't_regen [s]', 'chrg ratio', 'ene ratio'))
+for N_mp in N_mp_list:
+    N_mp_after_regen = N_mp // 4
+    MP_e = MP_system(N_mp_max=2 * N_mp, nel_mp_ref_0=1., fact_split=1.5, fact_clean=1e-6,
+                     N_mp_regen_low=0, N_mp_regen=N_mp - 1, N_mp_after_regen=N_mp_after_regen,
+                     Dx_hist_reg=1e-3, Nx_reg=10, Ny_reg=10, Nvx_reg=10, Nvy_reg=10, Nvz_reg=10,
+                     regen_hist_cut=1e-4, chamb=chamb, mass=mass, name='bench')
+
+    # Random distribution inside the chamber
+    r = np.sqrt(np.random.rand(N_mp))
+    theta = 2 * np.pi * np.random.rand(N_mp)
+    MP_e.x_mp[:N_mp] = 0.95 * x_aper * r * np.cos(theta)
+    MP_e.y_mp[:N_mp] = 0.95 * y_aper * r * np.sin(theta)
+    MP_e.vx_mp[:N_mp] = 1e6 * np.random.randn(N_mp)
+    MP_e.vy_mp[:N_mp] = 1e6 * np.random.randn(N_mp)
+    MP_e.vz_mp[:N_mp] = 1e6 * np.random.randn(N_mp)
+    MP_e.nel_mp[:N_mp] = 10. * np.random.rand(N_mp)
+    MP_e.N_mp = N_mp
+
+    chrg_before = np.sum(MP_e.nel_mp[:MP_e.N_mp])
+    ene_before = kinetic_energy(MP_e)
+
+    t0 = time.time()
+    MP_e.check_for_regeneration()
+    t1 = time.time()
+
+    chrg_after = np.sum(MP_e.nel_mp[:MP_e.N_mp])
+    ene_after = kinetic_energy(MP_e)
+
+    print('%10d %12d %12.4f %12.5f %12.5f' % (N_mp, MP_e.N_mp, t1 - t0,
+                                               chrg_after / chrg_before, ene_after / ene_before))
@@ -0,0 +1,59 @@
+import sys
+import os
+import time
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+
+from PyECLOUD.dynamics_Boris_multipole import pusher_Boris_multipole
+
+# Strong scaling of the Boris multipole pusher with the number of threads.
+# Results are checked to be bitwise identical to the single-thread run.
+
+N_mp = int(2e6)
+N_sub_steps = 10
+N_rep = 5
+N_threads_list = [1, 2, 4, 8, 16, 32]
+N_threads_list = [nn for nn in N_threads_list if nn <= os.cpu_count()]
+
+
+class MP_bench(object):
+    def __init__(self):
+        rng = np.random.default_rng(1)
+        self.N_mp = N_mp
+        self.charge = -1.602176634e-19
+        self.mass = 9.10938356e-31
+        self.x_mp = rng.uniform(-2e-2, 2e-2, N_mp)
+        self.y_mp = rng.uniform(-2e-2, 2e-2, N_mp)
+        self.z_mp = np.zeros(N_mp)
+        self.vx_mp = rng.normal(size=N_mp) * 1e6
+        self.vy_mp = rng.normal(size=N_mp) * 1e6
+        self.vz_mp = rng.normal(size=N_mp) * 1e6
+
+
+rng = np.random.default_rng(2)
+Ex_n = rng.normal(size=N_mp) * 1e4
+Ey_n = rng.normal(size=N_mp) * 1e4
+
+MP_ref = None
+print('%10s %12s %10s %10s' % ('N_threads', 't_step [s]', 'speedup', 'identical'))
+for N_threads in N_threads_list:
+    dynamics = pusher_Boris_multipole(Dt=25e-12, N_sub_steps=N_sub_steps, B_multip=[0.5, 10.],
+                                      B0z=0.1, num_threads=N_threads)
+    MP_e = MP_bench()
+    t_list = []
+    for _ in range(N_rep):
+        t0 = time.perf_counter()
+        dynamics.step(MP_e, Ex_n, Ey_n)
+        t_list.append(time.perf_counter() - t0)
+    t_step = np.min(t_list)
+
+    if MP_ref is None:
+        MP_ref = MP_e
+        t_ref = t_step
+    identical = all([np.array_equal(getattr(MP_ref, kk), getattr(MP_e, kk))
+                     for kk in ['x_mp', 'y_mp', 'z_mp', 'vx_mp', 'vy_mp', 'vz_mp']])
+    print('%10d %12.4f %10.2f %10s' % (N_threads, t_step, t_ref / t_step, identical))
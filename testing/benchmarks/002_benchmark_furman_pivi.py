@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+
+import PyECLOUD.sec_emission_model_furman_pivi as fp
+
+# Impacts per second processed by SEY_model_furman_pivi.impacts_on_surface
+# and mean emitted charge and energy per impact (for statistical checks)
+
+furman_pivi_surface = {
+    'use_modified_sigmaE': False,
+    'use_ECLOUD_theta0_dependence': False,
+    'use_ECLOUD_energy': False,
+    'conserve_energy': True,
+    'exclude_rediffused': False,
+    'choice': 'poisson',
+    'M_cut': 10,
+    'p_n': np.array([2.5, 3.3, 2.5, 2.5, 2.8, 1.3, 1.5, 1.5, 1.5, 1.5]),
+    'eps_n': np.array([1.5, 1.75, 1., 3.75, 8.5, 11.5, 2.5, 3., 2.5, 3.]),
+    'p1EInf': 0.02,
+    'p1Ehat': 0.496,
+    'eEHat': 0.,
+    'w': 60.86,
+    'p': 1.,
+    'e1': 0.26,
+    'e2': 2.,
+    'sigmaE': 2.,
+    'p1RInf': 0.2,
+    'eR': 0.041,
+    'r': 0.104,
+    'q': 0.5,
+    'r1': 0.26,
+    'r2': 2.,
+    'deltaTSHat': 1.8848,
+    'eHat0': 332.,
+    's': 1.35,
+    't1': 0.5,
+    't2': 1.,
+    't3': 0.7,
+    't4': 1.}
+
+me = 9.10938356e-31
+qe = 1.602176634e-19
+
+N_impacts_list = [int(1e3), int(1e4), int(1e5), int(1e6)]
+N_rep = 5
+
+sey_mod = fp.SEY_model_furman_pivi(furman_pivi_surface, secondary_angle_distribution='cosine_3D')
+
+rng = np.random.default_rng(0)
+print('%10s %14s %12s %12s' % ('N_impacts', 'impacts/s', 'nel_emit', 'E_emit [eV]'))
+for N_impacts in N_impacts_list:
+    E_impact_eV = rng.uniform(1., 1000., N_impacts)
+    costheta_impact = rng.uniform(0.1, 1., N_impacts)
+    v_mod = np.sqrt(2 * E_impact_eV * qe / me)
+    vx = -v_mod * costheta_impact
+    vy = v_mod * np.sqrt(1 - costheta_impact**2)
+    nel_impact = np.ones(N_impacts)
+
+    t_list = []
+    nel_emit = 0.
+    E_emit = 0.
+    for _ in range(N_rep):
+        t0 = time.perf_counter()
+        out = sey_mod.impacts_on_surface(
+            mass=me, nel_impact=nel_impact, x_impact=0 * nel_impact, y_impact=0 * nel_impact,
+            z_impact=0 * nel_impact, vx_impact=vx, vy_impact=vy, vz_impact=0 * nel_impact,
+            Norm_x=np.ones(N_impacts), Norm_y=np.zeros(N_impacts), i_found=np.zeros(N_impacts, dtype=int),
+            v_impact_n=vx, E_impact_eV=E_impact_eV, costheta_impact=costheta_impact,
+            nel_mp_th=1, flag_seg=True)
+        t_list.append(time.perf_counter() - t0)
+
+        nel_replace, vx_r, vy_r, vz_r = out[3], out[7], out[8], out[9]
+        nel_new, vx_n, vy_n, vz_n = out[11], out[15], out[16], out[17]
+        nel_emit += np.sum(nel_replace) + np.sum(nel_new)
+        E_emit += 0.5 * me / qe * (np.sum(nel_replace * (vx_r**2 + vy_r**2 + vz_r**2))
+                                   + np.sum(nel_new * (vx_n**2 + vy_n**2 + vz_n**2)))
+
+    print('%10d %14.3e %12.4f %12.4f' % (N_impacts, N_impacts / np.min(t_list),
+                                         nel_emit / (N_rep * N_impacts), E_emit / (N_rep * N_impacts)))
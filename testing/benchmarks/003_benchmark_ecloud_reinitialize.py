@@ -0,0 +1,80 @@
+import sys
+import os
+import time
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD
+if BIN not in sys.path:
+    sys.path.append(BIN)
+sys.path.append(os.path.expanduser('../../../PyHEADTAIL/'))
+sys.path.append(os.path.expanduser('../tests_PyEC4PyHT/'))
+
+from scipy.constants import c, e
+import numpy as np
+
+import PyECLOUD.PyEC4PyHT as PyEC4PyHT
+
+# Per-turn overhead of the cloud reset in multi-turn tracking, with the full
+# re-initialization (config re-read, saver rebuilt) and with the fast path
+# (state and saver buffers reset in place, see fast_reinitialize).
+
+N_turns = 20
+n_slices = 50
+z_cut = 2.5e-9 * c
+test_folder = '../tests_PyEC4PyHT/'
+
+
+from machines_for_testing import LHC
+machine = LHC(machine_configuration='6.5_TeV_collision_tunes',
+              optics_mode='smooth', n_segments=1, p0=2000e9 * e / c)
+
+bunch = machine.generate_6D_Gaussian_bunch(
+    n_macroparticles=100000, intensity=1e11,
+    epsn_x=2.5e-6, epsn_y=2.5e-6, sigma_z=10e-2)
+
+from PyHEADTAIL.particles.slicing import UniformBinSlicer
+slicer = UniformBinSlicer(n_slices=n_slices, z_cuts=(-z_cut, z_cut))
+
+
+def make_ecloud(fast_reinitialize):
+    return PyEC4PyHT.Ecloud(
+        L_ecloud=1000., slicer=slicer,
+        Dt_ref=20e-12, pyecl_input_folder=test_folder + 'pyecloud_config_LHC',
+        chamb_type='polyg',
+        filename_chm=test_folder + 'LHC_chm_ver.mat', Dh_sc=1e-3,
+        init_unif_edens_flag=1,
+        init_unif_edens=1e7,
+        N_mp_max=300000,
+        nel_mp_ref_0=1e7 / (0.7 * 300000),
+        B_multip=[0.],
+        save_pyecl_outp_as='bench_reinit',
+        Dt=25e-12,
+        fast_reinitialize=fast_reinitialize)
+
+
+results = {}
+for fast_reinitialize in [False, True]:
+    ecloud = make_ecloud(fast_reinitialize)
+    ecloud.track(bunch)  # first turn always goes through the full initialization
+
+    t_turn = []
+    for _ in range(N_turns):
+        t0 = time.perf_counter()
+        ecloud.track(bunch)
+        t_turn.append(time.perf_counter() - t0)
+
+    # reset alone (track starts with the same call)
+    t_reinit = []
+    for _ in range(N_turns):
+        t0 = time.perf_counter()
+        ecloud._reinitialize(N_records_expected=n_slices)
+        t_reinit.append(time.perf_counter() - t0)
+
+    results[fast_reinitialize] = (np.median(t_reinit), np.median(t_turn))
+    print('fast_reinitialize=%s: reset %.2f ms/turn, track %.2f ms/turn' % (
+        fast_reinitialize, 1e3 * results[fast_reinitialize][0], 1e3 * results[fast_reinitialize][1]))
+
+print('Reset speedup: %.1fx' % (results[False][0] / results[True][0]))
+
+for ff in os.listdir('.'):
+    if ff.startswith('bench_reinit'):
+        os.remove(ff)
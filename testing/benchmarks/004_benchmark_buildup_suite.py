@@ -0,0 +1,124 @@
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD, PyPIC, PyKLU
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import benchmark_store as bst
+
+# Runs the configurations of tests_buildup for a fixed number of bunch
+# passages and records init and run time, time spent in each stage of the
+# time step (from the step profiler), steps per second and peak RSS.
+# Each configuration runs in its own process (for the peak RSS) in a
+# temporary folder. The results are stored in a JSON file keyed by commit
+# and compared with the last commit stored, flagging the regressions.
+#
+# Example:
+#   python 004_benchmark_buildup_suite.py --N-pass 5 --folders LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns
+
+tests_buildup_folder = os.path.abspath('../tests_buildup')
+
+# Excluded from the default list: restarts from its own checkpoints
+skip_by_default = ['LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns_checkpoint']
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--folders', nargs='+', help='Configurations in tests_buildup (default: all)')
+parser.add_argument('--N-pass', type=int, default=5, help='Number of bunch passages simulated')
+parser.add_argument('--results', default='benchmark_results.json', help='JSON file with the results')
+parser.add_argument('--reference', default=None, help='Commit to compare with (default: last stored)')
+parser.add_argument('--threshold', type=float, default=0.1, help='Relative slow-down flagged as regression')
+parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+parser.add_argument('--single-outfile', default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def run_single(sim_folder, N_pass, outfile):
+    from PyECLOUD.buildup_simulation import BuildupSimulation
+
+    jsonl_file = 'step_profiler.jsonl'
+
+    t0 = time.perf_counter()
+    sim = BuildupSimulation(pyecl_input_folder=sim_folder, filen_main_outp='Pyecltest.mat',
+                            extract_sey=False, flag_step_profiler=True,
+                            step_profiler_jsonl_file=jsonl_file)
+    t1 = time.perf_counter()
+
+    beamtim = sim.beamtim
+    N_steps = 0
+    while not beamtim.end_simulation() and beamtim.pass_numb < N_pass:
+        beamtim.next_time_step()
+        if sim.flag_presence_sec_beams:
+            for sec_beam in sim.sec_beams_list:
+                sec_beam.next_time_step()
+        sim.sim_time_step()
+        N_steps += 1
+    t2 = time.perf_counter()
+
+    with open(jsonl_file) as fid:
+        records = [json.loads(line) for line in fid]
+
+    results = {'t_init': t1 - t0, 't_run': t2 - t1, 'N_steps': N_steps, 'N_pass': len(records),
+               'steps_per_s': N_steps / (t2 - t1)}
+    N_mp_steps = 0
+    for rr in records:
+        for stage, vv in rr['stages'].items():
+            results['t_' + stage] = results.get('t_' + stage, 0.) + vv['t']
+        for cloud_record in rr['clouds'].values():
+            N_mp_steps += cloud_record['N_mp_steps']
+            for stage, vv in cloud_record['stages'].items():
+                results['t_' + stage] = results.get('t_' + stage, 0.) + vv['t']
+    results['MP_steps_per_s'] = N_mp_steps / (t2 - t1)
+    results['peak_rss_MB'] = bst.peak_rss_MB()
+
+    with open(outfile, 'w') as fid:
+        json.dump(results, fid)
+
+
+if args.single is not None:
+    run_single(args.single, args.N_pass, args.single_outfile)
+    sys.exit(0)
+
+if args.folders is not None:
+    sim_folders = args.folders
+else:
+    sim_folders = sorted([ff for ff in os.listdir(tests_buildup_folder)
+                          if os.path.isfile(tests_buildup_folder + '/' + ff + '/simulation_parameters.input')
+                          and ff not in skip_by_default])
+
+commit = bst.get_commit()
+results = {}
+for sim_folder in sim_folders:
+    sim_folder = sim_folder.rstrip('/')
+    print('Running %s for %d passages...' % (sim_folder, args.N_pass))
+    work_folder = tempfile.mkdtemp()
+    outfile = work_folder + '/bench_result.json'
+    cmd = [sys.executable, os.path.abspath(__file__), '--single', tests_buildup_folder + '/' + sim_folder,
+           '--single-outfile', outfile, '--N-pass', str(args.N_pass)]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(BIN) + os.pathsep + env.get('PYTHONPATH', '')
+    with open(work_folder + '/stdout.txt', 'w') as fid:
+        ret = subprocess.call(cmd, cwd=work_folder, stdout=fid, stderr=subprocess.STDOUT, env=env)
+    if ret != 0:
+        with open(work_folder + '/stdout.txt') as fid:
+            print(''.join(fid.readlines()[-20:]))
+        print('%s FAILED (exit code %d), not stored' % (sim_folder, ret))
+    else:
+        with open(outfile) as fid:
+            results[sim_folder] = json.load(fid)
+        rr = results[sim_folder]
+        print('  init %.1f s, run %.1f s, %.1f steps/s, %.3g MP-steps/s, peak RSS %.0f MB' % (
+            rr['t_init'], rr['t_run'], rr['steps_per_s'], rr['MP_steps_per_s'], rr['peak_rss_MB']))
+        print('  ' + ', '.join(['%s %.2f s' % (kk[2:], vv) for kk, vv in sorted(rr.items())
+                                if kk.startswith('t_') and kk not in ['t_init', 't_run']]))
+    shutil.rmtree(work_folder)
+
+bst.store_results(args.results, 'buildup', results, commit=commit)
+regressions = bst.compare(args.results, 'buildup', commit, reference=args.reference, threshold=args.threshold)
+sys.exit(1 if len(regressions) > 0 else 0)
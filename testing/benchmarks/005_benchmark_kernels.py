@@ -0,0 +1,211 @@
+import sys
+import os
+import time
+import argparse
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD, PyPIC, PyKLU
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+import scipy.io as sio
+from scipy.constants import m_e, e as qe
+
+import benchmark_store as bst
+
+import PyECLOUD.hist_for as histf
+import PyECLOUD.geom_impact_ellip as ellip
+import PyECLOUD.geom_impact_poly_fast_impact as gipfi
+from PyECLOUD.dynamics_Boris_multipole import pusher_Boris_multipole
+from PyECLOUD.sec_emission_model_ECLOUD import SEY_model_ECLOUD
+from PyECLOUD.sec_emission_model_accurate_low_ene import SEY_model_acc_low_ene
+from PyECLOUD.sec_emission_model_ECLOUD_nunif import SEY_model_ECLOUD_non_unif
+from PyECLOUD.sec_emission_model_ECLOUD_nunif import SEY_model_ECLOUD_non_unif_charging
+from PyECLOUD.sec_emission_model_cos_low_ener import SEY_model_cos_le
+from PyECLOUD.sec_emission_model_flat_low_ener import SEY_model_flat_le
+from PyECLOUD.sec_emission_model_from_file import SEY_model_from_file
+from PyECLOUD.sec_emission_model_furman_pivi import SEY_model_furman_pivi
+from PyECLOUD.sec_emission_model_perfect_absorber import SEY_model_perfect_absorber
+
+# Micro-benchmarks of the kernels dominating the time step, on realistic
+# chambers from tests_buildup. The best of N_rep calls is recorded. The
+# results are stored in a JSON file keyed by commit and compared with the
+# last commit stored, flagging the regressions.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--N-mp', type=int, default=int(1e6), help='Number of MPs')
+parser.add_argument('--N-impacts', type=int, default=int(1e5), help='Number of impacts')
+parser.add_argument('--N-rep', type=int, default=5, help='Repetitions of each call')
+parser.add_argument('--results', default='benchmark_results.json', help='JSON file with the results')
+parser.add_argument('--reference', default=None, help='Commit to compare with (default: last stored)')
+parser.add_argument('--threshold', type=float, default=0.1, help='Relative slow-down flagged as regression')
+args = parser.parse_args()
+
+N_mp = args.N_mp
+N_impacts = args.N_impacts
+tests_buildup_folder = '../tests_buildup/'
+
+results = {}
+
+
+def bench(name, func, N_items):
+    t_list = []
+    for _ in range(args.N_rep):
+        t0 = time.perf_counter()
+        func()
+        t_list.append(time.perf_counter() - t0)
+    t_call = min(t_list)
+    results[name] = {'t_call': t_call, 'N_items': N_items, 'items_per_s': N_items / t_call}
+    print('%-45s %10.3f ms %12.3g items/s' % (name, 1e3 * t_call, N_items / t_call))
+
+
+rng = np.random.default_rng(0)
+
+chamb_poly = gipfi.polyg_cham_geom_object(
+    tests_buildup_folder + 'LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns/LHC_chm_ver.mat', False)
+chamb_ellip = ellip.ellip_cham_geom_object(x_aper=2.3e-2, y_aper=1.8e-2)
+
+
+def points_inside(chamb, N):
+    # uniform inside the bounding box, points outside the chamber discarded
+    x = rng.uniform(-chamb.x_aper, chamb.x_aper, 2 * N)
+    y = rng.uniform(-chamb.y_aper, chamb.y_aper, 2 * N)
+    mask_in = ~chamb.is_outside(x, y)
+    return x[mask_in][:N].copy(), y[mask_in][:N].copy()
+
+
+class MP_bench(object):
+    def __init__(self, x_mp, y_mp):
+        N = len(x_mp)
+        self.N_mp = N
+        self.charge = -qe
+        self.mass = m_e
+        self.x_mp = x_mp.copy()
+        self.y_mp = y_mp.copy()
+        self.z_mp = np.zeros(N)
+        self.vx_mp = rng.normal(size=N) * 1e6
+        self.vy_mp = rng.normal(size=N) * 1e6
+        self.vz_mp = rng.normal(size=N) * 1e6
+        self.nel_mp = rng.uniform(0.5, 1.5, N) * 1e4
+
+
+print('%-45s %13s %18s' % ('Kernel', 'Time/call', 'Throughput'))
+
+# Boris pusher with multipoles
+x_mp, y_mp = points_inside(chamb_poly, N_mp)
+MP_e = MP_bench(x_mp, y_mp)
+Ex_n = rng.normal(size=len(x_mp)) * 1e4
+Ey_n = rng.normal(size=len(x_mp)) * 1e4
+dynamics = pusher_Boris_multipole(Dt=25e-12, N_sub_steps=1, B_multip=[0.5, 10.])
+bench('boris_step_multipole', lambda: dynamics.step(MP_e, Ex_n, Ey_n), len(x_mp))
+
+# Impact detection and backtracking
+for chamb_name, chamb in [('polyg', chamb_poly), ('ellip', chamb_ellip)]:
+    x_test = rng.uniform(-1.1 * chamb.x_aper, 1.1 * chamb.x_aper, N_mp)
+    y_test = rng.uniform(-1.1 * chamb.y_aper, 1.1 * chamb.y_aper, N_mp)
+    bench('is_outside_%s' % chamb_name, lambda: chamb.is_outside(x_test, y_test), N_mp)
+
+    x_in, y_in = points_inside(chamb, N_impacts)
+    theta = rng.uniform(0, 2 * np.pi, len(x_in))
+    x_out = x_in + 0.1 * np.cos(theta)
+    y_out = y_in + 0.1 * np.sin(theta)
+    z_in = np.zeros_like(x_in)
+    bench('impact_point_and_normal_%s' % chamb_name,
+          lambda: chamb.impact_point_and_normal(x_in, y_in, z_in, x_out, y_out, z_in), len(x_in))
+
+# Histograms
+x_hist = rng.uniform(-chamb_poly.x_aper, chamb_poly.x_aper, N_mp)
+w_hist = rng.uniform(0.5, 1.5, N_mp)
+Dx_hist = 1e-3
+hist_line = np.zeros(int(2 * chamb_poly.x_aper / Dx_hist) + 3)
+bench('compute_hist', lambda: histf.compute_hist(x_hist, w_hist, -chamb_poly.x_aper - Dx_hist, Dx_hist, hist_line), N_mp)
+
+# Space charge (PyPIC scatter, solve and gather)
+try:
+    import PyPIC.FiniteDifferences_ShortleyWeller_SquareGrid as PIC_FDSW
+except ImportError as err:
+    print('PyPIC not available, space charge kernels skipped (%s)' % err)
+else:
+    pic = PIC_FDSW.FiniteDifferences_ShortleyWeller_SquareGrid(chamb=chamb_poly, Dh=0.3e-3, sparse_solver='scipy_slu')
+    bench('pypic_scatter', lambda: pic.scatter(MP_e.x_mp, MP_e.y_mp, MP_e.nel_mp, charge=MP_e.charge), MP_e.N_mp)
+    bench('pypic_solve', lambda: pic.solve(), pic.Nxg * pic.Nyg)
+    bench('pypic_gather', lambda: pic.gather(MP_e.x_mp, MP_e.y_mp), MP_e.N_mp)
+
+# Secondary emission models
+dict_chm_nunif = sio.loadmat(tests_buildup_folder
+                             + 'LHC_TDIS_non_unif_sey/TDISchamber_Jsey1.00_BSsey1.60_PLsey1.60_gap80.00mm.mat')
+chamb_nunif = gipfi.polyg_cham_geom_object(dict_chm_nunif, True, flag_assume_convex=False)
+dict_chm_charging = dict(dict_chm_nunif)
+N_edg_nunif = len(np.squeeze(dict_chm_nunif['Vx']))
+dict_chm_charging['flag_charging'] = np.ones(N_edg_nunif)
+dict_chm_charging['Q_max_segments'] = 1e-6 * np.ones(N_edg_nunif)
+dict_chm_charging['EQ_segments'] = 20. * np.ones(N_edg_nunif)
+dict_chm_charging['tau_segments'] = 1e-3 * np.ones(N_edg_nunif)
+chamb_charging = gipfi.polyg_cham_geom_object(dict_chm_charging, True, flag_assume_convex=False)
+
+kwargs_ecl = dict(E_th=35., sigmafit=1.0828, mufit=1.6636, switch_no_increase_energy=0,
+                  thresh_low_energy=1., secondary_angle_distribution='cosine_3D')
+furman_pivi_surface = {
+    'use_modified_sigmaE': False, 'use_ECLOUD_theta0_dependence': False, 'use_ECLOUD_energy': False,
+    'conserve_energy': True, 'exclude_rediffused': False, 'choice': 'poisson', 'M_cut': 10,
+    'p_n': np.array([2.5, 3.3, 2.5, 2.5, 2.8, 1.3, 1.5, 1.5, 1.5, 1.5]),
+    'eps_n': np.array([1.5, 1.75, 1., 3.75, 8.5, 11.5, 2.5, 3., 2.5, 3.]),
+    'p1EInf': 0.02, 'p1Ehat': 0.496, 'eEHat': 0., 'w': 60.86, 'p': 1., 'e1': 0.26, 'e2': 2.,
+    'sigmaE': 2., 'p1RInf': 0.2, 'eR': 0.041, 'r': 0.104, 'q': 0.5, 'r1': 0.26, 'r2': 2.,
+    'deltaTSHat': 1.8848, 'eHat0': 332., 's': 1.35, 't1': 0.5, 't2': 1., 't3': 0.7, 't4': 1.}
+
+# Models are built in the loop, so that a model failing to build (e.g.
+# with an unsupported numpy version) is skipped and the others still run
+sey_models = [
+    ('ECLOUD', chamb_poly, lambda: SEY_model_ECLOUD(332., 1.7, 0.7, flag_costheta_delta_scale=True,
+                                                    flag_costheta_Emax_shift=True, **kwargs_ecl)),
+    ('ACC_LOW', chamb_poly, lambda: SEY_model_acc_low_ene(332., 1.7, 0.7, **kwargs_ecl)),
+    ('cos_low_ene', chamb_poly, lambda: SEY_model_cos_le(332., 1.7, 0.7, **kwargs_ecl)),
+    ('flat_low_ene', chamb_poly, lambda: SEY_model_flat_le(332., 1.7, 0.7, **kwargs_ecl)),
+    ('from_file', chamb_poly, lambda: SEY_model_from_file(
+        tests_buildup_folder + 'LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns_seyfromfile/sey_data_resampling_ecloud_model.mat',
+        flag_costheta_delta_scale=True, flag_costheta_Emax_shift=True, **kwargs_ecl)),
+    ('furman_pivi', chamb_poly, lambda: SEY_model_furman_pivi(furman_pivi_surface, flag_costheta_delta_scale=True,
+                                                              flag_costheta_Emax_shift=True, **kwargs_ecl)),
+    ('ECLOUD_nunif', chamb_nunif, lambda: SEY_model_ECLOUD_non_unif(chamb_nunif, 332., 1.7, 0.7, **kwargs_ecl)),
+    ('ECLOUD_nunif_charging', chamb_charging, lambda: SEY_model_ECLOUD_non_unif_charging(
+        chamb_charging, 332., 1.7, 0.7, **kwargs_ecl)),
+    ('perfect_absorber', chamb_poly, lambda: SEY_model_perfect_absorber()),
+]
+
+skipped = []
+for sey_name, chamb, make_sey_mod in sey_models:
+    try:
+        sey_mod = make_sey_mod()
+    except Exception as err:
+        print('impacts_on_surface_%s skipped: model could not be built (%s: %s)' % (
+            sey_name, type(err).__name__, err))
+        skipped.append(sey_name)
+        continue
+
+    # Impacts from straight trajectories leaving the chamber
+    x_in, y_in = points_inside(chamb, N_impacts)
+    N_imp = len(x_in)
+    theta = rng.uniform(0, 2 * np.pi, N_imp)
+    v_mod = np.sqrt(2 * qe * rng.exponential(200., N_imp) / m_e)
+    vx_impact = v_mod * np.cos(theta)
+    vy_impact = v_mod * np.sin(theta)
+    vz_impact = np.zeros(N_imp)
+    z_in = np.zeros(N_imp)
+    x_impact, y_impact, z_impact, Norm_x, Norm_y, i_found = chamb.impact_point_and_normal(
+        x_in, y_in, z_in, x_in + 0.1 * np.cos(theta), y_in + 0.1 * np.sin(theta), z_in)
+    nel_impact = rng.uniform(0.5, 1.5, N_imp) * 1e4
+    E_impact_eV = 0.5 * m_e / qe * v_mod * v_mod
+    v_impact_n = vx_impact * Norm_x + vy_impact * Norm_y
+    costheta_impact = np.abs(v_impact_n / v_mod)
+
+    bench('impacts_on_surface_%s' % sey_name, lambda: sey_mod.impacts_on_surface(
+        m_e, nel_impact, x_impact, y_impact, z_impact, vx_impact, vy_impact, vz_impact,
+        Norm_x, Norm_y, i_found, v_impact_n, E_impact_eV, costheta_impact, 1e3, True), N_imp)
+
+if len(skipped) > 0:
+    print('SEY models skipped: %s' % ', '.join(skipped))
+
+commit = bst.store_results(args.results, 'kernels', results)
+regressions = bst.compare(args.results, 'kernels', commit, reference=args.reference, threshold=args.threshold)
+sys.exit(1 if len(regressions) > 0 else 0)
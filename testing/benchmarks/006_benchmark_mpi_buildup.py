@@ -0,0 +1,120 @@
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD, PyPIC, PyKLU
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import benchmark_store as bst
+
+# Strong scaling of the particle-parallel MPI mode of BuildupSimulation:
+# the same configuration is run with mpiexec on an increasing number of
+# ranks (the MPs are split among them) and the run time, the steps per
+# second and the speed-up with respect to one rank are recorded.
+# Results are stored and compared as for the other benchmark suites.
+#
+# Example:
+#   python 006_benchmark_mpi_buildup.py --n-ranks 1 2 4 --N-pass 5
+
+tests_buildup_folder = os.path.abspath('../tests_buildup')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--folder', default='LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns',
+                    help='Configuration in tests_buildup')
+parser.add_argument('--n-ranks', type=int, nargs='+', default=[1, 2, 4], help='Numbers of MPI ranks')
+parser.add_argument('--N-pass', type=int, default=5, help='Number of bunch passages simulated')
+parser.add_argument('--mpiexec', default='mpiexec', help='MPI launcher')
+parser.add_argument('--results', default='benchmark_results.json', help='JSON file with the results')
+parser.add_argument('--reference', default=None, help='Commit to compare with (default: last stored)')
+parser.add_argument('--threshold', type=float, default=0.1, help='Relative slow-down flagged as regression')
+parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+parser.add_argument('--single-outfile', default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def run_single(sim_folder, N_pass, outfile):
+    from mpi4py import MPI
+    from PyECLOUD.buildup_simulation import BuildupSimulation
+
+    comm = MPI.COMM_WORLD
+
+    t0 = time.perf_counter()
+    sim = BuildupSimulation(pyecl_input_folder=sim_folder, filen_main_outp='Pyecltest.mat',
+                            extract_sey=False, mpi_seed=1, comm=comm)
+    comm.Barrier()
+    t1 = time.perf_counter()
+
+    beamtim = sim.beamtim
+    N_steps = 0
+    while not beamtim.end_simulation() and beamtim.pass_numb < N_pass:
+        beamtim.next_time_step()
+        if sim.flag_presence_sec_beams:
+            for sec_beam in sim.sec_beams_list:
+                sec_beam.next_time_step()
+        sim.sim_time_step()
+        N_steps += 1
+    comm.Barrier()
+    t2 = time.perf_counter()
+
+    N_mp = comm.reduce(sum([cloud.MP_e.N_mp for cloud in sim.cloud_list]), op=MPI.SUM, root=0)
+    peak_rss_MB = comm.reduce(bst.peak_rss_MB(), op=MPI.MAX, root=0)
+
+    if comm.Get_rank() == 0:
+        results = {'t_init': t1 - t0, 't_run': t2 - t1, 'N_steps': N_steps,
+                   'steps_per_s': N_steps / (t2 - t1), 'N_mp_end': N_mp,
+                   'max_peak_rss_MB': peak_rss_MB}
+        with open(outfile, 'w') as fid:
+            json.dump(results, fid)
+
+
+if args.single is not None:
+    run_single(args.single, args.N_pass, args.single_outfile)
+    sys.exit(0)
+
+commit = bst.get_commit()
+results = {}
+sim_folder = args.folder.rstrip('/')
+for n_ranks in args.n_ranks:
+    print('Running %s on %d ranks for %d passages...' % (sim_folder, n_ranks, args.N_pass))
+    work_folder = tempfile.mkdtemp()
+    outfile = work_folder + '/bench_result.json'
+    cmd = [args.mpiexec, '-n', str(n_ranks), sys.executable, os.path.abspath(__file__),
+           '--single', tests_buildup_folder + '/' + sim_folder,
+           '--single-outfile', outfile, '--N-pass', str(args.N_pass)]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(BIN) + os.pathsep + env.get('PYTHONPATH', '')
+    # One thread per rank, the ranks are the parallelism being measured
+    env['OMP_NUM_THREADS'] = '1'
+    with open(work_folder + '/stdout.txt', 'w') as fid:
+        ret = subprocess.call(cmd, cwd=work_folder, stdout=fid, stderr=subprocess.STDOUT, env=env)
+    if ret != 0:
+        with open(work_folder + '/stdout.txt') as fid:
+            print(''.join(fid.readlines()[-20:]))
+        print('%d ranks FAILED (exit code %d), not stored' % (n_ranks, ret))
+    else:
+        with open(outfile) as fid:
+            results['%s_n%02d' % (sim_folder, n_ranks)] = json.load(fid)
+    shutil.rmtree(work_folder)
+
+# Speed-up and parallel efficiency with respect to the smallest number of ranks
+n_ranks_done = [nn for nn in sorted(args.n_ranks) if '%s_n%02d' % (sim_folder, nn) in results]
+if len(n_ranks_done) > 0:
+    n_ref = n_ranks_done[0]
+    t_ref = results['%s_n%02d' % (sim_folder, n_ref)]['t_run']
+    print('\n ranks   run [s]   steps/s   speed-up   efficiency')
+    for n_ranks in n_ranks_done:
+        rr = results['%s_n%02d' % (sim_folder, n_ranks)]
+        rr['speedup'] = t_ref / rr['t_run']
+        rr['efficiency'] = rr['speedup'] * n_ref / n_ranks
+        print('%6d %9.2f %9.1f %10.2f %12.2f' % (n_ranks, rr['t_run'], rr['steps_per_s'],
+                                                rr['speedup'], rr['efficiency']))
+
+bst.store_results(args.results, 'mpi_buildup', results, commit=commit)
+regressions = bst.compare(args.results, 'mpi_buildup', commit, reference=args.reference, threshold=args.threshold)
+sys.exit(1 if len(regressions) > 0 else 0)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import subprocess
+import resource
+
+# Storage of the benchmark results in a JSON file keyed by the commit of
+# PyECLOUD, and comparison against an earlier commit to flag regressions.
+# Every benchmark is a dictionary of quantities. The ones compared are the
+# timings in seconds (key starting with 't_', lower is better), the rates
+# (key ending with '_per_s', higher is better) and the memory (key ending
+# with '_MB', lower is better). Other entries (e.g. counters) are only stored.
+
+pyecloud_folder = os.path.abspath(os.path.dirname(__file__) + '/../../')
+
+
+def get_commit():
+    git_dir = pyecloud_folder + '/.git'
+    try:
+        commit = subprocess.check_output(['git', '--git-dir', git_dir, 'rev-parse', '--short', 'HEAD']).decode().strip()
+        status = subprocess.check_output(['git', '--git-dir', git_dir, '--work-tree', pyecloud_folder,
+                                          'status', '--porcelain', '--untracked-files=no']).decode().strip()
+    except Exception as err:
+        print('Retrieving git hash failed: %s' % err)
+        return 'unknown'
+    if len(status) > 0:
+        commit += '-dirty'
+    return commit
+
+
+def peak_rss_MB():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def load_results(filename):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename, 'r') as fid:
+        return json.load(fid)
+
+
+def store_results(filename, suite, results, commit=None):
+    """
+    Adds the results of a suite to the entry of the commit (results of
+    benchmarks already stored for the same commit are overwritten).
+    """
+    if commit is None:
+        commit = get_commit()
+    all_results = load_results(filename)
+    entry = all_results.setdefault(commit, {})
+    entry['date'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    entry.setdefault(suite, {}).update(results)
+    with open(filename, 'w') as fid:
+        json.dump(all_results, fid, indent=1, sort_keys=True)
+    print('Results saved in %s for commit %s' % (filename, commit))
+    return commit
+
+
+def find_reference(all_results, suite, commit, reference=None):
+    if reference is not None:
+        if reference not in all_results or suite not in all_results[reference]:
+            raise ValueError('No %s results stored for commit %s' % (suite, reference))
+        return reference
+    # Latest other commit with results for this suite
+    candidates = [cc for cc in all_results if cc != commit and suite in all_results[cc]]
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=lambda cc: all_results[cc]['date'])
+
+
+def compare(filename, suite, commit, reference=None, threshold=0.1, t_min=1e-3):
+    """
+    Compares the results of commit with those of reference and returns the
+    list of (benchmark, quantity, reference value, value) exceeding the
+    threshold on the relative change. Timings shorter than t_min in both
+    runs are not compared (too noisy).
+    """
+    all_results = load_results(filename)
+    reference = find_reference(all_results, suite, commit, reference)
+    if reference is None:
+        print('No reference results to compare with.')
+        return []
+
+    print('Comparison of %s against %s (threshold %.0f%%):' % (commit, reference, 100 * threshold))
+    regressions = []
+    res_ref = all_results[reference][suite]
+    res_new = all_results[commit][suite]
+    for bench in sorted(res_new.keys()):
+        if bench not in res_ref:
+            continue
+        for kk in sorted(res_new[bench].keys()):
+            vv_ref = res_ref[bench].get(kk)
+            vv = res_new[bench][kk]
+            if not isinstance(vv, (int, float)) or not isinstance(vv_ref, (int, float)) or vv_ref <= 0:
+                continue
+            if kk.startswith('t_'):
+                if max(vv, vv_ref) < t_min:
+                    continue
+            elif not (kk.endswith('_per_s') or kk.endswith('_MB')):
+                continue
+            if kk.endswith('_per_s'):
+                change = vv_ref / vv - 1. if vv > 0 else float('inf')
+            else:
+                change = vv / vv_ref - 1.
+            if change > threshold:
+                regressions.append((bench, kk, vv_ref, vv))
+                print('  REGRESSION %s %s: %.4g -> %.4g (%+.0f%%)' % (bench, kk, vv_ref, vv, 100 * change))
+
+    if len(regressions) == 0:
+        print('  No regressions found.')
+    return regressions
@@ -0,0 +1,28 @@
+import sys
+import os
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD, PyPIC, PyKLU
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+
+from PyECLOUD.parameter_scan import parameter_scan, load_scan_results
+
+# SEY x intensity scan on a local process pool. If interrupted, running the
+# script again completes the missing points only.
+
+sim_input_folder = '../../testing/tests_buildup/LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns'
+
+scan = parameter_scan(sim_input_folder, scan_folder='./scan_sey_intensity',
+                      param_grid={'del_max': [1.3, 1.5, 1.7],
+                                  'fact_beam': [1.1e11, 2.5e11]},
+                      N_processes=2, t_end_sim=5 * 25e-9,
+                      extract_sey=False)
+scan.run()
+
+points, results = load_scan_results(scan.store_file)
+for i_point, point in enumerate(points):
+    if i_point in results:
+        outp = results[i_point]['cloud']
+        print('%s: Nel_imp = %.3e' % (point, np.sum(outp['Nel_imp_time'])))
@@ -0,0 +1,57 @@
+import sys
+import os
+import shutil
+import argparse
+import subprocess
+
+BIN = os.path.expanduser("../../../")  # folder containing PyECLOUD, PyPIC, PyKLU
+if BIN not in sys.path:
+    sys.path.append(BIN)
+
+import numpy as np
+
+# Two-point scan on a process pool with multi-threaded chamber and tracking
+# kernels: the workers are forked after the preparation of the shared
+# artefacts and must not hang (libgomp is not fork-safe after a parallel
+# region on more than one thread). The scan runs in a child process, which
+# is killed if it does not complete within the timeout.
+
+sim_input_folder = '../../testing/tests_buildup/LHC_ArcDipReal_450GeV_sey1.70_2.5e11ppb_bl_1.00ns'
+scan_folder = './scan_threads'
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--N-threads', type=int, default=4, help='Threads of the chamber and tracking kernels')
+parser.add_argument('--timeout', type=float, default=1800., help='Time allowed for the scan [s]')
+parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.child:
+    from PyECLOUD.parameter_scan import parameter_scan
+
+    scan = parameter_scan(sim_input_folder, scan_folder=scan_folder,
+                          param_grid={'del_max': [1.5, 1.7]},
+                          N_processes=2, t_end_sim=2 * 25e-9, extract_sey=False,
+                          N_threads_chamber=args.N_threads, N_threads_tracking=args.N_threads)
+    failed = scan.run()
+    sys.exit(1 if len(failed) > 0 else 0)
+
+if os.path.isdir(scan_folder):
+    shutil.rmtree(scan_folder)
+
+env = dict(os.environ)
+env['PYTHONPATH'] = os.path.abspath(BIN) + os.pathsep + env.get('PYTHONPATH', '')
+try:
+    ret = subprocess.call([sys.executable, os.path.abspath(__file__), '--child', '--N-threads', str(args.N_threads)],
+                          env=env, timeout=args.timeout)
+except subprocess.TimeoutExpired:
+    raise AssertionError('Scan with %d threads did not complete in %.0f s (workers hanging?)' % (
+        args.N_threads, args.timeout))
+assert ret == 0, 'Scan failed (exit code %d)' % ret
+
+from PyECLOUD.parameter_scan import load_scan_results
+points, results = load_scan_results(os.path.join(scan_folder, 'scan_results.h5'))
+assert sorted(results.keys()) == [0, 1]
+for i_point, point in enumerate(points):
+    print('%s: Nel_imp = %.3e' % (point, np.sum(results[i_point]['cloud']['Nel_imp_time'])))
+shutil.rmtree(scan_folder)
+print('Scan with %d threads per kernel completed' % args.N_threads)
@@ -19,9 +19,9 @@ sim = BuildupSimulation(pyecl_input_folder=sim_input_folder,
         extract_sey=False,
         Nbin_En_hist= 300,
         En_hist_max= 2500.,  #eoV
-        x_max_init_unif = x_max_list[myid]
+        x_max_init_unif = x_max_list[myid],
+        comm=comm
         )
-sim.spacech_ele.comm = comm
 
 sim.run(t_end_sim=5*25e-9)
 
@@ -0,0 +1,71 @@
+import sys
+if '../..' not in sys.path:
+    sys.path.append('../..')
+import os
+import numpy as np
+import scipy.io as sio
+
+import h5_outp_writer as h5ow
+import myfilemanager as mfm
+
+# Emulate the main output of a buildup simulation over a number of passages
+# and check that the incremental HDF5 output matches the full savemat dump
+N_pass = 20
+N_steps_per_pass = 37
+Nxg_hist = 101
+N_probes = 3
+
+filen_mat = 'test_outp.mat'
+filen_h5 = 'test_outp.h5'
+
+growing_keys = ['t', 'Nel_timep', 'nel_hist', 't_hist', 'el_dens_at_probes', 'En_hist']
+writer = h5ow.h5_outp_writer(filen_h5, growing_keys=growing_keys,
+                             growth_axis={'el_dens_at_probes': 1}, chunk_size_bytes=4096)
+
+t = np.zeros(N_pass * N_steps_per_pass)
+Nel_timep = 0 * t
+el_dens_at_probes = np.zeros((N_probes, len(t)))
+nel_hist = []
+t_hist = []
+En_hist = []
+i_last_save = -1
+for i_pass in range(N_pass):
+    for i_step in range(N_steps_per_pass):
+        i_last_save += 1
+        t[i_last_save] = i_last_save * 1e-10
+        Nel_timep[i_last_save] = np.random.rand()
+        el_dens_at_probes[:, i_last_save] = np.random.rand(N_probes)
+
+    nel_hist.append(np.random.rand(Nxg_hist))
+    t_hist.append(t[i_last_save])
+    if i_pass > 4:
+        En_hist.append(np.random.rand(10))
+
+    saved_dict = {
+        't': t[:i_last_save + 1],
+        'Nel_timep': Nel_timep[:i_last_save + 1],
+        'el_dens_at_probes': el_dens_at_probes[:, :i_last_save + 1],
+        'nel_hist': nel_hist,
+        't_hist': t_hist,
+        'En_hist': En_hist,
+        'xg_hist': np.linspace(-1, 1, Nxg_hist),
+        'b_spac': 25e-9,
+        'N_mp_time': -1,
+    }
+
+    writer.write(saved_dict)
+    sio.savemat(filen_mat, {kk: np.array(vv) for kk, vv in saved_dict.items()}, oned_as='row')
+
+ob_mat = mfm.myloadmat_to_obj(filen_mat)
+ob_h5 = mfm.myloadmat_to_obj(filen_h5)
+
+for kk in list(saved_dict.keys()):
+    vmat = getattr(ob_mat, kk)
+    vh5 = getattr(ob_h5, kk)
+    assert vmat.shape == vh5.shape, kk
+    assert np.allclose(vmat, vh5), kk
+    print('%s: OK %s' % (kk, repr(vh5.shape)))
+
+os.remove(filen_mat)
+os.remove(filen_h5)
+print('Test passed.')
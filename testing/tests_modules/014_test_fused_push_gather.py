@@ -0,0 +1,107 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import time
+from types import SimpleNamespace
+import numpy as np
+
+from PyECLOUD.dynamics_Boris_multipole import pusher_Boris_multipole
+import PyECLOUD.int_field_for as iff
+
+# Compare the fused gather + Boris push against the standard path
+# (int_field on space-charge and beam maps, then boris_step_multipole)
+rng = np.random.default_rng(1)
+N_mp = 200000
+N_sub_steps = 5
+Dh = 1e-3
+
+spacech_ele = SimpleNamespace(efx=rng.normal(size=(101, 81)) * 1e4,
+                              efy=rng.normal(size=(101, 81)) * 1e4,
+                              bias_x=-0.05, bias_y=-0.04, Dh=Dh)
+beamtim = SimpleNamespace(Ex_beam=rng.normal(size=(120, 90)) * 1e5,
+                          Ey_beam=rng.normal(size=(120, 90)) * 1e5,
+                          xmin_beam=-0.06, ymin_beam=-0.045, dx_beam=1.1e-3, dy_beam=1.05e-3,
+                          lam_t_curr=1e-3, lam_th_beam_field=0., beam_charge=1.)
+
+
+def make_MPs():
+    r = np.random.default_rng(2)
+    return SimpleNamespace(N_mp=N_mp, charge=-1.602176565e-19, mass=9.10938291e-31,
+                           x_mp=r.uniform(-0.06, 0.06, N_mp), y_mp=r.uniform(-0.05, 0.05, N_mp),
+                           z_mp=np.zeros(N_mp), vx_mp=r.normal(size=N_mp) * 1e6,
+                           vy_mp=r.normal(size=N_mp) * 1e6, vz_mp=r.normal(size=N_mp) * 1e5)
+
+
+for flag_reinterp in [False, True]:
+    for B0z in [None, 0.3]:
+        dynamics = pusher_Boris_multipole(Dt=25e-12, N_sub_steps=N_sub_steps, B_multip=[0.5, 2.], B0z=B0z)
+        MP_ref = make_MPs()
+        MP_fused = make_MPs()
+
+        N_ext = N_sub_steps if flag_reinterp else 1
+        t0 = time.time()
+        for _ in range(N_ext):
+            Ex_n, Ey_n = iff.int_field(MP_ref.x_mp, MP_ref.y_mp, spacech_ele.bias_x, spacech_ele.bias_y,
+                                       Dh, Dh, spacech_ele.efx, spacech_ele.efy)
+            Ex_n_beam, Ey_n_beam = iff.int_field(MP_ref.x_mp, MP_ref.y_mp, beamtim.xmin_beam, beamtim.ymin_beam,
+                                                 beamtim.dx_beam, beamtim.dy_beam, beamtim.Ex_beam, beamtim.Ey_beam)
+            Ex_n += beamtim.beam_charge * beamtim.lam_t_curr * Ex_n_beam
+            Ey_n += beamtim.beam_charge * beamtim.lam_t_curr * Ey_n_beam
+            dynamics.stepcustomDt(MP_ref, Ex_n, Ey_n, Bx_n=np.asarray([0.]), By_n=np.asarray([0.]),
+                                  Bz_n=np.asarray([0.]), Dt_substep=dynamics.Dtt, N_sub_steps=N_sub_steps // N_ext)
+        t1 = time.time()
+        dynamics.step_fused_gather(MP_fused, spacech_ele, beamtim, flag_reinterp_at_substeps=flag_reinterp)
+        t2 = time.time()
+
+        max_diff = max([np.max(np.abs(getattr(MP_ref, kk) - getattr(MP_fused, kk)))
+                        for kk in ['x_mp', 'y_mp', 'z_mp', 'vx_mp', 'vy_mp', 'vz_mp']])
+        print('reinterp=%s B0z=%s: max abs diff %.3e, t_ref=%.4f s, t_fused=%.4f s' % (
+            flag_reinterp, B0z, max_diff, t1 - t0, t2 - t1))
+        assert max_diff == 0.
+
+# Compare against the gather of the PyPIC modes accepted by
+# flag_fused_push_gather, with particles filling the chamber up to the
+# cells next to the wall
+try:
+    import PyPIC
+except ImportError:
+    PyPIC = None
+
+if PyPIC is None:
+    print('PyPIC not available: comparison with space_charge.get_sc_eletric_field skipped')
+else:
+    from PyECLOUD.geom_impact_rect_fast_impact import rect_cham_geom_object
+    from PyECLOUD.space_charge_class import space_charge
+
+    x_aper, y_aper = 2e-2, 1.5e-2
+    chamb = rect_cham_geom_object(x_aper, y_aper, False)
+
+    def make_MPs_in_chamber():
+        r = np.random.default_rng(3)
+        return SimpleNamespace(N_mp=N_mp, charge=-1.602176565e-19, mass=9.10938291e-31, nel_mp=np.ones(N_mp) * 1e5,
+                               x_mp=r.uniform(-x_aper, x_aper, N_mp) * 0.9999, y_mp=r.uniform(-y_aper, y_aper, N_mp) * 0.9999,
+                               z_mp=np.zeros(N_mp), vx_mp=r.normal(size=N_mp) * 1e5,
+                               vy_mp=r.normal(size=N_mp) * 1e5, vz_mp=r.normal(size=N_mp) * 1e4)
+
+    for PyPICmode in ['FiniteDifferences_Staircase', 'FFT_PEC_Boundary']:
+        spch = space_charge(chamb, Dh, PyPICmode=PyPICmode)
+        MP_ref = make_MPs_in_chamber()
+        spch.recompute_spchg_efield(MP_ref)
+        MP_fused = make_MPs_in_chamber()
+
+        dynamics = pusher_Boris_multipole(Dt=25e-12, N_sub_steps=1, B_multip=[0.5])
+        Ex_n, Ey_n = spch.get_sc_eletric_field(MP_ref)
+        Ex_n_beam, Ey_n_beam = iff.int_field(MP_ref.x_mp, MP_ref.y_mp, beamtim.xmin_beam, beamtim.ymin_beam,
+                                             beamtim.dx_beam, beamtim.dy_beam, beamtim.Ex_beam, beamtim.Ey_beam)
+        Ex_n = Ex_n + beamtim.beam_charge * beamtim.lam_t_curr * Ex_n_beam
+        Ey_n = Ey_n + beamtim.beam_charge * beamtim.lam_t_curr * Ey_n_beam
+        dynamics.stepcustomDt(MP_ref, Ex_n, Ey_n, Bx_n=np.asarray([0.]), By_n=np.asarray([0.]),
+                              Bz_n=np.asarray([0.]), Dt_substep=dynamics.Dtt, N_sub_steps=1)
+        dynamics.step_fused_gather(MP_fused, spch, beamtim)
+
+        max_rel_diff = max([np.max(np.abs(getattr(MP_ref, kk) - getattr(MP_fused, kk)))
+                            / np.max(np.abs(getattr(MP_ref, kk)))
+                            for kk in ['x_mp', 'y_mp', 'vx_mp', 'vy_mp', 'vz_mp']])
+        print('%s: max rel diff with get_sc_eletric_field %.3e' % (PyPICmode, max_rel_diff))
+        assert max_rel_diff < 1e-12
@@ -0,0 +1,54 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import time
+import numpy as np
+
+from PyECLOUD import geom_impact_poly_fast_impact as gipfi
+from PyECLOUD.geom_impact_rect_fast_impact import rect_cham_geom_object
+
+# Check that is_outside with the inside raster gives the same result as
+# the exact test, including points on cell edges and on the vertices
+N_mp = 1000000
+N_cells = 200
+rng = np.random.default_rng(0)
+
+theta = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+r_star = 0.02 * (1 + 0.3 * np.cos(7 * theta))
+dict_star = {'Vx': r_star * np.cos(theta), 'Vy': r_star * np.sin(theta),
+             'x_sem_ellip_insc': 0.013, 'y_sem_ellip_insc': 0.013}
+theta = np.linspace(0, 2 * np.pi, 300, endpoint=False)
+dict_convex = {'Vx': 0.02 * np.cos(theta), 'Vy': 0.015 * np.sin(theta),
+               'x_sem_ellip_insc': 0.0149, 'y_sem_ellip_insc': 0.0149}
+
+chamber_makers = {
+    'non-convex polygon': lambda **kwargs: gipfi.polyg_cham_geom_object(
+        dict_star, False, flag_assume_convex=False, **kwargs),
+    'convex polygon': lambda **kwargs: gipfi.polyg_cham_geom_object(dict_convex, False, **kwargs),
+    'rectangle': lambda **kwargs: rect_cham_geom_object(0.02, 0.01, False, **kwargs),
+}
+
+for name, make_chamber in chamber_makers.items():
+    chamb_exact = make_chamber()
+    chamb_raster = make_chamber(N_cells_inside_raster=N_cells)
+    raster = chamb_raster.inside_raster
+
+    x_mp = rng.uniform(-0.03, 0.03, N_mp)
+    y_mp = rng.uniform(-0.03, 0.03, N_mp)
+    x_mp[:1000] = rng.choice(raster.x_edges, 1000)
+    y_mp[1000:2000] = rng.choice(raster.y_edges, 1000)
+    if hasattr(chamb_exact, 'Vx'):
+        N_vert = min(len(chamb_exact.Vx), 1000)
+        x_mp[2000:2000 + N_vert] = chamb_exact.Vx[:N_vert]
+        y_mp[2000:2000 + N_vert] = chamb_exact.Vy[:N_vert]
+
+    t0 = time.time()
+    flag_exact = chamb_exact.is_outside(x_mp, y_mp)
+    t1 = time.time()
+    flag_raster = chamb_raster.is_outside(x_mp, y_mp)
+    t2 = time.time()
+
+    print('%s: identical=%s, t_exact=%.4f s, t_raster=%.4f s, boundary cells %.1f%%' % (
+        name, np.array_equal(flag_exact, flag_raster), t1 - t0, t2 - t1, 100 * raster.fraction_boundary()))
+    assert np.array_equal(flag_exact, flag_raster)
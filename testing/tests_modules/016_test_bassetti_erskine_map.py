@@ -0,0 +1,42 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import time
+import numpy as np
+
+from PyECLOUD import BassErsk as BE
+
+# Check the array version of the Bassetti-Erskine map (with image terms)
+# against the node-by-node evaluation with the scalar functions
+a = 0.022
+b = 0.018
+nimag = 20
+Nx = 61
+Ny = 47
+
+xx = np.linspace(-1.02 * a, 1.02 * a, Nx)
+yy = np.linspace(-1.02 * b, 1.02 * b, Ny)
+
+for sigmax, sigmay in [(1e-3, 0.7e-3), (0.5e-3, 1.2e-3)]:
+
+    t0 = time.time()
+    Ex_ref = np.zeros((Nx, Ny))
+    Ey_ref = np.zeros((Nx, Ny))
+    for ii in range(Nx):
+        for jj in range(Ny):
+            Ex_imag, Ey_imag = BE.ImageTerms(xx[ii], yy[jj], a, b, 0, 0, nimag)
+            Ex_BE, Ey_BE = BE.BassErsk(xx[ii], yy[jj], sigmax, sigmay)
+            Ex_ref[ii, jj] = (Ex_BE + Ex_imag).real
+            Ey_ref[ii, jj] = (Ey_BE + Ey_imag).real
+    t1 = time.time()
+    Ex, Ey = BE.field_map_BE(xx, yy, sigmax, sigmay, a, b, nimag)
+    t2 = time.time()
+    Ex_pool, Ey_pool = BE.field_map_BE(xx, yy, sigmax, sigmay, a, b, nimag, N_processes=2, N_chunks=7)
+
+    err_x = np.max(np.abs(Ex - Ex_ref)) / np.max(np.abs(Ex_ref))
+    err_y = np.max(np.abs(Ey - Ey_ref)) / np.max(np.abs(Ey_ref))
+    print('sigmax=%.1e sigmay=%.1e: rel. err. Ex=%.1e Ey=%.1e, t_scalar=%.3f s, t_vect=%.4f s' % (
+        sigmax, sigmay, err_x, err_y, t1 - t0, t2 - t1))
+    assert err_x < 1e-8 and err_y < 1e-8
+    assert np.array_equal(Ex, Ex_pool) and np.array_equal(Ey, Ey_pool)
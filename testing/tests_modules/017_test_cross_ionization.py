@@ -0,0 +1,78 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import os
+import time
+import numpy as np
+import scipy.io as sio
+from scipy.constants import m_e, m_p, e as qe
+
+from PyECLOUD.MP_system import MP_system
+import PyECLOUD.cross_ionization as cion
+
+# Check the product buffers and the batched sigma extraction of the
+# cross-ionization module, with the cross section of the multicloud test
+folder = '../tests_multicloud/LHC_ArcDriftReal_450GeV_electron_n2_sey1.75_P3.125e+06'
+cross_section_file = 'cross_section_n2_15.59_20000.00_N1000_log.mat'
+extracted_file = folder + '/' + cross_section_file.replace('.mat', '_extracted.mat')
+
+
+class chamb_for_test(object):
+    x_aper = 2e-2
+    y_aper = 2e-2
+
+
+class cloud_for_test(object):
+    def __init__(self, name, mass, nel_mp_ref):
+        self.name = name
+        self.MP_e = MP_system(N_mp_max=1000, nel_mp_ref_0=nel_mp_ref, fact_split=1.5, fact_clean=1e-6,
+                              N_mp_regen_low=0, N_mp_regen=1e7, N_mp_after_regen=1e5,
+                              Dx_hist_reg=1e-3, Nx_reg=10, Ny_reg=10, Nvx_reg=10, Nvy_reg=10, Nvz_reg=10,
+                              regen_hist_cut=1e-4, chamb=chamb_for_test(),
+                              mass=mass, charge=-qe, name=name)
+
+
+# Buffer growth
+buf = cion.New_MP_Buffer(capacity=10)
+chunks = [np.random.rand(7, nn) for nn in [3, 0, 25, 1, 100]]
+for _ in range(2):
+    buf.reset()
+    for cc in chunks:
+        buf.append(cc.shape[1], *cc)
+ref = np.concatenate(chunks, axis=1)
+for i_field, field in enumerate(cion.New_MP_Buffer.fields):
+    assert np.array_equal(buf[field], ref[i_field])
+print('Buffer: %d MPs stored, capacity %d' % (buf.N_new_MPs, buf.buffer.shape[1]))
+
+# Sigma extraction and generation
+cross_ion_definitions = {'electron': {'electron-n2': {
+    'target_density': 1e22, 'products': ['n2', 'electron'],
+    'cross_section': cross_section_file, 'E_eV_init': 0.}}}
+
+cloud_list = [cloud_for_test('electron', m_e, 1e5), cloud_for_test('n2', 28 * m_p, 3e5)]
+N_proj = 20000
+cloud_list[0].MP_e.add_new_MPs(N_proj, 1e5 * np.ones(N_proj),
+                               *np.random.uniform(-1e-2, 1e-2, (3, N_proj)),
+                               *np.random.normal(0, 5e7, (3, N_proj)), -1)
+
+t0 = time.time()
+cross_ion = cion.Cross_Ionization(folder, cross_ion_definitions, cloud_list, chamber_area=1e-3)
+t1 = time.time()
+print('Initialization (with sigma extraction) took %.3f s' % (t1 - t0))
+
+extracted = sio.loadmat(extracted_file)
+os.remove(extracted_file)
+sigma_interp = extracted['sigma_cm2_interp'].squeeze()
+for product in ['n2', 'electron']:
+    sigma_sampled = extracted['sigma_cm2_sampled_%s' % product].squeeze()
+    ratio = np.sum(sigma_sampled) / np.sum(sigma_interp)
+    print('Sampled/interpolated sigma, %s: %.4f' % (product, ratio))
+    assert abs(ratio - 1.) < 1e-2
+
+N_mp_before = [cloud.MP_e.N_mp for cloud in cloud_list]
+for _ in range(10):
+    cross_ion.generate(Dt=25e-12, cloud_list=cloud_list)
+for cloud, N_mp in zip(cloud_list, N_mp_before):
+    print('Cloud %s: %d MPs generated' % (cloud.name, cloud.MP_e.N_mp - N_mp))
+    assert cloud.MP_e.N_mp > N_mp
@@ -0,0 +1,60 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import shutil
+import tempfile
+import time
+import numpy as np
+from scipy.constants import m_e, e as qe
+
+import PyECLOUD.sec_emission_model_ECLOUD as ECL
+from PyECLOUD.impact_management_class import impact_management
+
+# Check the chunked extraction of the SEY curves and energy distributions
+# against the model curves, and the cache of the extracted quantities
+sey_mod = ECL.SEY_model_ECLOUD(Emax=332., del_max=1.8, R0=0.7, E_th=35., mufit=1.6636,
+                               secondary_angle_distribution='cosine_3D', sigmafit=1.0828,
+                               switch_no_increase_energy=0, thresh_low_energy=1.,
+                               flag_costheta_delta_scale=True, flag_costheta_Emax_shift=True)
+
+# Only the SEY model is needed for the extraction
+impact_man = impact_management.__new__(impact_management)
+impact_man.sey_mod = sey_mod
+
+n_rep = 10000
+E_impact_eV_test = np.linspace(5., 2000., 50)
+cos_theta_test = np.linspace(0.1, 1., 4)
+cache_dir = tempfile.mkdtemp()
+
+t0 = time.time()
+deltas = impact_man.extract_sey_curves(n_rep, E_impact_eV_test, cos_theta_test, -qe, m_e,
+                                       N_mp_chunk=3e4, cache_dir=cache_dir)
+t1 = time.time()
+deltas_cached = impact_man.extract_sey_curves(n_rep, E_impact_eV_test, cos_theta_test, -qe, m_e,
+                                              cache_dir=cache_dir)
+t2 = time.time()
+print('Extraction %.2f s, from cache %.4f s' % (t1 - t0, t2 - t1))
+
+for i_ct, ct in enumerate(cos_theta_test):
+    delta, _ = ECL.yield_fun2(E_impact_eV_test, ct, Emax=332., del_max=1.8, R0=0.7, E0=150., s=1.35)
+    err = np.max(np.abs(deltas['true'][i_ct] + deltas['elast'][i_ct] - delta))
+    print('cos_theta=%.2f: max. abs. error on the total SEY %.3f' % (ct, err))
+    assert err < 0.1
+
+for etype_name in deltas:
+    assert np.array_equal(deltas[etype_name], deltas_cached[etype_name])
+
+# Different model parameters do not hit the cache
+sey_mod.del_max = 1.5
+deltas_other = impact_man.extract_sey_curves(n_rep, E_impact_eV_test, cos_theta_test, -qe, m_e,
+                                             cache_dir=cache_dir)
+assert np.max(deltas_other['true']) < np.max(deltas['true'])
+
+ene_hist = impact_man.extract_energy_distributions(int(1e5), 300., cos_theta_test, m_e, 100, 1.2,
+                                                   N_mp_chunk=1.5e5, cache_dir=cache_dir)
+for etype_name in ['elast', 'true']:
+    print('%s: %s MPs emitted per angle' % (etype_name, np.sum(ene_hist[etype_name], axis=0).astype(int)))
+    assert np.all(np.sum(ene_hist[etype_name], axis=0) > 0)
+
+shutil.rmtree(cache_dir)
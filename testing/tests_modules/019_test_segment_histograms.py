@@ -0,0 +1,68 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import time
+import numpy as np
+
+from PyECLOUD import hist_for as histf
+
+# Check the per-segment energy histograms filled by compute_impact_hists
+# against a numpy implementation of the same interpolation (that of
+# compute_hist), and time the kernel against one compute_hist call per
+# segment (as done before)
+N_seg = 200
+N_impact = 200000
+Nbin_En_hist = 300
+En_hist_max = 2000.
+DEn_hist = En_hist_max / (Nbin_En_hist - 1)
+Nxg = 50
+bias_x, Dx = -2.5e-2, 1e-3
+
+rng = np.random.default_rng(1)
+i_found = rng.integers(0, N_seg, N_impact)
+E_impact_eV = rng.exponential(300., N_impact)
+nel_impact = rng.uniform(0.5, 1.5, N_impact)
+x_impact = rng.uniform(-2e-2, 2e-2, N_impact)
+costheta_impact = rng.uniform(0., 1., N_impact)
+
+
+def seg_En_hist_numpy(E, i_seg, wei):
+    # Linear interpolation on the energy grid, energies clipped at En_hist_max
+    hist = np.zeros((N_seg, Nbin_En_hist))
+    fi = 1 + np.minimum(E, En_hist_max) / DEn_hist
+    ii = fi.astype(int)
+    hx = fi - ii
+    mask_in = ii < Nbin_En_hist
+    np.add.at(hist, (i_seg[mask_in], ii[mask_in] - 1), wei[mask_in] * (1 - hx[mask_in]))
+    np.add.at(hist, (i_seg[mask_in], ii[mask_in]), wei[mask_in] * hx[mask_in])
+    np.add.at(hist, (i_seg[~mask_in], Nbin_En_hist - 1), wei[~mask_in])
+    return hist
+
+
+hist_numpy = seg_En_hist_numpy(E_impact_eV, i_found, nel_impact)
+
+t0 = time.time()
+hist_loop = np.zeros((N_seg, Nbin_En_hist))
+E_clip = np.minimum(E_impact_eV, En_hist_max)
+for iseg in range(N_seg):
+    mask_this_seg = i_found == iseg
+    if np.sum(mask_this_seg) > 0:
+        histf.compute_hist(E_clip[mask_this_seg], nel_impact[mask_this_seg], 0., DEn_hist, hist_loop[iseg])
+t1 = time.time()
+hists = [np.zeros(Nxg), np.zeros(Nxg), np.zeros(Nxg), np.zeros(Nbin_En_hist), np.zeros(1),
+         np.zeros(N_seg), np.zeros(N_seg)]
+hist_seg = np.zeros((N_seg, Nbin_En_hist))
+flags = np.array([0, 1, 1], dtype=np.int32)
+histf.compute_impact_hists(x_impact, nel_impact, E_impact_eV, costheta_impact, i_found, flags,
+                           bias_x, Dx, 20., En_hist_max, DEn_hist, 1., *hists, hist_seg.T)
+t2 = time.time()
+
+err = np.max(np.abs(hist_seg - hist_numpy)) / np.max(hist_seg)
+err_loop = np.max(np.abs(hist_seg - hist_loop)) / np.max(hist_seg)
+print('Per-segment loop %.1f ms, single pass %.1f ms, rel. err. %.1e (numpy), %.1e (loop)' % (
+    1e3 * (t1 - t0), 1e3 * (t2 - t1), err, err_loop))
+assert err < 1e-12
+assert err_loop < 1e-12
+# Out-of-range segments are ignored
+assert np.allclose(np.sum(hist_seg, axis=1), np.bincount(i_found, weights=nel_impact, minlength=N_seg))
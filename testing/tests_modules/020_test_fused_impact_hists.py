@@ -0,0 +1,89 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import time
+import numpy as np
+
+from PyECLOUD import hist_for as histf
+from PyECLOUD import seg_impact as segi
+
+# Check the single-pass impact histogram kernel against the separate
+# compute_hist / update_seg_impact calls (as done before) and, for the
+# per-segment energy histograms, against a numpy implementation of the
+# same interpolation, and time both
+N_impact = 500000
+N_seg = 100
+Nxg = 50
+bias_x, Dx = -2.5e-2, 1e-3
+scrub_en_th = 20.
+Nbin_En_hist = 300
+En_hist_max = 2000.
+DEn_hist = En_hist_max / (Nbin_En_hist - 1)
+cos_angle_width = 0.05
+Ncos = int(np.ceil(1. / cos_angle_width)) + 1
+
+rng = np.random.default_rng(2)
+x_impact = rng.uniform(-2e-2, 2e-2, N_impact)
+nel_impact = rng.uniform(0.5, 1.5, N_impact)
+E_impact_eV = rng.exponential(300., N_impact)
+costheta_impact = rng.uniform(0., 1., N_impact)
+i_found = rng.integers(0, N_seg, N_impact)
+
+
+def seg_En_hist_numpy(E, i_seg, wei):
+    hist = np.zeros((N_seg, Nbin_En_hist))
+    fi = 1 + np.minimum(E, En_hist_max) / DEn_hist
+    ii = fi.astype(int)
+    hx = fi - ii
+    mask_in = ii < Nbin_En_hist
+    np.add.at(hist, (i_seg[mask_in], ii[mask_in] - 1), wei[mask_in] * (1 - hx[mask_in]))
+    np.add.at(hist, (i_seg[mask_in], ii[mask_in]), wei[mask_in] * hx[mask_in])
+    np.add.at(hist, (i_seg[~mask_in], Nbin_En_hist - 1), wei[~mask_in])
+    return hist
+
+
+def new_hists():
+    return [np.zeros(Nxg), np.zeros(Nxg), np.zeros(Nxg), np.zeros(Nbin_En_hist), np.zeros(Ncos),
+            np.zeros(N_seg), np.zeros(N_seg), np.zeros((N_seg, Nbin_En_hist))]
+
+
+t0 = time.time()
+ref = new_hists()
+histf.compute_hist(x_impact, nel_impact, bias_x, Dx, ref[0])
+histf.compute_hist(x_impact, nel_impact * (E_impact_eV > scrub_en_th), bias_x, Dx, ref[1])
+histf.compute_hist(x_impact, nel_impact * E_impact_eV, bias_x, Dx, ref[2])
+histf.compute_hist(costheta_impact, nel_impact, 0., cos_angle_width, ref[4])
+segi.update_seg_impact(i_found, nel_impact, ref[5])
+segi.update_seg_impact(i_found, nel_impact * E_impact_eV, ref[6])
+En_imp_hist = E_impact_eV.copy()
+En_imp_hist[En_imp_hist > En_hist_max] = En_hist_max
+ref[7] = seg_En_hist_numpy(E_impact_eV, i_found, nel_impact)
+histf.compute_hist(En_imp_hist, nel_impact, 0., DEn_hist, ref[3])
+t1 = time.time()
+fused = new_hists()
+flags = np.array([1, 1, 1], dtype=np.int32)
+histf.compute_impact_hists(x_impact, nel_impact, E_impact_eV, costheta_impact, i_found, flags,
+                           bias_x, Dx, scrub_en_th, En_hist_max, DEn_hist, cos_angle_width,
+                           *fused[:7], fused[7].T)
+t2 = time.time()
+
+print('Separate calls %.1f ms, single pass %.1f ms' % (1e3 * (t1 - t0), 1e3 * (t2 - t1)))
+for hist_ref, hist_fused in zip(ref[:7], fused[:7]):
+    assert np.array_equal(hist_ref, hist_fused)
+assert np.max(np.abs(ref[7] - fused[7])) / np.max(fused[7]) < 1e-12
+
+# Emitted MPs
+t0 = time.time()
+ref_emit = [np.zeros(Nxg), np.zeros(N_seg), np.zeros(N_seg)]
+histf.compute_hist(x_impact, -nel_impact * E_impact_eV, bias_x, Dx, ref_emit[0])
+segi.update_seg_impact(i_found, -nel_impact * E_impact_eV, ref_emit[1])
+segi.update_seg_impact(i_found, nel_impact, ref_emit[2])
+t1 = time.time()
+fused_emit = [np.zeros(Nxg), np.zeros(N_seg), np.zeros(N_seg)]
+histf.compute_emit_hists(x_impact, nel_impact, E_impact_eV, i_found, 1, bias_x, Dx, *fused_emit)
+t2 = time.time()
+
+print('Emitted MPs: separate calls %.1f ms, single pass %.1f ms' % (1e3 * (t1 - t0), 1e3 * (t2 - t1)))
+for hist_ref, hist_fused in zip(ref_emit, fused_emit):
+    assert np.array_equal(hist_ref, hist_fused)
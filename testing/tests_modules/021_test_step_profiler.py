@@ -0,0 +1,77 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import os
+import json
+import time
+import numpy as np
+
+from PyECLOUD import step_profiler as stprof
+
+# Drive the profiler as sim_time_step does, on two mock clouds, and check
+# the pass-by-pass counters and the JSON-lines stream
+
+
+class mock_obj(object):
+    pass
+
+
+def mock_cloud(name, N_mp, N_mp_impact):
+    cloud = mock_obj()
+    cloud.name = name
+    cloud.MP_e = mock_obj()
+    cloud.MP_e.N_mp = N_mp
+    cloud.impact_man = mock_obj()
+    cloud.impact_man.N_mp_impact_last_step = N_mp_impact
+    return cloud
+
+
+cloud_list = [mock_cloud('electrons', 1000, 10), mock_cloud('ions', 50, 1)]
+beamtim = mock_obj()
+
+jsonl_file = 'test_step_profiler.jsonl'
+if os.path.exists(jsonl_file):
+    os.remove(jsonl_file)
+
+prof = stprof.step_profiler([cl.name for cl in cloud_list], jsonl_file=jsonl_file)
+
+N_pass = 3
+N_steps_per_pass = 20
+for i_pass in range(N_pass):
+    for i_step in range(N_steps_per_pass):
+        t0 = prof.tic()
+        for i_cloud, cloud in enumerate(cloud_list):
+            time.sleep(1e-4)
+            t0 = prof.toc('cloud_motion', i_cloud, t0)
+            t0 = prof.toc('impacts', i_cloud, t0)
+            t0 = prof.toc('primary_generation', i_cloud, t0)
+        t0 = prof.toc('spacecharge', -1, t0)
+        prof.end_step(cloud_list)
+    beamtim.pass_numb = i_pass + 1
+    beamtim.tt_curr = 25e-9 * (i_pass + 1)
+    prof.end_pass(beamtim)
+
+    for i_cloud, cloud in enumerate(cloud_list):
+        pass_data = prof.save_pass_data(cloud.name)
+        assert set(pass_data.keys()) == set(stprof.pass_by_pass_keys())
+        assert pass_data['prof_N_steps_pass'] == N_steps_per_pass
+        assert pass_data['prof_n_calls_cloud_motion_pass'] == N_steps_per_pass
+        assert pass_data['prof_n_calls_spacecharge_pass'] == N_steps_per_pass
+        assert pass_data['prof_n_calls_cross_ion_pass'] == 0
+        assert pass_data['prof_t_cloud_motion_pass'] >= N_steps_per_pass * 1e-4
+        assert pass_data['prof_N_mp_steps_pass'] == N_steps_per_pass * cloud.MP_e.N_mp
+        assert pass_data['prof_N_mp_impact_pass'] == N_steps_per_pass * cloud.impact_man.N_mp_impact_last_step
+
+with open(jsonl_file) as fid:
+    records = [json.loads(line) for line in fid]
+os.remove(jsonl_file)
+
+assert len(records) == N_pass
+assert [rr['pass_numb'] for rr in records] == list(range(1, N_pass + 1))
+assert records[-1]['clouds']['electrons']['N_mp_steps'] == N_steps_per_pass * 1000
+assert records[-1]['stages']['spacecharge']['n_calls'] == N_steps_per_pass
+
+t_motion_ms = 1e3 * records[-1]['clouds']['electrons']['stages']['cloud_motion']['t']
+print('Motion of electrons in the last passage: %.2f ms over %d steps' % (t_motion_ms, N_steps_per_pass))
+print('All checks passed')
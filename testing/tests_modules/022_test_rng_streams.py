@@ -0,0 +1,88 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import threading
+import numpy as np
+from scipy.constants import e as qe, m_e
+
+from PyECLOUD import rng_streams as rngs
+from PyECLOUD.sec_emission_model_ECLOUD import SEY_model_ECLOUD
+
+# Secondary emission drawn on per-cloud random streams: results must not
+# depend on the clouds being processed sequentially or on parallel threads,
+# and without streams the global numpy generator must still be used
+
+
+N_imp = 20000
+N_steps = 10
+
+rng = np.random.RandomState(1)
+E_impact_eV = rng.exponential(200., N_imp)
+v_mod = np.sqrt(2 * qe * E_impact_eV / m_e)
+costheta_impact = rng.uniform(0.1, 1., N_imp)
+impact_args = dict(mass=m_e, nel_impact=rng.uniform(0.5, 1.5, N_imp) * 1e4,
+                   x_impact=rng.uniform(-0.02, 0.02, N_imp), y_impact=rng.uniform(-0.02, 0.02, N_imp),
+                   z_impact=np.zeros(N_imp), vx_impact=-v_mod * costheta_impact,
+                   vy_impact=v_mod * np.sqrt(1 - costheta_impact**2), vz_impact=np.zeros(N_imp),
+                   Norm_x=np.ones(N_imp), Norm_y=np.zeros(N_imp), i_found=np.zeros(N_imp, dtype=int),
+                   v_impact_n=-v_mod * costheta_impact, E_impact_eV=E_impact_eV,
+                   costheta_impact=costheta_impact, nel_mp_th=1e3, flag_seg=False)
+
+sey_models = [SEY_model_ECLOUD(332., 1.7, 0.7, E_th=35., sigmafit=1.0828, mufit=1.6636,
+                               switch_no_increase_energy=0, thresh_low_energy=-1,
+                               secondary_angle_distribution='cosine_3D') for _ in range(2)]
+
+
+def emit(sey_mod):
+    # Energies and velocities of the emitted electrons over a few steps
+    out = []
+    for _ in range(N_steps):
+        res = sey_mod.impacts_on_surface(**impact_args)
+        out.append(np.concatenate([np.atleast_1d(rr).astype(float) for rr in res[3:]]))
+    return np.concatenate(out)
+
+
+def emit_on_stream(sey_mod, stream, results, i_cloud):
+    with rngs.use_stream(stream):
+        results[i_cloud] = emit(sey_mod)
+
+
+# Default: global generator
+np.random.seed(10)
+ref_global = emit(sey_models[0])
+np.random.seed(10)
+assert np.array_equal(emit(sey_models[0]), ref_global, equal_nan=True)
+
+# Sequential, one stream per cloud
+np.random.seed(10)
+streams = rngs.spawn_streams(2, seed=123)
+results_seq = [None, None]
+for i_cloud in range(2):
+    emit_on_stream(sey_models[i_cloud], streams[i_cloud], results_seq, i_cloud)
+# The streams do not touch the global generator
+r_after = np.random.rand()
+np.random.seed(10)
+assert r_after == np.random.rand()
+assert not np.array_equal(results_seq[0], results_seq[1], equal_nan=True)
+
+# Parallel threads, same streams
+for i_rep in range(3):
+    streams = rngs.spawn_streams(2, seed=123)
+    results_thr = [None, None]
+    threads = [threading.Thread(target=emit_on_stream, args=(sey_models[i_cloud], streams[i_cloud], results_thr, i_cloud))
+               for i_cloud in range(2)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    for i_cloud in range(2):
+        assert np.array_equal(results_thr[i_cloud], results_seq[i_cloud], equal_nan=True)
+
+# Streams seeded from the global generator follow np.random.seed
+np.random.seed(5)
+s1 = rngs.spawn_streams(2)[1].rand(3)
+np.random.seed(5)
+assert np.array_equal(rngs.spawn_streams(2)[1].rand(3), s1)
+
+print('All checks passed')
@@ -0,0 +1,92 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from PyECLOUD import geom_impact_poly_cython as gipc
+from PyECLOUD import geom_impact_poly_fast_impact as gipfi
+from PyECLOUD import polyg_edge_index as pei
+
+# Compare the impact kernels using the edge index with the full scan of the
+# edges on a non-convex polygon: inside/outside flags, impact points,
+# normals and impacted edges must be identical
+N_mp = 200000
+rng = np.random.default_rng(4)
+
+theta = np.linspace(0, 2 * np.pi, 1500, endpoint=False)
+r_star = 0.02 * (1 + 0.4 * np.cos(9 * theta))
+dict_star = {'Vx': r_star * np.cos(theta), 'Vy': r_star * np.sin(theta),
+             'x_sem_ellip_insc': 0.011, 'y_sem_ellip_insc': 0.011}
+
+chamb_scan = gipfi.polyg_cham_geom_object(dict_star, False, flag_assume_convex=False, N_bins_edge_index=0)
+chamb_ind = gipfi.polyg_cham_geom_object(dict_star, False, flag_assume_convex=False)
+assert chamb_scan.edge_index is None
+ei = chamb_ind.edge_index
+Vx, Vy, Nx, Ny, N_edg = chamb_scan.Vx, chamb_scan.Vy, chamb_scan.Nx, chamb_scan.Ny, chamb_scan.N_edg
+
+# Inside/outside, including the vertices
+x_mp = rng.uniform(-0.03, 0.03, N_mp)
+y_mp = rng.uniform(-0.03, 0.03, N_mp)
+x_mp[:len(theta)] = Vx[:-1]
+y_mp[:len(theta)] = Vy[:-1]
+t0 = time.time()
+flag_scan = gipc.is_outside_nonconvex(x_mp, y_mp, Vx, Vy, chamb_scan.cx, chamb_scan.cy, N_edg)
+t1 = time.time()
+flag_ind = gipc.is_outside_nonconvex_indexed(x_mp, y_mp, Vx, Vy, chamb_scan.cx, chamb_scan.cy, N_edg,
+                                             ei.slab_ptr, ei.slab_edges, ei.y0, ei.y1, ei.dy_bin, ei.N_bins)
+t2 = time.time()
+print('is_outside: identical=%s, t_scan=%.4f s, t_indexed=%.4f s' % (np.array_equal(flag_scan, flag_ind), t1 - t0, t2 - t1))
+assert np.array_equal(flag_scan, flag_ind)
+
+# Impacts: segments from inside points to outside points, long ones which
+# can cross several edges of the non-convex polygon and short ones as in a
+# time step
+x_in_all = x_mp[~flag_scan]
+y_in_all = y_mp[~flag_scan]
+N_imp = len(x_in_all)
+segments = {
+    'long': (rng.uniform(-0.03, 0.03, N_imp), rng.uniform(-0.03, 0.03, N_imp)),
+    'short': (x_in_all + rng.normal(size=N_imp) * 2e-3, y_in_all + rng.normal(size=N_imp) * 2e-3),
+}
+for seg_name, (x_out, y_out) in segments.items():
+    mask_out = gipc.is_outside_nonconvex(x_out, y_out, Vx, Vy, chamb_scan.cx, chamb_scan.cy, N_edg)
+    x_in, y_in, x_out, y_out = x_in_all[mask_out], y_in_all[mask_out], x_out[mask_out], y_out[mask_out]
+    z_in = np.zeros(len(x_in))
+    z_out = np.zeros(len(x_in))
+
+    t0 = time.time()
+    res_scan = gipc.impact_point_and_normal(x_in, y_in, z_in, x_out, y_out, z_out, Vx, Vy, Nx, Ny, N_edg, 0.99)
+    t1 = time.time()
+    res_ind = gipc.impact_point_and_normal_indexed(x_in, y_in, z_in, x_out, y_out, z_out, Vx, Vy, Nx, Ny, N_edg, 0.99,
+                                                   ei.cell_ptr, ei.cell_edges, ei.x0, ei.y0, ei.dx_bin, ei.dy_bin,
+                                                   ei.N_bins)
+    t2 = time.time()
+    names = ['x_int', 'y_int', 'z_int', 'Nx_int', 'Ny_int', 'i_found']
+    for name, rr_scan, rr_ind in zip(names, res_scan, res_ind):
+        assert np.array_equal(rr_scan, rr_ind), (seg_name, name)
+    print('impact_point_and_normal, %s segments: %d impacts identical, %d not found, t_scan=%.4f s, t_indexed=%.4f s' % (
+        seg_name, len(x_in), np.sum(res_scan[5] < 0), t1 - t0, t2 - t1))
+
+# On-disk cache, only in the given directory
+cache_dir = tempfile.mkdtemp()
+try:
+    pei._index_cache.clear()
+    ei_saved = pei.get_edge_index(Vx, Vy, cache_dir=os.path.join(cache_dir, 'edge_index'))
+    cache_files = os.listdir(os.path.join(cache_dir, 'edge_index'))
+    assert len(cache_files) == 1
+    pei._index_cache.clear()
+    ei_loaded = pei.get_edge_index(Vx, Vy, cache_dir=os.path.join(cache_dir, 'edge_index'))
+    for kk, vv in ei_saved.to_dict().items():
+        assert np.array_equal(vv, getattr(ei_loaded, kk)), kk
+    pei._index_cache.clear()
+    pei.get_edge_index(Vx, Vy, N_bins=ei_saved.N_bins + 1, cache_dir=os.path.join(cache_dir, 'edge_index'))
+    assert len(os.listdir(os.path.join(cache_dir, 'edge_index'))) == 2
+finally:
+    shutil.rmtree(cache_dir)
+
+print('All checks passed')
@@ -0,0 +1,101 @@
+import sys
+BIN = '../../../'
+if BIN not in sys.path:
+    sys.path.append(BIN)
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from PyECLOUD import beam_field_cache as bfc
+from PyECLOUD.beam_and_timing import beam_and_timing
+from PyECLOUD.geom_impact_ellip import ellip_cham_geom_object
+
+# Check the on-disk cache of computed beam fields: keys change with the
+# chamber and the beam and grid parameters, a hit gives the same maps as
+# the computation, invalid inputs are rejected also on a hit and the least
+# recently used entries are evicted
+
+
+def make_beam(chamb, cache_dir, **kwargs):
+    beam_kwargs = dict(b_spac=25e-9, sigmaz=0.1, t_offs=2.5e-9, filling_pattern_file=[1.1e11], Dt=2.5e-11,
+                       t_end=1e-9, chamb=chamb, sigmax=2e-3, sigmay=1.5e-3, Nx=101, Ny=81, nimag=10,
+                       beam_field_cache_dir=cache_dir)
+    beam_kwargs.update(kwargs)
+    return beam_and_timing(True, 1., 0., 1., 'computeBE', 0., **beam_kwargs)
+
+
+def n_entries(cache_dir):
+    return len([ff for ff in os.listdir(cache_dir) if ff.startswith('beam_field_')])
+
+
+chamb = ellip_cham_geom_object(0.02, 0.015)
+chamb_other = ellip_cham_geom_object(0.021, 0.015)
+
+# Key sensitivity
+params = {'Nx': 101, 'Ny': 81, 'nimag': 10, 'sigmax': 2e-3, 'sigmay': 1.5e-3, 'x_beam_pos': 0., 'y_beam_pos': 0.}
+key_ref = bfc.beam_field_key(chamb, 'computeBE', params)
+assert bfc.beam_field_key(chamb, 'computeBE', dict(params)) == key_ref
+assert bfc.beam_field_key(chamb_other, 'computeBE', params) != key_ref
+assert bfc.beam_field_key(chamb, 'computeFD', params) != key_ref
+for kk in params:
+    params_mod = dict(params)
+    params_mod[kk] = params[kk] + 1
+    assert bfc.beam_field_key(chamb, 'computeBE', params_mod) != key_ref, kk
+
+cache_dir = tempfile.mkdtemp()
+try:
+    # Miss, then hit from memory and from disk with identical maps
+    t0 = time.time()
+    beam_ref = make_beam(chamb, cache_dir)
+    t1 = time.time()
+    assert n_entries(cache_dir) == 1
+    beam_mem = make_beam(chamb, cache_dir)
+    bfc._memory_cache.clear()
+    t2 = time.time()
+    beam_disk = make_beam(chamb, cache_dir)
+    t3 = time.time()
+    for beam in [beam_mem, beam_disk]:
+        for kk in ['Ex_beam', 'Ey_beam', 'xx_beam', 'yy_beam']:
+            assert np.array_equal(getattr(beam, kk), getattr(beam_ref, kk)), kk
+    assert n_entries(cache_dir) == 1
+    print('computed in %.3f s, loaded from disk in %.3f s' % (t1 - t0, t3 - t2))
+
+    # A different grid, beam size or chamber is a miss
+    make_beam(chamb, cache_dir, Nx=103)
+    assert n_entries(cache_dir) == 2
+    make_beam(chamb, cache_dir, sigmax=2.5e-3)
+    assert n_entries(cache_dir) == 3
+    make_beam(chamb_other, cache_dir)
+    assert n_entries(cache_dir) == 4
+
+    # Invalid inputs are rejected also when the field is in the cache
+    try:
+        make_beam(chamb, cache_dir, N_processes_beam_field=0)
+    except ValueError as err:
+        print('Rejected on a cache hit: %s' % err)
+    else:
+        raise AssertionError('N_processes_beam_field=0 accepted on a cache hit')
+finally:
+    shutil.rmtree(cache_dir)
+
+# Eviction of the least recently used entries
+cache_dir = tempfile.mkdtemp()
+try:
+    field = {'Ex': np.zeros(100000)}  # about 0.8 MB per entry
+    cache = bfc.beam_field_cache(cache_dir, max_size_MB=2.)
+    for ii, key in enumerate(['k0', 'k1']):
+        cache.save(key, field)
+        os.utime(cache._entry_path(key), (ii, ii))
+    # k0 used last, k1 is the least recently used
+    bfc._memory_cache.clear()
+    assert cache.load('k0') is not None
+    cache.save('k2', field)
+    assert os.path.isfile(cache._entry_path('k0'))
+    assert not os.path.isfile(cache._entry_path('k1'))
+    assert os.path.isfile(cache._entry_path('k2'))
+finally:
+    shutil.rmtree(cache_dir)
+
+print('All checks passed')
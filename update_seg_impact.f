@@ -8,6 +8,7 @@ Cf2py intent(in)  i_seg_mp
 Cf2py intent(in)  wei_mp
 Cf2py intent(in)  N_seg
 Cf2py intent(inout) hist
+Cf2py threadsafe
         implicit none
 	integer  N_mp
 	integer  i_seg_mp(N_mp)
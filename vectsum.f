@@ -6,6 +6,7 @@
 Cf2py intent(in) N_mp
 Cf2py intent(in) x
 Cf2py intent(out) res
+Cf2py threadsafe
         implicit none
         integer N_mp
         integer p